@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+
+"""
+Benchmark suite for clattices.
+
+Times the main stages of the calculation of a combination (`findSolutions`, `findMinimumArea`, the construction
+of the supercells and `printMatrixNotation`) for representative pairs of crystals, over several values of Nmax
+and angle steps. The kernels are timed with the fast paths disabled, and the fast paths (integer forms and
+homobilayers) as a separate case "fast", for the pairs where they apply. The results are printed and saved as JSON,
+which can be compared with a previous run.
+
+Usage (from the root of the repository, after building `clattices_loop`):
+	
+	python benchmarks/benchmark.py -o results.json
+	python benchmarks/benchmark.py -o new.json --compare results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert (0, os.path.join (os.path.dirname (os.path.abspath (__file__)), os.pardir))
+
+from clattices import Crystal, Combination, Printer
+
+examples = os.path.join (os.path.dirname (os.path.abspath (__file__)), os.pardir, "examples")
+
+pairs = {
+	"hexagonal/hexagonal": ("crystals/Graphene", "crystals/hBN"),
+	"hexagonal/rectangular": ("crystals/HfSe2", "ex3/Phosphorene"),
+	"oblique/hexagonal": ("ex5/GrapheneOblique", "crystals/MoS2"),
+}
+"""
+Pairs of crystals benchmarked, relative to the examples directory.
+"""
+
+def parseArgs():
+	"""
+	Parse arguments from the command line.
+	"""
+	parser = argparse.ArgumentParser(description='Benchmark the stages of the calculation of coincidence lattices.')
+	
+	parser.add_argument('-o', '--output_file', default='benchmark.json', help="JSON file where the results are saved (default: benchmark.json)")
+	parser.add_argument('--compare', metavar="JSON", help="previous results to compare with, printing the ratio of the times (default: none)")
+	
+	parser.add_argument('-N', type=int, nargs='+', default=[5, 7, 10], metavar="Nmax", help="values of Nmax benchmarked (default: 5 7 10)")
+	parser.add_argument('-s', '--angles_step', type=float, nargs='+', default=[0.1, 0.05], help="angle steps benchmarked (default: 0.1 0.05)")
+	parser.add_argument('-a', '--angles', type=float, nargs=2, default=[0.0, 30.0], metavar=('ANGLE_MIN', 'ANGLE_MAX'), help="interval of angles (default: 0 to 30 deg)")
+	parser.add_argument('-t', '--tolerance', type=float, default=0.02, help="tolerance of the strain (default: 0.02)")
+	parser.add_argument('--angle_tolerance', type=float, default=0.05, help="tolerance of the angles (default: 0.05)")
+	parser.add_argument('-n', '--n_atoms', type=int, default=100, help="maximum number of atoms printed (default: 100)")
+	
+	parser.add_argument('-k', '--kernel', nargs='+', default=['brute', 'solve', 'fast'], choices=['brute', 'solve', 'vector', 'analytic', 'fast'], help="kernels benchmarked, 'fast' being the fast paths of the pairs where they apply (default: brute solve fast)")
+	parser.add_argument('--supercell', choices=['pairwise', 'reduction'], default='pairwise', help="method to choose the supercells (default: pairwise)")
+	parser.add_argument('-T', '--threads', type=int, default=1, help="number of threads of clattices_loop (default: 1)")
+	parser.add_argument('-p', '--pairs', nargs='+', default=sorted (pairs), choices=sorted (pairs), help="pairs of crystals benchmarked (default: all)")
+	parser.add_argument('-r', '--repeat', type=int, default=3, help="number of repetitions, the fastest one is reported (default: 3)")
+	
+	return parser.parse_args()
+
+def measure (function, repeat):
+	"""
+	Calls `function` `repeat` times and returns its last result, the minimum time in seconds and
+	the peak of memory allocated by Python and NumPy during a call, in bytes.
+	The times are measured without tracing the allocations, which slows down the calls considerably,
+	and the peak of memory by a separate call.
+	"""
+	
+	best = float ('inf')
+	for _ in range (max (repeat, 1)):
+		start = time.perf_counter ()
+		result = function ()
+		best = min (best, time.perf_counter () - start)
+	
+	tracemalloc.start ()
+	function ()
+	_, peak = tracemalloc.get_traced_memory ()
+	tracemalloc.stop ()
+	
+	return result, best, peak
+
+def peakResidentMemory ():
+	"""
+	Returns the peak resident memory of the process in bytes, or `None` if it is not available.
+	"""
+	
+	try:
+		import resource
+	except ImportError:
+		return None
+	
+	peak = resource.getrusage (resource.RUSAGE_SELF).ru_maxrss
+	
+	# ru_maxrss is given in bytes on macOS and in kilobytes elsewhere
+	return peak if sys.platform == 'darwin' else peak*1024
+
+def hasFastPath (crystals, args):
+	"""
+	Returns True if a fast path (integer forms or homobilayer) applies to the pair of crystals.
+	"""
+	
+	c = Combination.Combination (crystals, [args.angles[0], args.angles[1], args.angles_step[0]], [args.N[0], args.tolerance, args.angle_tolerance])
+	
+	return c.hasIntegerForms () or c.isHomobilayer ()
+
+def benchmarkCase (crystals, kernel, Nmax, step, args):
+	"""
+	Benchmarks a single combination and returns a dictionary with the time, throughput and
+	memory of each stage. The kernel "fast" is the fast path of the combination, the other kernels
+	are benchmarked without it.
+	"""
+	
+	angles = [args.angles[0], args.angles[1], step]
+	limits = [Nmax, args.tolerance, args.angle_tolerance]
+	
+	if kernel == "fast":
+		c = Combination.Combination (crystals, angles, limits, kernel="solve", threads=args.threads, supercellSearch=args.supercell, fastPath=True)
+	else:
+		c = Combination.Combination (crystals, angles, limits, kernel=kernel, threads=args.threads, supercellSearch=args.supercell, fastPath=False)
+	nAngles = len (c.angleGrid ()) if kernel != "analytic" else 0
+	
+	stages = {}
+	
+	allSolutions, t, peak = measure (c.findSolutions, args.repeat)
+	nSolutions = sum (len (s.solutions) for s in allSolutions)
+	
+	# Vectors (m, n) actually tested by the kernel or fast path in the last call
+	nCandidates = c.candidates
+	stages['findSolutions'] = {
+		'time': t,
+		'peak_memory': peak,
+		'angles_per_second': nAngles/t if t > 0 else None,
+		'candidates_per_second': nCandidates/t if t > 0 else None,
+	}
+	
+	table, t, peak = measure (c.findMinimumArea, args.repeat)
+	stages['findMinimumArea'] = {
+		'time': t,
+		'peak_memory': peak,
+		'solutions_per_second': nSolutions/t if t > 0 else None,
+	}
+	
+	_, t, peak = measure (lambda: Combination.SupercellTable (table.angle, table.solutions, c), args.repeat)
+	stages['SupercellTable'] = {
+		'time': t,
+		'peak_memory': peak,
+		'supercells_per_second': len (table)/t if t > 0 else None,
+	}
+	
+	def buildSupercells ():
+		supercells = []
+		for s in table:
+			solution = Combination.Solution (s.angle)
+			solution.solutions = s.solutions
+			supercells.append (Combination.Supercell (solution, c))
+		return supercells
+	
+	_, t, peak = measure (buildSupercells, args.repeat)
+	stages['Supercell'] = {
+		'time': t,
+		'peak_memory': peak,
+		'supercells_per_second': len (table)/t if t > 0 else None,
+	}
+	
+	descriptor, outputFile = tempfile.mkstemp (suffix=".dat")
+	os.close (descriptor)
+	try:
+		p = Printer.Printer (outputFile)
+		p.printMatrixNotationHeader ()
+		_, t, peak = measure (lambda: p.printMatrixNotation (table, args.n_atoms), args.repeat)
+	finally:
+		os.remove (outputFile)
+	stages['printMatrixNotation'] = {
+		'time': t,
+		'peak_memory': peak,
+		'supercells_per_second': len (table)/t if t > 0 else None,
+	}
+	
+	return {
+		'kernel': kernel,
+		'Nmax': Nmax,
+		'angles_step': step,
+		'angles': nAngles,
+		'candidates': nCandidates,
+		'solutions': nSolutions,
+		'supercells': len (table),
+		'stages': stages,
+	}
+
+def caseKey (pair, case):
+	"""
+	Returns a string which identifies a case, used to match the cases of two runs.
+	"""
+	
+	return "%s %s N=%d step=%g" % (pair, case['kernel'], case['Nmax'], case['angles_step'])
+
+def printCase (key, case, previous=None):
+	"""
+	Prints the times of a case, and their ratio to the times of the previous run if given.
+	"""
+	
+	print (key)
+	for name, stage in case['stages'].items ():
+		line = "    " + name.ljust (22) + ("%.4f s" % stage['time']).rjust (12) + ("%.1f MB" % (stage['peak_memory']/1024.0**2)).rjust (12)
+		if previous is not None and name in previous['stages'] and previous['stages'][name]['time'] > 0:
+			line += ("x%.2f" % (stage['time']/previous['stages'][name]['time'])).rjust (10)
+		print (line)
+
+def main():
+	args = parseArgs()
+	
+	previous = {}
+	if args.compare:
+		with open (args.compare) as f:
+			previous = json.load (f)['cases']
+	
+	results = {
+		'python': platform.python_version (),
+		'numpy': np.__version__,
+		'platform': platform.platform (),
+		'processor': platform.processor (),
+		'date': time.strftime ("%Y-%m-%d %H:%M:%S"),
+		'settings': {
+			'angles': args.angles,
+			'tolerance': args.tolerance,
+			'angle_tolerance': args.angle_tolerance,
+			'supercell': args.supercell,
+			'threads': args.threads,
+			'repeat': args.repeat,
+		},
+		'cases': {},
+	}
+	
+	for pair in args.pairs:
+		crystals = [Crystal.Crystal (os.path.join (examples, filename)) for filename in pairs[pair]]
+		label = "%s/%s" % (crystals[0].label, crystals[1].label)
+		
+		for kernel in args.kernel:
+			if kernel == "fast" and not hasFastPath (crystals, args):
+				print ("%s fast: no fast path applies, skipped" % label)
+				continue
+			
+			for Nmax in args.N:
+				for step in args.angles_step:
+					case = benchmarkCase (crystals, kernel, Nmax, step, args)
+					case['pair'] = pair
+					case['crystals'] = label
+					
+					key = caseKey (label, case)
+					results['cases'][key] = case
+					printCase (key, case, previous.get (key))
+	
+	results['peak_resident_memory'] = peakResidentMemory ()
+	
+	with open (args.output_file, 'w') as f:
+		json.dump (results, f, indent=2, sort_keys=True)
+	
+	print ("\nResults saved to %s" % args.output_file)
+
+if __name__ == "__main__":
+	main()
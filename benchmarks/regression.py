@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+
+"""
+Regression harness for clattices.
+
+Reruns the examples of the guide (examples/ex1 to examples/ex5) and a few pairs of the library of crystals with each
+solver backend, reads the tables written in matrix notation and compares them with the reference outputs shipped in the
+examples and in benchmarks/references, as sets of supercells.
+Two supercells are the same if they have the same crystals and number of atoms, and angles and strains
+(regardless of the order of the vectors) within the given tolerances, so that equivalent choices of the
+supercell vectors are accepted. Combinations with the crystals in the opposite order are also matched,
+with the opposite strains.
+
+Folded ranges of angles (`--fold mapped`) are checked in the same way against a sweep of the whole range.
+
+Usage (from the root of the repository, after building `clattices_loop`):
+	
+	python benchmarks/regression.py
+	python benchmarks/regression.py -b solve refine --cases ex2_output1 ex3_output1
+
+The exit status is 1 if any backend does not reproduce a reference output.
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+root = os.path.join (os.path.dirname (os.path.abspath (__file__)), os.pardir)
+
+sys.path.insert (0, root)
+
+from clattices import Printer
+
+examples = os.path.join (root, "examples")
+
+cases = [
+	("ex1_output1", ["ex1/Graphene", "-a", "0", "30", "--self_combinations"], "examples/ex1/ex1_output1.dat"),
+	("ex1_output2", ["ex1/Graphene", "-a", "0", "30", "--self_combinations", "-N", "15", "-n", "300"], "examples/ex1/ex1_output2.dat"),
+	("ex2_output1", ["ex2/Graphene", "ex2/hBN"], "examples/ex2/ex2_output1.dat"),
+	("ex2_output2", ["ex2/Graphene", "ex2/hBN", "-a", "21.8", "21.8"], "examples/ex2/ex2_output2.dat"),
+	("ex3_output1", ["ex3/Phosphorene", "ex3/HfSe2", "--angle_tolerance", "0.1"], "examples/ex3/ex3_output1.dat"),
+	("ex4_output", ["ex4/crystals/*"], "examples/ex4/ex4_output.dat"),
+	("ex5_output", ["ex5/GrapheneOblique", "--self_combinations"], "examples/ex5/ex5_output.dat"),
+	("library", ["crystals/AlN", "crystals/AlSb", "crystals/BAs", "crystals/BP", "crystals/InP", "--self_combinations"], "benchmarks/references/library_output.dat"),
+]
+"""
+Examples of the guide: name, arguments of `clattices` (crystals relative to the examples directory) and reference output
+(relative to the root of the repository). The case "library" covers pairs of the library of crystals whose coincidences lie
+at the limits of the tolerances.
+"""
+
+backends = {
+	"brute": ["--kernel", "brute", "--no_fast_path"],
+	"solve": ["--kernel", "solve"],
+	"vector": ["--kernel", "vector", "--no_fast_path"],
+	"threads": ["--kernel", "solve", "--threads", "4"],
+	"refine": ["--kernel", "solve", "--refine", "8"],
+	"reduction": ["--kernel", "solve", "--supercell", "reduction"],
+	"generic": ["--kernel", "solve", "--no_fast_path"],
+}
+"""
+Solver backends, given as extra arguments of `clattices`. The kernel "analytic" is not included, since
+it finds continuous angles instead of the angles of the grid used by the references. The backends of the
+kernels "brute" and "vector" disable the fast paths, which would otherwise solve the hexagonal and square pairs.
+"""
+
+foldCases = [
+	("fold_ex2", ["ex2/Graphene", "ex2/hBN", "-a", "0", "120"]),
+	("fold_ex3", ["ex3/Phosphorene", "ex3/HfSe2", "-a", "0", "360", "--angle_tolerance", "0.1"]),
+	("fold_ex5", ["ex5/GrapheneOblique", "--self_combinations", "-a", "0", "360"]),
+	("fold_square", ["Square", "Square2", "-a", "-20", "200", "-N", "7"]),
+	("fold_hex_sq", ["Hexagonal", "Square", "-a", "0", "90", "-N", "7", "--angle_tolerance", "0.05"]),
+]
+"""
+Ranges of angles swept with `--fold mapped` and compared with the sweep of the whole range: name and arguments of
+`clattices`, with the crystals relative to the examples directory or written by `main` (see `foldCrystals`).
+"""
+
+foldCrystals = {
+	"Hexagonal": ["Hx", "1", "Hexagonal", "3.0"],
+	"Square": ["Sq", "1", "Square", "3.1"],
+	"Square2": ["Sq2", "1", "Square", "3.3"],
+}
+"""
+Crystals of the fold checks which are not in the examples, written to the work directory.
+"""
+
+def parseArgs():
+	"""
+	Parse arguments from the command line.
+	"""
+	parser = argparse.ArgumentParser(description='Compare the outputs of the examples with their reference outputs for each solver backend.')
+	
+	parser.add_argument('-b', '--backends', nargs='+', default=list (backends), choices=list (backends), help="backends tested (default: all)")
+	parser.add_argument('--cases', nargs='+', default=[name for name, _, _ in cases], choices=[name for name, _, _ in cases], help="examples tested (default: all)")
+	parser.add_argument('--fold_cases', nargs='*', default=[name for name, _ in foldCases], choices=[name for name, _ in foldCases], help="ranges of angles folded with the solve backend (default: all)")
+	parser.add_argument('--angle_tolerance', type=float, default=0.05, help="maximum difference of the angles in degrees (default: 0.05)")
+	parser.add_argument('--strain_tolerance', type=float, default=0.01, help="maximum difference of the strains in %% (default: 0.01)")
+	parser.add_argument('-v', '--verbose', action='store_true', help="list the supercells missing or unexpected (default: False)")
+	
+	return parser.parse_args()
+
+def expandCrystals (arguments):
+	"""
+	Replaces the crystals in the arguments with their paths, expanding the directories given as `directory/*`
+	in alphabetical order.
+	"""
+	
+	expanded = []
+	for argument in arguments:
+		if argument.endswith ("/*"):
+			directory = os.path.join (examples, argument[:-2])
+			expanded.extend (os.path.join (directory, name) for name in sorted (os.listdir (directory), key=str.lower))
+		elif os.path.exists (os.path.join (examples, argument)):
+			expanded.append (os.path.join (examples, argument))
+		else:
+			expanded.append (argument)
+	
+	return expanded
+
+def canonical (supercell):
+	"""
+	Returns the crystals, number of atoms, angle and sorted strains of a supercell, with the labels in alphabetical order.
+	"""
+	
+	labels = (supercell['label_1'], supercell['label_2'])
+	strain = supercell['strain']
+	
+	if labels[1] < labels[0]:
+		labels = labels[::-1]
+		strain = [-x for x in strain]
+	
+	return labels, supercell['nAtoms'], supercell['angle'], sorted (strain)
+
+def compare (reference, result, angleTolerance, strainTolerance):
+	"""
+	Matches the supercells of the result with the supercells of the reference.
+	Returns the lists of supercells missing from the result and of supercells not in the reference.
+	"""
+	
+	unmatched = [canonical (s) for s in result]
+	missing = []
+	
+	for s in reference:
+		labels, nAtoms, angle, strain = canonical (s)
+		
+		for i, (otherLabels, otherAtoms, otherAngle, otherStrain) in enumerate (unmatched):
+			if (otherLabels == labels and otherAtoms == nAtoms and abs (otherAngle - angle) <= angleTolerance + 1e-9
+					and all (abs (x - y) <= strainTolerance + 1e-9 for x, y in zip (strain, otherStrain))):
+				del unmatched[i]
+				break
+		else:
+			missing.append ((labels, nAtoms, angle, strain))
+	
+	return missing, unmatched
+
+def runCase (arguments, backend, outputFile, extra=[]):
+	"""
+	Runs `clattices` with the given arguments, backend and extra arguments, writing to `outputFile`.
+	Returns the time of the run in seconds, or `None` if it failed.
+	"""
+	
+	command = [sys.executable, "-m", "clattices"] + expandCrystals (arguments) + backends[backend] + extra + ["-o", outputFile, "-q"]
+	
+	environment = dict (os.environ)
+	environment['PYTHONPATH'] = os.pathsep.join ([root] + ([environment['PYTHONPATH']] if 'PYTHONPATH' in environment else []))
+	
+	start = time.perf_counter ()
+	status = subprocess.call (command, env=environment)
+	elapsed = time.perf_counter () - start
+	
+	return elapsed if status == 0 else None
+
+def report (name, backend, elapsed, result, missing, extra, verbose):
+	"""
+	Prints the row of a run and, if verbose, the supercells missing or unexpected.
+	"""
+	
+	status = "ok" if not missing and not extra else "FAILED"
+	print (name.ljust (14) + backend.ljust (12) + ("%.2f" % elapsed).rjust (10) + ("%d" % len (result)).rjust (8) + ("%d" % len (missing)).rjust (9) + ("%d" % len (extra)).rjust (7) + "  " + status)
+	
+	if verbose:
+		for s in missing:
+			print ("    missing: %s/%s, N = %d, angle = %.1f, strains = %s" % (s[0][0], s[0][1], s[1], s[2], s[3]))
+		for s in extra:
+			print ("    extra:   %s/%s, N = %d, angle = %.1f, strains = %s" % (s[0][0], s[0][1], s[1], s[2], s[3]))
+
+def main():
+	args = parseArgs()
+	
+	failures = 0
+	
+	print ("case".ljust (14) + "backend".ljust (12) + "time (s)".rjust (10) + "found".rjust (8) + "missing".rjust (9) + "extra".rjust (7) + "  status")
+	
+	# Failed runs may leave their output behind, which is removed with the directory
+	with tempfile.TemporaryDirectory () as workDirectory:
+		for name, arguments, referenceFile in cases:
+			if name not in args.cases:
+				continue
+			
+			reference = Printer.readMatrixNotation (os.path.join (root, referenceFile))
+			
+			for backend in args.backends:
+				outputFile = os.path.join (workDirectory, "%s_%s.dat" % (name, backend))
+				elapsed = runCase (arguments, backend, outputFile)
+				
+				if elapsed is None:
+					failures += 1
+					if os.path.exists (outputFile):
+						os.remove (outputFile)
+					print (name.ljust (14) + backend.ljust (12) + "-".rjust (10) + "-".rjust (8) + "-".rjust (9) + "-".rjust (7) + "  ERROR")
+					continue
+				
+				result = Printer.readMatrixNotation (outputFile)
+				missing, extra = compare (reference, result, args.angle_tolerance, args.strain_tolerance)
+				os.remove (outputFile)
+				
+				if missing or extra:
+					failures += 1
+				
+				report (name, backend, elapsed, result, missing, extra, args.verbose)
+		
+		for name, lines in foldCrystals.items ():
+			with open (os.path.join (workDirectory, name), "w") as f:
+				f.write ("\n".join (lines) + "\n")
+		
+		# The folded range is compared with the sweep of the whole range instead of a reference output
+		for name, arguments in foldCases:
+			if name not in args.fold_cases:
+				continue
+			
+			arguments = [os.path.join (workDirectory, x) if x in foldCrystals else x for x in arguments]
+			outputFiles = [os.path.join (workDirectory, "%s_%s.dat" % (name, fold)) for fold in ("none", "mapped")]
+			elapsed = [runCase (arguments, "solve", outputFile, ["--fold", fold]) for outputFile, fold in zip (outputFiles, ("none", "mapped"))]
+			
+			if None in elapsed:
+				failures += 1
+				for outputFile in outputFiles:
+					if os.path.exists (outputFile):
+						os.remove (outputFile)
+				print (name.ljust (14) + "fold".ljust (12) + "-".rjust (10) + "-".rjust (8) + "-".rjust (9) + "-".rjust (7) + "  ERROR")
+				continue
+			
+			reference, result = [Printer.readMatrixNotation (outputFile) for outputFile in outputFiles]
+			missing, extra = compare (reference, result, args.angle_tolerance, args.strain_tolerance)
+			for outputFile in outputFiles:
+				os.remove (outputFile)
+			
+			if missing or extra:
+				failures += 1
+			
+			report (name, "fold", elapsed[1], result, missing, extra, args.verbose)
+	
+	print ("\n%s" % ("All outputs match the references" if not failures else "%d run%s differ from the references" % (failures, '' if failures == 1 else 's')))
+	sys.exit (1 if failures else 0)
+
+if __name__ == "__main__":
+	main()
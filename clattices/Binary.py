@@ -0,0 +1,237 @@
+import os
+import sys
+import json
+import numpy as np
+from . import Combination
+
+magic = b"CLATBIN1"
+"""
+First bytes of a binary output file.
+"""
+
+headerSize = 256
+"""
+Size in bytes of the header of a binary output file, after which the records start.
+"""
+
+labelSize = 32
+"""
+Maximum size in bytes (UTF-8) of the labels stored in the records.
+"""
+
+recordType = np.dtype ([
+	('label_1', 'S%d' % labelSize),
+	('label_2', 'S%d' % labelSize),
+	('angle', '<f8'),
+	('nAtoms', '<i8'),
+	('strain', '<f8', (2,)),
+	('areaScaling', '<i8', (2,)),
+	('solutions', '<i4', (2, 4)),
+])
+"""
+Record of a supercell in a binary output file, with the same attributes as `Combination.Supercell`.
+The solutions are the pair [(m1, m2, n1, n2), (m1', m2', n1', n2')] and the strains are fractions, not percentages.
+"""
+
+class BinaryPrinter (object):
+	"""
+	Writes the supercells as fixed-size records after a short header, so that the file can be memory-mapped
+	as a structured array (see `load`) instead of parsed. The records are appended as each list of supercells
+	is printed, and the number of records follows from the size of the file, so that the records written
+	before an interruption can still be read.
+	"""
+	
+	def __init__ (self, outputFile):
+		"""
+		Initializes the printer with the output file.
+		"""
+		
+		self.outputFile = outputFile
+		"""
+		Output file to be written.
+		"""
+		
+		self.stream = None
+		"""
+		Output file kept open by `open`.
+		"""
+	
+	def open (self, bufferSize=1024*1024):
+		"""
+		Opens (and truncates) the output file and writes the header.
+		Returns the printer itself, which can be used in a `with` statement to close the file.
+		"""
+		
+		header = json.dumps ({'version': 1, 'dtype': np.lib.format.dtype_to_descr (recordType)}).encode ()
+		header = magic + header + b" "*(headerSize - len (magic) - len (header) - 1) + b"\n"
+		
+		self.stream = open (self.outputFile, 'wb', buffering=bufferSize)
+		self.stream.write (header)
+		
+		return self
+	
+	def printSupercells (self, supercellList, maxAtoms):
+		"""
+		Appends the supercells of the list with at most `maxAtoms` atoms to the output file.
+		Returns the number of supercells written.
+		"""
+		
+		if isinstance (supercellList, Combination.SupercellTable):
+			kept = supercellList.nAtoms <= maxAtoms
+			records = np.zeros (np.count_nonzero (kept), dtype=recordType)
+			records['label_1'] = encodeLabel (supercellList.label_1)
+			records['label_2'] = encodeLabel (supercellList.label_2)
+			records['angle'] = supercellList.angle[kept]
+			records['nAtoms'] = supercellList.nAtoms[kept]
+			records['strain'] = supercellList.strain[kept]
+			records['areaScaling'] = supercellList.areaScaling[kept]
+			records['solutions'] = supercellList.solutions[kept]
+		else:
+			supercells = [s for s in supercellList if s.nAtoms <= maxAtoms]
+			records = np.zeros (len (supercells), dtype=recordType)
+			if supercells:
+				records['label_1'] = [encodeLabel (s.label_1) for s in supercells]
+				records['label_2'] = [encodeLabel (s.label_2) for s in supercells]
+				records['angle'] = [s.angle for s in supercells]
+				records['nAtoms'] = [s.nAtoms for s in supercells]
+				records['strain'] = [s.strain for s in supercells]
+				records['areaScaling'] = [s.areaScaling for s in supercells]
+				records['solutions'] = [s.solutions for s in supercells]
+		
+		self.stream.write (records.tobytes ())
+		
+		return len (records)
+	
+	def flush (self, sync=False):
+		"""
+		Flushes the buffered records to the output file. If `sync` is True, also forces them to be written to disk.
+		"""
+		
+		if self.stream is not None:
+			self.stream.flush()
+			if sync:
+				os.fsync (self.stream.fileno())
+	
+	def close (self):
+		"""
+		Closes the output file.
+		"""
+		
+		if self.stream is not None:
+			self.stream.close()
+			self.stream = None
+	
+	def __enter__ (self):
+		return self
+	
+	def __exit__ (self, *args):
+		self.close()
+
+def encodeLabel (label):
+	"""
+	Returns a label encoded as stored in the records, exiting if it is too long.
+	"""
+	
+	encoded = label.encode ('utf-8')
+	if len (encoded) > labelSize:
+		print ("The label %s is too long for the binary output (at most %d bytes)\n" % (label, labelSize))
+		sys.exit(18)
+	
+	return encoded
+
+def load (filename):
+	"""
+	Memory-maps the records of a binary output file as a read-only structured array of `recordType`.
+	A record truncated by an interruption is ignored.
+	"""
+	
+	try:
+		with open (filename, 'rb') as f:
+			header = f.read (headerSize)
+		size = os.path.getsize (filename)
+	except (IOError, OSError) as error:
+		print ("Could not read the binary output %s: %s\n" % (filename, error))
+		sys.exit(18)
+	
+	try:
+		valid = header.startswith (magic) and json.loads (header[len (magic):].decode ())['dtype'] == json.loads (json.dumps (np.lib.format.dtype_to_descr (recordType)))
+	except (ValueError, KeyError, TypeError):
+		valid = False
+	
+	if len (header) < headerSize or not valid:
+		print ("The file %s is not a binary output of this version of clattices\n" % filename)
+		sys.exit(18)
+	
+	nRecords = (size - headerSize)//recordType.itemsize
+	if nRecords == 0:
+		return np.zeros (0, dtype=recordType)
+	
+	return np.memmap (filename, dtype=recordType, mode='r', offset=headerSize, shape=(nRecords,))
+
+def query (filename, pair=None, label=None, angles=None, maxAtoms=None, maxStrain=None, chunkSize=2**18):
+	"""
+	Yields the records of a binary output file which match all the filters given, in chunks of at most
+	`chunkSize` records, so that only one chunk of the file is loaded into memory at a time.
+	
+	The filters are the labels (label_1, label_2) of the combination (`pair`), a label of either crystal (`label`),
+	the interval of angles [min, max] in degrees (`angles`), the maximum number of atoms (`maxAtoms`) and
+	the maximum absolute strain of both vectors (`maxStrain`, as a fraction).
+	"""
+	
+	records = load (filename)
+	
+	for start in range (0, len (records), chunkSize):
+		chunk = records[start:start + chunkSize]
+		mask = np.ones (len (chunk), dtype=bool)
+		
+		if pair is not None:
+			mask &= (chunk['label_1'] == encodeLabel (pair[0])) & (chunk['label_2'] == encodeLabel (pair[1]))
+		if label is not None:
+			mask &= (chunk['label_1'] == encodeLabel (label)) | (chunk['label_2'] == encodeLabel (label))
+		if angles is not None:
+			mask &= (chunk['angle'] >= angles[0]) & (chunk['angle'] <= angles[1])
+		if maxAtoms is not None:
+			mask &= chunk['nAtoms'] <= maxAtoms
+		if maxStrain is not None:
+			mask &= np.all (np.abs (chunk['strain']) <= maxStrain, axis=1)
+		
+		if mask.any():
+			yield np.array (chunk[mask])
+
+class BinaryRow (object):
+	"""
+	View of a record of a binary output file with the attributes of `Combination.Supercell` used by the `Printer`.
+	"""
+	
+	__slots__ = ('record',)
+	
+	def __init__ (self, record):
+		self.record = record
+	
+	@property
+	def label_1 (self):
+		return self.record['label_1'].decode ('utf-8')
+	
+	@property
+	def label_2 (self):
+		return self.record['label_2'].decode ('utf-8')
+	
+	@property
+	def angle (self):
+		return float (self.record['angle'])
+	
+	@property
+	def solutions (self):
+		return self.record['solutions'].tolist()
+	
+	@property
+	def areaScaling (self):
+		return self.record['areaScaling'].tolist()
+	
+	@property
+	def nAtoms (self):
+		return int (self.record['nAtoms'])
+	
+	@property
+	def strain (self):
+		return self.record['strain'].tolist()
@@ -0,0 +1,178 @@
+import os
+import json
+import hashlib
+import tempfile
+import numpy as np
+
+class Cache (object):
+	"""
+	Persistent on-disk cache for the raw solutions (m1, m2, n1, n2) of combinations.
+	
+	Each combination is stored in its own file inside `directory`, named after a hash of the lattice vectors
+	of both crystals and of the search parameters (Nmax, tolerance, angle_tolerance, angles, kernel,
+	the maximum norm of the vectors searched and the folding of the angles).
+	When the total size of the cache exceeds `maxSize` bytes, the least recently used files are removed.
+	"""
+	
+	extension = ".npz"
+	"""
+	Extension of the files stored in the cache.
+	"""
+	
+	def __init__ (self, directory, maxSize=1024**3):
+		"""
+		Initializes the cache in the given directory, which is created if necessary.
+		"""
+		
+		self.directory = directory
+		"""
+		Directory where the solutions are stored.
+		"""
+		
+		self.maxSize = maxSize
+		"""
+		Maximum size of the cache in bytes. Zero or negative values disable the eviction.
+		"""
+		
+		os.makedirs (self.directory, exist_ok=True)
+	
+	def key (self, combination):
+		"""
+		Returns the hash which identifies the solutions of the given combination.
+		The kernels "brute", "solve" and "vector" find the same solutions and share the same key.
+		"""
+		
+		A = np.asarray (combination.crystal_1.latticeVectors, dtype=float)
+		B = np.asarray (combination.crystal_2.latticeVectors, dtype=float)
+		
+		description = {
+			'A': [repr (x) for x in A.ravel()],
+			'B': [repr (x) for x in B.ravel()],
+			'Nmax': int (combination.Nmax),
+			'tolerance': repr (float (combination.tolerance)),
+			'angle_tolerance': repr (float (combination.angle_tolerance)),
+			'angles': [repr (float (x)) for x in combination.angles],
+			'kernel': "analytic" if combination.kernel == "analytic" else "grid",
+			'max_norm': repr (float (combination.maxVectorNorm())),
+		}
+		
+		# Folded ranges keep only or map the solutions of their first period
+		if combination.foldingPeriod() is not None:
+			description['fold'] = combination.fold
+		
+		return hashlib.sha1 (json.dumps (description, sort_keys=True).encode()).hexdigest()
+	
+	def path (self, combination):
+		"""
+		Returns the file which stores the solutions of the given combination.
+		"""
+		
+		return os.path.join (self.directory, self.key (combination) + self.extension)
+	
+	def load (self, combination, solutionClass):
+		"""
+		Returns the list of solutions stored for the given combination, built with `solutionClass`
+		(usually `Combination.Solution`), or `None` if the combination is not in the cache.
+		"""
+		
+		filename = self.path (combination)
+		
+		try:
+			with np.load (filename) as data:
+				angles = data['angles']
+				counts = data['counts']
+				solutions = data['solutions']
+		except (IOError, OSError, KeyError, ValueError):
+			return None
+		
+		# Marks the file as recently used
+		try:
+			os.utime (filename, None)
+		except OSError:
+			pass
+		
+		allSolutions = []
+		bounds = np.concatenate (([0], np.cumsum (counts)))
+		for i, angle in enumerate (angles):
+			s = solutionClass (float (angle))
+			s.solutions = solutions[bounds[i]:bounds[i+1]].tolist()
+			allSolutions.append (s)
+		
+		return allSolutions
+	
+	def store (self, combination, allSolutions):
+		"""
+		Stores the list of solutions of the given combination and evicts old files if necessary.
+		"""
+		
+		angles = np.array ([s.angle for s in allSolutions], dtype=float)
+		counts = np.array ([len (s.solutions) for s in allSolutions], dtype=np.int64)
+		solutions = np.array ([x for s in allSolutions for x in s.solutions], dtype=np.int32).reshape (-1, 4)
+		
+		# Writes to a temporary file first, so that other processes never read a partial file
+		descriptor, temporary = tempfile.mkstemp (dir=self.directory, suffix=".tmp")
+		try:
+			with os.fdopen (descriptor, 'wb') as f:
+				np.savez (f, angles=angles, counts=counts, solutions=solutions)
+			os.replace (temporary, self.path (combination))
+		except OSError:
+			if os.path.exists (temporary):
+				os.remove (temporary)
+			raise
+		
+		self.evict ()
+	
+	def files (self):
+		"""
+		Returns a list of (last use, size, filename) for all files in the cache.
+		"""
+		
+		entries = []
+		for name in os.listdir (self.directory):
+			if name.endswith (self.extension):
+				filename = os.path.join (self.directory, name)
+				try:
+					status = os.stat (filename)
+				except OSError:
+					continue
+				entries.append ((status.st_mtime, status.st_size, filename))
+		
+		return entries
+	
+	def size (self):
+		"""
+		Returns the total size of the cache in bytes.
+		"""
+		
+		return sum (size for _, size, _ in self.files())
+	
+	def evict (self):
+		"""
+		Removes the least recently used files until the cache fits in `maxSize`.
+		"""
+		
+		if self.maxSize <= 0:
+			return
+		
+		entries = sorted (self.files())
+		total = sum (size for _, size, _ in entries)
+		
+		for _, size, filename in entries:
+			if total <= self.maxSize:
+				break
+			try:
+				os.remove (filename)
+			except OSError:
+				pass
+			total -= size
+	
+	def clear (self):
+		"""
+		Removes all files from the cache.
+		"""
+		
+		for _, _, filename in self.files():
+			try:
+				os.remove (filename)
+			except OSError:
+				pass
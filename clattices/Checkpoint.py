@@ -0,0 +1,147 @@
+import os
+import sys
+import json
+import numpy as np
+from . import Combination
+
+class Checkpoint (object):
+	"""
+	Checkpoint of a run, recording the combinations already finished and their supercells.
+	
+	The file has one JSON object per line: the first one holds the settings of the run, and each of the
+	following ones the index of a finished combination, its crystals and its supercells (angles and pairs of
+	solutions). Since the combinations are finished in order, the records always form a prefix of the list of
+	combinations, and a resumed run only has to solve the remaining ones.
+	"""
+	
+	def __init__ (self, filename, settings):
+		"""
+		Initializes the checkpoint with its file and the settings of the run, which must be serializable as JSON.
+		"""
+		
+		self.filename = filename
+		"""
+		File where the checkpoint is written.
+		"""
+		
+		self.settings = json.loads (json.dumps (settings))
+		"""
+		Settings of the run. A checkpoint can only be resumed with the same settings.
+		"""
+		
+		self.stream = None
+		"""
+		Checkpoint file kept open by `open`.
+		"""
+	
+	def load (self, combinations):
+		"""
+		Reads the records of the combinations finished by a previous run, checking that its settings and
+		combinations match the current ones. Returns an empty list if there is no checkpoint file.
+		Records truncated by an interruption are ignored.
+		"""
+		
+		if not os.path.exists (self.filename):
+			return []
+		
+		with open (self.filename) as f:
+			lines = f.read().splitlines()
+		
+		try:
+			settings = json.loads (lines[0])['settings'] if lines else None
+		except (ValueError, KeyError, TypeError):
+			settings = None
+		
+		if settings != self.settings:
+			print ("The checkpoint %s was written with different settings: remove it or run without --resume\n" % self.filename)
+			sys.exit(16)
+		
+		records = []
+		for line in lines[1:]:
+			try:
+				record = json.loads (line)
+			except ValueError:
+				break
+			
+			index = record.get ('index')
+			if index != len (records) or index >= len (combinations):
+				break
+			
+			c = combinations[index]
+			if [record.get ('label_1'), record.get ('label_2')] != [c.crystal_1.label, c.crystal_2.label]:
+				print ("The checkpoint %s does not match the crystals given: remove it or run without --resume\n" % self.filename)
+				sys.exit(16)
+			
+			records.append (record)
+		
+		return records
+	
+	def open (self, records=None):
+		"""
+		Opens the checkpoint file to record new combinations. The file is rewritten with the settings of
+		the run and the given `records`, which are kept when resuming, so that truncated records are discarded.
+		Returns the checkpoint itself, which can be used in a `with` statement to close the file.
+		"""
+		
+		# Writes to a temporary file first, so that the records kept are never lost by an interruption
+		temporary = self.filename + ".tmp"
+		with open (temporary, 'w') as f:
+			f.write (json.dumps ({'settings': self.settings}) + "\n")
+			for record in records or []:
+				f.write (json.dumps (record) + "\n")
+			f.flush()
+			os.fsync (f.fileno())
+		os.replace (temporary, self.filename)
+		
+		self.stream = open (self.filename, 'a')
+		
+		return self
+	
+	def add (self, index, combination, supercells):
+		"""
+		Records the supercells of a finished combination and forces the record to be written to disk.
+		"""
+		
+		angles = [float (s.angle) for s in supercells]
+		solutions = [[[int (x) for x in v] for v in s.solutions] for s in supercells]
+		
+		record = {
+			'index': index,
+			'label_1': combination.crystal_1.label,
+			'label_2': combination.crystal_2.label,
+			'angles': angles,
+			'solutions': solutions,
+		}
+		
+		self.stream.write (json.dumps (record) + "\n")
+		self.sync ()
+	
+	def sync (self):
+		"""
+		Forces the checkpoint to be written to disk.
+		"""
+		
+		self.stream.flush()
+		os.fsync (self.stream.fileno())
+	
+	def close (self):
+		"""
+		Closes the checkpoint file.
+		"""
+		
+		if self.stream is not None:
+			self.stream.close()
+			self.stream = None
+	
+	def __enter__ (self):
+		return self
+	
+	def __exit__ (self, *args):
+		self.close()
+	
+	def supercells (self, record, combination):
+		"""
+		Returns the supercells of a recorded combination as a `Combination.SupercellTable`.
+		"""
+		
+		return Combination.SupercellTable (np.asarray (record['angles'], dtype=float), record['solutions'], combination)
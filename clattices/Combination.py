@@ -2,7 +2,6 @@ import numpy as np
 import sys
 import clattices_loop
 import re
-import os
 
 class Solution (object):
 	"""
@@ -172,6 +171,144 @@ class Supercell (object):
 		return [strain1, strain2]
 		
 		
+class SupercellTable (object):
+	"""
+	Columnar container for the supercells of a combination. Each attribute of `Supercell` is stored as
+	an array with one entry per supercell, all of them calculated at once for the whole combination.
+	Iterating over the table (or indexing it) gives `SupercellRow` views with the same attributes as
+	`Supercell`, so that the table can be used wherever a list of supercells is expected, e.g. by the `Printer`.
+	"""
+	
+	def __init__ (self, angles, solutions, combination):
+		"""
+		Initializes the table with the angles and the pairs of solutions [(m1, m2, n1, n2), (m1', m2', n1', n2')]
+		of each supercell.
+		"""
+		
+		self.label_1 = combination.crystal_1.label
+		self.label_2 = combination.crystal_2.label
+		"""
+		Label of the systems creating the supercells.
+		"""
+		
+		self.angle = np.asarray (angles, dtype=float).reshape (-1)
+		"""
+		The angles which lead to the supercells.
+		"""
+		
+		self.solutions = np.asarray (solutions, dtype=np.int64).reshape (-1, 2, 4)
+		"""
+		The pairs of vectors which lead to the supercells, as an array of shape (n, 2, 4).
+		"""
+		
+		A = np.asarray (combination.crystal_1.latticeVectors)
+		B = np.asarray (combination.crystal_2.latticeVectors)
+		m1, m2, n1, n2 = [self.solutions[:,:,i] for i in range (4)]
+		
+		Am = np.stack ((m1*A[0,0] + m2*A[0,1], m1*A[1,0] + m2*A[1,1]), axis=-1)
+		Bn = np.stack ((n1*B[0,0] + n2*B[0,1], n1*B[1,0] + n2*B[1,1]), axis=-1)
+		
+		# The dot products are evaluated as in np.linalg.norm, so that the values are identical to `Supercell`
+		normA = np.sqrt ((Am[...,np.newaxis,:] @ Am[...,np.newaxis])[...,0,0])
+		normB = np.sqrt ((Bn[...,np.newaxis,:] @ Bn[...,np.newaxis])[...,0,0])
+		
+		self.vectorNorm = np.column_stack ((normA, normB))
+		"""
+		Absolute norm of the supercell vectors of the first and second crystals, shape (n, 4)
+		"""
+		
+		unitNorm = np.array ([np.linalg.norm (A[:,0]), np.linalg.norm (A[:,1]), np.linalg.norm (B[:,0]), np.linalg.norm (B[:,1])])
+		self.vectorScaling = self.vectorNorm/unitNorm
+		"""
+		Scaling of the supercell vectors relative to the first and second crystals, shape (n, 4)
+		"""
+		
+		self.vectorScalingSquared = np.rint (self.vectorScaling**2).astype (int)
+		"""
+		Square of the scaling of the supercell vectors, shape (n, 4). Useful for the Wood notation.
+		"""
+		
+		self.areaScaling = np.column_stack ((m1[:,0]*m2[:,1] - m1[:,1]*m2[:,0], n1[:,0]*n2[:,1] - n1[:,1]*n2[:,0]))
+		"""
+		Area of the supercells relative to the first and second crystals, shape (n, 2)
+		"""
+		
+		self.nAtoms = self.areaScaling[:,0]*combination.crystal_1.nAtoms + self.areaScaling[:,1]*combination.crystal_2.nAtoms
+		"""
+		Number of atoms inside the supercells
+		"""
+		
+		self.strain = (normB - normA)/(normB + normA)
+		"""
+		Strain necessary to form the systems according to the eq. 12, one for each vector, shape (n, 2)
+		"""
+	
+	def __len__ (self):
+		return len (self.angle)
+	
+	def __getitem__ (self, index):
+		if index < 0:
+			index += len (self)
+		if not 0 <= index < len (self):
+			raise IndexError ("supercell index out of range")
+		
+		return SupercellRow (self, index)
+	
+	def __iter__ (self):
+		for index in range (len (self)):
+			yield SupercellRow (self, index)
+	
+class SupercellRow (object):
+	"""
+	Lightweight view of one supercell of a `SupercellTable`, with the same attributes as `Supercell`.
+	"""
+	
+	__slots__ = ('table', 'index')
+	
+	def __init__ (self, table, index):
+		self.table = table
+		self.index = index
+	
+	@property
+	def label_1 (self):
+		return self.table.label_1
+	
+	@property
+	def label_2 (self):
+		return self.table.label_2
+	
+	@property
+	def angle (self):
+		return float (self.table.angle[self.index])
+	
+	@property
+	def solutions (self):
+		return self.table.solutions[self.index].tolist()
+	
+	@property
+	def vectorScaling (self):
+		return self.table.vectorScaling[self.index].tolist()
+	
+	@property
+	def vectorNorm (self):
+		return self.table.vectorNorm[self.index].tolist()
+	
+	@property
+	def vectorScalingSquared (self):
+		return self.table.vectorScalingSquared[self.index].tolist()
+	
+	@property
+	def areaScaling (self):
+		return self.table.areaScaling[self.index].tolist()
+	
+	@property
+	def nAtoms (self):
+		return int (self.table.nAtoms[self.index])
+	
+	@property
+	def strain (self):
+		return self.table.strain[self.index].tolist()
+		
 class Combination (object):
 	"""
 	Base class for combinations of 2D crystals.
@@ -180,7 +317,7 @@ class Combination (object):
 	coincidence lattices within the limits imposed.
 	"""
 	
-	def __init__ (self, crystals, angles, limits):
+	def __init__ (self, crystals, angles, limits, kernel="brute", threads=0, supercellSearch="pairwise", cache=None, maxAtoms=None, refinement=0, fastPath=True, fold="none"):
 		"""
 		Initializes the class with the crystals, angles and rules for limiting the size of the supercell
 		"""
@@ -220,6 +357,87 @@ class Combination (object):
 		except IndexError:
 			print ("Limits not enough to calculate the combination: a list [Nmax, tolerance] is required\n")
 			sys.exit(13)
+		
+		self.kernel = kernel
+		"""
+		Kernel used by `clattices_loop` to search for coincidences at each angle: "brute" tests every
+		(m1, m2, n1, n2), while "solve" inverts the eq. 11 for each (m1, m2) and tests only the
+		integer (n1, n2) around the solution. The kernel "vector" tests every vector as "brute", screening
+		the rotated vectors of each angle in vectorized batches. All of them give the same solutions.
+		The kernel "analytic" does not sweep the angles: see `findAnalyticSolutions`.
+		"""
+		
+		self.threads = threads
+		"""
+		Number of threads used by `clattices_loop` to sweep the angles (all processors if zero).
+		"""
+		
+		self.supercellSearch = supercellSearch
+		"""
+		Method used to choose the supercell at each angle: "pairwise" compares all pairs of solutions
+		(see `findMinimumAreaPair`), while "reduction" applies a Gauss reduction to the generators
+		of the coincidence sublattice (see `findReducedPair`).
+		"""
+		
+		self.cache = cache
+		"""
+		Optional `Cache.Cache` where the solutions found by `findSolutions` are stored and reused.
+		"""
+		
+		self.maxAtoms = maxAtoms
+		"""
+		Maximum number of atoms inside the supercells. If given, vectors Am too long to belong to such
+		a supercell are not searched (see `maxVectorNorm`).
+		"""
+		
+		self.refinement = refinement
+		"""
+		Stride, in steps of `angles[2]`, of the coarse sweep used to find the neighbourhoods of coincidences,
+		which are then refined down to `angles[2]` (see `findRefinedSolutions`). Disabled if smaller than 2.
+		"""
+		
+		self.fastPath = fastPath
+		"""
+		Whether the specialized solvers are used for the combinations they apply to, instead of sweeping every
+		angle of the grid: `findHomobilayerSolutions` for two crystals with the same lattice and `findIntegerFormSolutions`
+		for lattices with integer norm forms, such as hexagonal, square and some rectangular and oblique lattices.
+		They find the same solutions.
+		"""
+		
+		self.formTolerance = 1e-6
+		"""
+		Largest difference between the Gram matrix of a lattice, divided by its scale, and the integer form accepted by
+		`latticeForm`. The search of `findIntegerFormSolutions` is widened accordingly.
+		"""
+		
+		self.fold = fold
+		"""
+		Folding of the range of angles by the rotations which leave both lattices invariant (see `foldingPeriod`):
+		"none" sweeps the whole range, "irreducible" sweeps and reports only the first period of the range, and
+		"mapped" sweeps the first period and maps its solutions to the rest of the range (see `findFoldedSolutions`).
+		"""
+		
+		self.normLimit = 0
+		"""
+		Additional limit of the norm of the vectors Am searched (see `maxVectorNorm`), set by `sweepFirstPeriod`
+		while the first period of a folded range is swept. Zero for no limit.
+		"""
+		
+		self.anglesEvaluated = 0
+		"""
+		Number of angles evaluated by `clattices_loop` in the last call to `findSolutions`, over all levels of refinement.
+		"""
+		
+		self.candidates = 0
+		"""
+		Number of vectors (m, n) tested by `clattices_loop` in the last call to `findSolutions`,
+		or of pairs (Am, Bn) with similar norms compared by `findAnalyticSolutions`.
+		"""
+		
+		self.fromCache = False
+		"""
+		Whether the solutions of the last call to `findSolutions` were read from the `cache`.
+		"""
 			
 		
 			
@@ -230,8 +448,8 @@ class Combination (object):
 			
 		self.supercell = []
 		"""
-		List to find a pair of linearly independent solutions (m1, m2, n1, n2), (m1', m2', n1', n2')
-		which has minimum area.
+		Supercells (`SupercellTable`) found from pairs of linearly independent solutions (m1, m2, n1, n2), (m1', m2', n1', n2')
+		with minimum area.
 		"""
 		
 		self.areaUnitCell = min (abs(np.linalg.det(self.crystal_1.latticeVectors)), abs(np.linalg.det(self.crystal_2.latticeVectors)))
@@ -248,98 +466,979 @@ class Combination (object):
 		
 		return M
 		
+	def angleGrid (self):
+		"""
+		Returns the list of angles investigated, from `angles[0]` to `angles[1]` in steps of `angles[2]`.
+		The angles are accumulated exactly as in `clattices_loop`, so that the position of an angle
+		in this list is the angle index returned by the extension.
+		"""
+		
+		grid = []
+		angle = self.angles[0]
+		while angle < self.angles[1] + self.angles[2]:
+			grid.append (angle)
+			angle = angle + self.angles[2]
+		
+		return grid
+		
+	def shortestVectorNorm (self, lattice):
+		"""
+		Returns the norm of the shortest nonzero vector of the given lattice, found by a Gauss reduction
+		of its lattice vectors.
+		"""
+		
+		lattice = np.asarray (lattice, dtype=float)
+		u, v = lattice[:,0], lattice[:,1]
+		
+		if u.dot (u) > v.dot (v):
+			u, v = v, u
+		
+		while True:
+			v = v - round (u.dot (v)/u.dot (u))*u
+			if v.dot (v) >= u.dot (u):
+				break
+			u, v = v, u
+		
+		return np.linalg.norm (u)
+	
+	def maxVectorNorm (self, slack=1.05):
+		"""
+		Returns the maximum norm of the vectors Am which may belong to a supercell with at most
+		`maxAtoms` atoms, or zero if there is no such limit.
+		
+		The area S of the supercell is bounded by maxAtoms = S*nA/|A| + S_B*nB/|B|, with S_B >= S/(1 + tolerance)^2.
+		The vectors (u, v) of a reduced basis make an angle between 60 and 120 degrees, so that
+		|v| <= 2S/(sqrt(3)|u|), and |u| is at least the norm of the shortest vector of the first crystal.
+		The bound is widened by `slack` to account for the angle tolerance. If `normLimit` is set, the smallest
+		of both limits is returned.
+		"""
+		
+		if not self.maxAtoms or self.maxAtoms <= 0:
+			return self.normLimit
+		
+		A = self.crystal_1.latticeVectors
+		B = self.crystal_2.latticeVectors
+		
+		atomDensity = self.crystal_1.nAtoms/abs (np.linalg.det (A)) + self.crystal_2.nAtoms/(abs (np.linalg.det (B))*(1 + self.tolerance)**2)
+		if atomDensity <= 0:
+			return self.normLimit
+		
+		maxArea = self.maxAtoms/atomDensity
+		maxNorm = slack*2*maxArea/(np.sqrt (3)*self.shortestVectorNorm (A))
+		
+		return min (maxNorm, self.normLimit) if self.normLimit > 0 else maxNorm
+	
+	def estimatedCost (self):
+		"""
+		Estimates the number of vectors (m, n) tested by `clattices_loop` to find the solutions, used to balance
+		the combinations among shards. The kernel "solve" tests a box of about 2*tolerance*|Am| times the norm of each
+		row of B^-1 around the real solution for each Am, while the kernels "brute" and "vector" test every vector.
+		The kernel "analytic" is estimated as a single angle of the kernel "solve".
+		The fast paths are estimated by the candidates of `solveVectorPairs`, and folded ranges by their first period.
+		"""
+		
+		# A folded range is estimated by the sweep of its first period
+		folding = self.foldingPeriod ()
+		if folding is not None:
+			return self.sweepFirstPeriod (folding, self.rangeCost)
+		
+		return self.rangeCost ()
+	
+	def searchRange (self):
+		"""
+		Returns the ranges (m1_max, m2_max, n1_max, n2_min, n2_max) of the indices searched by `clattices_loop`, as set by
+		its `search_range_init`: |m1|, |m2|, |n1| <= Nmax and -Nmax <= n2 < Nmax, reduced by the maximum norm of the
+		vectors Am (see `maxVectorNorm`) and of the vectors Bn which may be coincident with them.
+		"""
+		
+		N = self.Nmax
+		maxNorm = self.maxVectorNorm ()
+		if maxNorm <= 0:
+			return N, N, N, -N, N - 1
+		
+		rowA = np.linalg.norm (np.linalg.inv (np.asarray (self.crystal_1.latticeVectors, dtype=float)), axis=1)
+		rowB = np.linalg.norm (np.linalg.inv (np.asarray (self.crystal_2.latticeVectors, dtype=float)), axis=1)
+		bound = lambda norm, row: min (N, int (np.floor (norm*row)))
+		
+		m1, m2 = bound (maxNorm, rowA[0]), bound (maxNorm, rowA[1])
+		if self.tolerance >= 1:
+			return m1, m2, N, -N, N - 1
+		
+		n1, n2 = bound (maxNorm/(1 - self.tolerance), rowB[0]), bound (maxNorm/(1 - self.tolerance), rowB[1])
+		return m1, m2, n1, -n2, min (N - 1, n2)
+	
+	def rangeCost (self):
+		"""
+		Estimates the number of vectors (m, n) tested to find the solutions of the range `angles` (see `estimatedCost`).
+		"""
+		
+		k = 2*self.Nmax + 1
+		nAngles = len (self.angleGrid ()) if self.kernel != "analytic" else 1
+		
+		# Vectors Am searched, the ones longer than the maximum norm are skipped
+		maxNorm = self.maxVectorNorm ()
+		_, Am = self.latticePoints (self.crystal_1.latticeVectors)
+		normA = np.hypot (Am[:,0], Am[:,1])
+		if maxNorm > 0:
+			normA = normA[normA <= maxNorm]
+		
+		# The fast paths test the pairs of vectors with similar norms at the few angles of the grid near their angle
+		if self.kernel != "analytic" and self.fastPath and (self.hasIntegerForms () or self.isHomobilayer ()):
+			_, Bn = self.latticePoints (self.crystal_2.latticeVectors)
+			normB = np.sort (np.hypot (Bn[:,0], Bn[:,1]))
+			pairs = np.sum (np.searchsorted (normB, normA*(1 + self.tolerance), side='right') - np.searchsorted (normB, normA/(1 + self.tolerance), side='left'))
+			
+			# Only the pairs whose angle lies in the range of the grid are tested when the shells are sorted by angle
+			if self.hasIntegerForms ():
+				pairs *= min ((self.angles[1] - self.angles[0] + 2*self.angle_tolerance)/360.0, 1)
+			
+			return float (pairs*min (2*self.angle_tolerance/self.angles[2] + 1, nAngles))
+		
+		if maxNorm <= 0:
+			if self.kernel in ("brute", "vector"):
+				return float (nAngles*k**3*(k - 1))
+			
+			visited = k**2
+			width = [k, k]
+		else:
+			m1, m2, n1, n2Min, n2Max = self.searchRange ()
+			if self.kernel in ("brute", "vector"):
+				return float (nAngles*len (normA)*(2*n1 + 1)*max (n2Max - n2Min + 1, 0))
+			
+			visited = (2*m1 + 1)*(2*m2 + 1)
+			width = [2*n1 + 1, max (n2Max - n2Min + 1, 0)]
+		
+		rowNorm = np.linalg.norm (np.linalg.inv (np.asarray (self.crystal_2.latticeVectors, dtype=float)), axis=1)
+		box = np.minimum (2*self.tolerance*normA*rowNorm[0], width[0])*np.minimum (2*self.tolerance*normA*rowNorm[1], width[1])
+		
+		# Each Am is visited even if its box has no integer vectors
+		return float (nAngles*(visited + np.sum (box)))
+	
 	def findSolutions (self):		
 		"""
 		Solves the eq. 11 to find solutions (m1, m2, n1, n2) of coincidences for the given crystals and all angles.
 		All solutions are lists of the type `[[angle_1, solutions_list], [angle_2, solutions_list], ...]`
-		This method calls an extension built in C to speed the calculations, namely `clattices_loop`
+		This method calls an extension built in C to speed the calculations, namely `clattices_loop`.
+		If a `cache` is given, the solutions are read from it when available and stored in it otherwise.
+		"""
+		
+		self.anglesEvaluated = 0
+		self.candidates = 0
+		self.fromCache = False
+		
+		if self.cache is not None:
+			cached = self.cache.load (self, Solution)
+			if cached is not None:
+				self.allSolutions = cached
+				self.fromCache = True
+				return self.allSolutions
+		
+		folding = self.foldingPeriod ()
+		if folding is not None:
+			self.findFoldedSolutions (*folding)
+		else:
+			if self.fold == "mapped" and self.symmetryFolding () is not None:
+				print ("Range of angles of %s/%s not folded: the sweep of its first period is estimated to be slower than the whole range" % (self.crystal_1.label, self.crystal_2.label), file=sys.stderr)
+			self.findRangeSolutions ()
+		
+		if self.cache is not None:
+			self.cache.store (self, self.allSolutions)
+		
+		return self.allSolutions
+	
+	def findRangeSolutions (self):
+		"""
+		Finds the solutions for all angles of the range `angles` with the solver which applies to the combination.
+		"""
+		
+		if self.kernel == "analytic":
+			return self.findAnalyticSolutions ()
+		elif self.fastPath and self.hasIntegerForms ():
+			return self.findIntegerFormSolutions ()
+		elif self.fastPath and self.isHomobilayer ():
+			return self.findHomobilayerSolutions ()
+		elif self.refinement > 1:
+			return self.findRefinedSolutions ()
+		else:
+			return self.findGridSolutions ()
+	
+	def symmetryOrder (self, crystal):
+		"""
+		Returns the order of the rotations which leave the lattice of a crystal invariant, given by its Bravais lattice:
+		6 for hexagonal, 4 for square and 2 (the inversion) for rectangular and oblique lattices.
+		"""
+		
+		return {'hexagonal': 6, 'square': 4}.get (crystal.bravaisLattice, 2)
+	
+	def latticeRotation (self, lattice, angle):
+		"""
+		Returns the integer matrix R such that L R = M L, where L is the lattice and M the rotation matrix of
+		the given angle (see `rotationMatrix`), or `None` if the rotation does not leave the lattice invariant.
+		"""
+		
+		L = np.asarray (lattice, dtype=float)
+		R = np.linalg.solve (L, np.asarray (self.rotationMatrix (angle)).dot (L))
+		
+		if not np.allclose (R, np.rint (R), atol=1e-6):
+			return None
+		
+		return np.rint (R).astype (np.int64)
+	
+	def symmetryFolding (self):
+		"""
+		Returns the folding of the range of angles by the symmetry of the lattices as (period, steps, RA, RB),
+		or `None` if the range cannot be folded.
+		
+		If the rotation M(alpha) leaves the first lattice invariant, A RA = M(alpha) A, and M(alpha - period) leaves the
+		second one invariant, B RB = M(alpha - period) B, then every solution Am = M(theta) Bn at the angle theta gives
+		the solution A(RA m) = M(theta + period) B(RB n) at the angle theta + period. The smallest such period is
+		360 degrees divided by the least common multiple of the orders of both lattices (see `symmetryOrder`), e.g.
+		60 degrees for two hexagonal lattices, 30 for a hexagonal and a square lattice and 180 for oblique lattices.
+		
+		The range can only be folded if it is longer than the period and the period is a whole number `steps` of
+		`angles[2]`, so that the angles of the grid are mapped to angles of the grid.
+		"""
+		
+		if self.fold == "none" or self.kernel == "analytic":
+			return None
+		
+		orderA = self.symmetryOrder (self.crystal_1)
+		orderB = self.symmetryOrder (self.crystal_2)
+		order = orderA*orderB//np.gcd (orderA, orderB)
+		period = 360.0/order
+		
+		steps = int (round (period/self.angles[2]))
+		if steps < 1 or abs (steps*self.angles[2] - period) > 1e-9*period or len (self.angleGrid ()) <= steps:
+			return None
+		
+		# alpha is a multiple of 360/orderA such that alpha - period is a multiple of 360/orderB
+		for i in range (orderA):
+			alpha = i*360.0/orderA
+			if abs ((alpha - period)*orderB/360.0 - round ((alpha - period)*orderB/360.0)) < 1e-9:
+				break
+		
+		RA = self.latticeRotation (self.crystal_1.latticeVectors, alpha)
+		RB = self.latticeRotation (self.crystal_2.latticeVectors, alpha - period)
+		if RA is None or RB is None:
+			return None
+		
+		return period, steps, RA, RB
+	
+	def foldingPeriod (self):
+		"""
+		Returns the folding of the range of angles as (period, steps, RA, RB), or `None` if the range is not folded.
+		
+		If `fold` is "irreducible", the range is folded whenever the symmetry of the lattices allows it (see `symmetryFolding`).
+		If `fold` is "mapped", the first period is swept over a larger box of indices (see `sweepFirstPeriod`), so that
+		the range is only folded if this sweep is estimated to be cheaper than the sweep of the whole range (see `rangeCost`).
+		Since the images of the box under the rotations of hexagonal lattices are twice as large, this is mostly the case
+		for square, rectangular and oblique lattices.
+		"""
+		
+		folding = self.symmetryFolding ()
+		if folding is None or self.fold != "mapped":
+			return folding
+		
+		if self.sweepFirstPeriod (folding, self.rangeCost) >= self.rangeCost ():
+			return None
+		
+		return folding
+	
+	def periodAngles (self, steps):
+		"""
+		Returns the range of angles [min, max, step] of the first `steps` angles of the grid.
+		The maximum lies half a step before the last angle, so that the accumulated grid, which stops before the
+		maximum plus a step, ends at the last angle whatever the rounding of the accumulated angles.
+		"""
+		
+		return [self.angles[0], self.angles[0] + (steps - 1.5)*self.angles[2], self.angles[2]]
+	
+	def sweepFirstPeriod (self, folding, function):
+		"""
+		Calls `function` to sweep the first period of a folded range (see `foldingPeriod`) and returns its result.
+		During the call, `angles` is the first period.
+		
+		If `fold` is "mapped", the box |k1|, |k2| <= Nmax of the indices is not invariant under the rotations RA and RB,
+		so that the solutions at an angle k periods after the first period are the images of solutions of the first period
+		which may lie outside of the box. `Nmax` is then also enlarged to contain the images of the box under every power
+		of RA and RB, and the vectors Am are limited (see `normLimit`) to the norm of the longest vector of the box,
+		which is the same for all its images. The search parameters are restored afterwards.
 		"""
 		
+		period, steps, RA, RB = folding
+		
+		if self.fold != "mapped":
+			angles = self.angles
+			self.angles = self.periodAngles (steps)
+			try:
+				return function ()
+			finally:
+				self.angles = angles
+		
+		# Largest row sum of the absolute values of the powers of the rotations, which bounds the indices of the images
+		factor = 1
+		for R in (RA, RB):
+			power = R.copy ()
+			while not np.array_equal (power, np.identity (2, dtype=np.int64)):
+				factor = max (factor, int (np.abs (power).sum (axis=1).max ()))
+				power = R.dot (power)
+		
+		A = np.asarray (self.crystal_1.latticeVectors, dtype=float)
+		corners = A.dot (np.array ([[self.Nmax, self.Nmax], [self.Nmax, -self.Nmax]]).T)
+		
+		angles, Nmax, normLimit = self.angles, self.Nmax, self.normLimit
+		self.angles = self.periodAngles (steps)
+		# One more index for the range -Nmax <= n2 < Nmax of the search
+		self.Nmax = factor*Nmax + 1
+		self.normLimit = np.max (np.linalg.norm (corners, axis=0))*(1 + 1e-9)
+		try:
+			return function ()
+		finally:
+			self.angles, self.Nmax, self.normLimit = angles, Nmax, normLimit
+	
+	def findFoldedSolutions (self, period, steps, RA, RB):
+		"""
+		Finds the solutions of the first period of the range of angles, i.e. its first `steps` angles, with the solver
+		which applies to the combination (see `findRangeSolutions` and `sweepFirstPeriod`). If `fold` is "irreducible",
+		only these angles are kept. If `fold` is "mapped", the solutions of each angle of the grid are the images
+		(RA^k m, RB^k n) of the solutions (m, n) of the angle k periods before it (see `foldingPeriod`) inside the box
+		|m1|, |m2|, |n1| <= Nmax, -Nmax <= n2 < Nmax searched by `clattices_loop`, sorted as the solutions of the grid.
+		
+		Up to the rounding of the angles and of the tests of the coincidences, the solutions are the same as the ones
+		of a sweep of the whole range.
+		"""
+		
+		self.sweepFirstPeriod ((period, steps, RA, RB), self.findRangeSolutions)
+		
+		if self.fold != "mapped":
+			return self.allSolutions
+		
+		# Solutions of the first period as rows (angle index, m1, m2, n1, n2)
+		counts = [len (s.solutions) for s in self.allSolutions]
+		hits = np.zeros ((sum (counts), 5), dtype=np.int64)
+		hits[:,0] = np.repeat (np.arange (len (counts)), counts)
+		if len (hits):
+			hits[:,1:] = np.concatenate ([np.asarray (s.solutions, dtype=np.int64) for s in self.allSolutions if s.solutions])
+		
+		grid = self.angleGrid ()
 		self.allSolutions = []
 		
-		# Print the lattice into a temporary file for the extension
-		with open ("lattices.tmp", "w") as f:
-			A = self.crystal_1.latticeVectors
-			B = self.crystal_2.latticeVectors
-			f.write ("%lf %lf \n%lf %lf\n" % (A.item(0,0), A.item(0,1), A.item(1,0), A.item(1,1)))
-			f.write ("%lf %lf \n%lf %lf\n" % (B.item(0,0), B.item(0,1), B.item(1,0), B.item(1,1)))
+		rotationA = np.identity (2, dtype=np.int64)
+		rotationB = np.identity (2, dtype=np.int64)
+		for k in range (0, (len (grid) + steps - 1)//steps):
+			if k > 0:
+				rotationA = RA.dot (rotationA)
+				rotationB = RB.dot (rotationB)
+			
+			S = np.column_stack ((hits[:,0], hits[:,1:3].dot (rotationA.T), hits[:,3:].dot (rotationB.T)))
+			S = S[np.all (np.abs (S[:,1:4]) <= self.Nmax, axis=1) & (S[:,4] >= -self.Nmax) & (S[:,4] < self.Nmax)]
+			S = S[np.lexsort (S.T[::-1])]
+			bounds = np.searchsorted (S[:,0], np.arange (steps + 1))
 			
+			for j, angle in enumerate (grid[k*steps:(k + 1)*steps]):
+				s = Solution (float ("%.2f" % angle))
+				s.solutions = S[bounds[j]:bounds[j+1], 1:].tolist()
+				self.allSolutions.append (s)
+		
+		return self.allSolutions
+	
+	def kernelLattices (self):
+		"""
+		Returns the lattice vectors of both crystals as lists passed to `clattices_loop`, rounded to 6 decimals as they
+		were written to its input file with "%lf", so that the coincidences found at the limits of the tolerances are
+		the same as with the input file.
+		"""
+		
+		return [[[float ("%lf" % x) for x in row] for row in np.asarray (L, dtype=float).tolist()] for L in (self.crystal_1.latticeVectors, self.crystal_2.latticeVectors)]
+	
+	def findGridSolutions (self):
+		"""
+		Finds the solutions (m1, m2, n1, n2) for all angles of the grid given by `angles` using `clattices_loop`.
+		The solutions are returned by the extension as an array of rows (angle index, m1, m2, n1, n2).
+		"""
+		
+		self.allSolutions = []
+		
+		A, B = self.kernelLattices ()
+		
 		# Call the extension
-		clattices_loop.clattices_loop (self.angles[0], self.angles[1], self.angles[2], self.Nmax, self.tolerance, self.angle_tolerance)
+		result = clattices_loop.clattices_solve (A, B, self.angles[0], self.angles[1], self.angles[2], self.Nmax, self.tolerance, self.angle_tolerance, kernel=self.kernel, threads=self.threads, max_norm=self.maxVectorNorm ())
+		hits = np.asarray (result)
+		
+		# Split the solutions by angle. The extension returns them sorted by angle index
+		grid = self.angleGrid ()
+		self.anglesEvaluated = len (grid)
+		self.candidates = result.candidates
+		bounds = np.searchsorted (hits[:,0], np.arange (len (grid) + 1))
+		
+		for i, angle in enumerate (grid):
+			s = Solution (float ("%.2f" % angle))
+			s.solutions = hits[bounds[i]:bounds[i+1], 1:].tolist()
+			
+			self.allSolutions.append(s)
+		
+		return self.allSolutions
+	
+	def solveAngles (self, angles, tolerance, angle_tolerance):
+		"""
+		Finds the solutions (angle index, m1, m2, n1, n2) for the given list of angles using `clattices_loop`.
+		The angles and vectors (m, n) tested are added to `anglesEvaluated` and `candidates`.
+		"""
+		
+		A, B = self.kernelLattices ()
+		
+		result = clattices_loop.clattices_solve_angles (A, B, angles, self.Nmax, tolerance, angle_tolerance, kernel=self.kernel, threads=self.threads, max_norm=self.maxVectorNorm ())
+		self.anglesEvaluated += len (angles)
+		self.candidates += result.candidates
+		
+		return np.asarray (result).reshape (-1, 5)
+	
+	def findRefinedSolutions (self, factor=0):
+		"""
+		Finds the same solutions as `findGridSolutions`, evaluating only the angles of the grid close to coincidences.
+		
+		The grid is first swept with a stride of `refinement` angles. Every angle of the grid lies within
+		r = stride/2 steps of a swept angle, and a coincidence found at that angle is also found at the
+		swept angle if the tolerances are relaxed by the rotation of r steps: the angle between Am and MBn
+		changes by r*angles[2], and |Am - MBn|/min(|Am|, |MBn|) by at most (1 + tolerance) times that rotation in radians.
+		The angle tolerance is also widened by the rounding error of the angle computed by `clattices_loop`.
+		The neighbourhoods of the swept angles with relaxed coincidences are swept again with a stride `factor`
+		times smaller (a single step if `factor` is zero), until the stride is a single step and the remaining
+		angles are solved with the exact tolerances. Since near-coincidences tend to cluster, refining directly
+		to a single step usually evaluates the fewest angles.
+		"""
+		
+		self.allSolutions = []
+		
+		# The norms are computed in single precision by `clattices_loop`, so that the cosine between Am and MBn
+		# has a relative error up to about 2^-21 and the angle computed with acos an absolute error up to sqrt(2*2^-21)
+		angleNoise = np.degrees (np.sqrt (2*2.0**-21))
+		
+		grid = self.angleGrid ()
+		nAngles = len (grid)
+		stride = max (int (self.refinement), 1)
+		
+		candidates = np.union1d (np.arange (0, nAngles, stride), [nAngles - 1]) if nAngles else np.arange (0)
+		self.anglesEvaluated = 0
+		self.candidates = 0
 		
-		# Read the solutions
-		with open ("coincidences.tmp", 'r') as f:
-			anglesBlock = [x for x in f.read().split('\n\n') if x]
+		while stride > 1 and len (candidates):
+			reach = stride//2
+			rotation = reach*self.angles[2]*(1 + 1e-6) + 1e-9
+			tolerance = self.tolerance + (1 + self.tolerance)*np.radians (rotation) + 1e-6
+			angle_tolerance = self.angle_tolerance + rotation + 2*angleNoise
 			
-			for x in anglesBlock:
-				lines = x.split('\n')
+			hits = self.solveAngles ([grid[i] for i in candidates], tolerance, angle_tolerance)
+			
+			# Sweeps the neighbourhood [i - reach, i + reach] of each angle i with relaxed coincidences
+			stride = max (stride//factor, 1) if factor else 1
+			neighbourhoods = [np.append (np.arange (i - reach, i + reach + 1, stride), i + reach) for i in candidates[np.unique (hits[:,0])]]
+			candidates = np.unique (np.concatenate (neighbourhoods)) if neighbourhoods else np.arange (0)
+			candidates = candidates[(candidates >= 0) & (candidates < nAngles)]
+		
+		hits = self.solveAngles ([grid[i] for i in candidates], self.tolerance, self.angle_tolerance)
+		
+		# Split the solutions by angle, using the index of each angle in the grid
+		indices = candidates[hits[:,0]]
+		bounds = np.searchsorted (indices, np.arange (nAngles + 1))
+		
+		for i, angle in enumerate (grid):
+			s = Solution (float ("%.2f" % angle))
+			s.solutions = hits[bounds[i]:bounds[i+1], 1:].tolist()
+			
+			self.allSolutions.append(s)
+		
+		return self.allSolutions
+	
+	def isHomobilayer (self):
+		"""
+		Returns True if both crystals have the same lattice vectors, as a crystal combined with itself.
+		"""
+		
+		return np.array_equal (np.asarray (self.crystal_1.latticeVectors), np.asarray (self.crystal_2.latticeVectors))
+	
+	def findHomobilayerSolutions (self):
+		"""
+		Finds the same solutions as `findGridSolutions` for two crystals with the same lattice, testing only
+		the vectors (m, n) and angles of the grid which may be coincident instead of sweeping the whole grid.
+		
+		The twisted bilayer is commensurate at the angles between two vectors of the lattice with the same norm,
+		e.g. the families indexed by coprime integers of hexagonal and square lattices, and nearly commensurate
+		at the angles between vectors with norms within `tolerance`. Since both crystals share the lattice, its
+		vectors are enumerated and sorted by norm once, and the pairs (Am, An) with similar norms are tested
+		by `solveVectorPairs`.
+		"""
+		
+		k, V = self.latticePoints (self.crystal_1.latticeVectors)
+		norm = np.hypot (V[:,0], V[:,1])
+		
+		order = np.argsort (norm, kind='stable')
+		k, V, norm = k[order], V[order], norm[order]
+		
+		# Pairs of vectors with |Am - MAn|/min(|Am|, |An|) < tolerance for some rotation
+		tolerance = self.tolerance*(1 + 1e-6) + 1e-6
+		lower = np.searchsorted (norm, norm/(1 + tolerance), side='left')
+		upper = np.searchsorted (norm, norm*(1 + tolerance), side='right')
+		
+		return self.solveVectorPairs (k, V, k, V, lower, upper)
+	
+	def latticeForm (self, lattice):
+		"""
+		Returns the integer quadratic form F and the scale s of a lattice whose vectors Ak have squared norms
+		s*(k.F.k), with k.F.k an even integer for integer vectors k, or None if there is no such form.
+		Any lattice whose Gram matrix is proportional to an integer matrix has such a form, including oblique and
+		rectangular lattices, e.g. with |a2|^2/|a1|^2 an integer. Hexagonal lattices give the norm form of the
+		Eisenstein integers, k1^2 +- k1*k2 + k2^2 (F = [[2, +-1], [+-1, 2]]), and square lattices the norm form of
+		the Gaussian integers, k1^2 + k2^2 (F = [[2, 0], [0, 2]]).
+		The entries of the Gram matrix are accepted within `formTolerance`*s of s*F (see `findIntegerFormSolutions`).
+		"""
+		
+		lattice = np.asarray (lattice, dtype=float)
+		gram = lattice.T.dot (lattice)
+		if gram[0,0] <= 0:
+			return None
+		
+		scale = gram[0,0]/2
+		form = gram/scale
+		if not np.allclose (form, np.rint (form), rtol=0, atol=self.formTolerance):
+			return None
+		
+		return np.rint (form).astype (np.int64), scale
+	
+	def hasIntegerForms (self):
+		"""
+		Returns True if the lattices of both crystals have integer norm forms (see `latticeForm`).
+		"""
+		
+		return self.latticeForm (self.crystal_1.latticeVectors) is not None and self.latticeForm (self.crystal_2.latticeVectors) is not None
+	
+	def findIntegerFormSolutions (self):
+		"""
+		Finds the same solutions as `findGridSolutions` for two crystals whose lattices have integer norm forms
+		(see `latticeForm`), e.g. hexagonal/hexagonal (Eisenstein integers) and square/square (Gaussian integers),
+		but also oblique and rectangular lattices with an integer Gram matrix.
+		
+		The squared norms of the vectors of each lattice are computed exactly as integers and the vectors are grouped
+		in shells, the representations of each norm value. A vector Am with norm value q can only be coincident with
+		the vectors Bn in the shells of norm values within the interval given by `tolerance` and the ratio of the scales
+		of both lattices, which are found by a binary search over the shells of B. The pairs of vectors of these
+		shells are tested by `solveVectorPairs`, so that no angle of the grid is swept.
+		
+		The Gram matrices of the lattices passed to `clattices_loop` (see `kernelLattices`) differ from s*F by up to
+		about `formTolerance`*s, so that the squared norm of a vector k differs from s*(k.F.k) by up to this error
+		times (|k1| + |k2|)^2 <= 4*Nmax^2. The interval of shells is widened by this error, so that the pairs which
+		only just fit the tolerance are not lost.
+		"""
+		
+		formA, scaleA = self.latticeForm (self.crystal_1.latticeVectors)
+		formB, scaleB = self.latticeForm (self.crystal_2.latticeVectors)
+		
+		m, Am = self.latticePoints (self.crystal_1.latticeVectors)
+		n, Bn = self.latticePoints (self.crystal_2.latticeVectors)
+		
+		# Exact integer norms k.F.k of the integer vectors of each lattice
+		qA = np.einsum ('ij,jk,ik->i', m, formA, m)
+		qB = np.einsum ('ij,jk,ik->i', n, formB, n)
+		
+		# The vectors of B are sorted by norm and, inside each shell, by polar angle
+		orderA = np.argsort (qA, kind='stable')
+		orderB = np.lexsort ((self.polarAngle (Bn), qB))
+		m, Am, qA = m[orderA], Am[orderA], qA[orderA]
+		n, Bn, qB = n[orderB], Bn[orderB], qB[orderB]
+		
+		# Shells of B: norm values and the position of their first vector
+		shellNorm, shellStart = np.unique (qB, return_index=True)
+		shellStart = np.append (shellStart, len (qB))
+		
+		# Largest error of the squared norms s*(k.F.k) of the lattices used by the kernel, over the box |k1| + |k2| <= 2*Nmax
+		A, B = self.kernelLattices ()
+		errorA = np.max (np.abs (np.dot (np.transpose (A), A) - scaleA*formA))*(np.abs (m[:,0]) + np.abs (m[:,1]))**2
+		errorB = np.max (np.abs (np.dot (np.transpose (B), B) - scaleB*formB))*4*self.Nmax**2
+		
+		# |Bn|/|Am| = sqrt(scaleB*qB/(scaleA*qA)) must lie within [1/(1 + tolerance), 1 + tolerance], up to the errors
+		tolerance = self.tolerance*(1 + 1e-6) + 1e-6
+		lower = ((scaleA*qA - errorA)/(1 + tolerance)**2 - errorB)/scaleB
+		upper = ((scaleA*qA + errorA)*(1 + tolerance)**2 + errorB)/scaleB
+		lowerShell = np.searchsorted (shellNorm, lower*(1 - 1e-12), side='left')
+		upperShell = np.searchsorted (shellNorm, upper*(1 + 1e-12), side='right')
+		
+		return self.solveVectorPairs (m, Am, n, Bn, lowerShell, upperShell, shells=shellStart)
+	
+	def solveVectorPairs (self, m, Am, n, Bn, lower, upper, shells=None, chunkSize=2**20):
+		"""
+		Finds the same solutions as `findGridSolutions` among the pairs of vectors (Am[i], Bn[j]) with lower[i] <= j < upper[i],
+		which must contain every pair with norms within `tolerance`. If the start of each shell of B is given in `shells`
+		(with the vectors of each shell sorted by polar angle), `lower` and `upper` are indices of shells instead, and only
+		the vectors Bn of these shells whose polar angle can reach the range of the grid are paired with each Am.
+		
+		MBn is parallel to Am for the angle phi(Bn) - phi(Am), since M rotates clockwise, so that each pair can
+		only be coincident at the angles of the grid within `angle_tolerance` of that angle (for every turn inside the
+		range of the grid). These candidates (angle index, m1, m2, n1, n2) are tested by `clattices_loop` with the same
+		test and ranges as the kernels, and the solutions are sorted in the order of the kernels. The angle tolerance
+		of the selection is widened by the rounding errors of the single precision test, as in `findRefinedSolutions`.
+		The pairs are processed in chunks of about `chunkSize`, so that the memory does not grow with the number of candidates.
+		"""
+		
+		self.allSolutions = []
+		self.anglesEvaluated = 0
+		self.candidates = 0
+		
+		angleNoise = np.degrees (np.sqrt (2*2.0**-21))
+		width = self.angle_tolerance + 2*angleNoise + 1e-9
+		
+		grid = np.asarray (self.angleGrid (), dtype=float)
+		nAngles = len (grid)
+		
+		phaseA = np.degrees (np.arctan2 (Am[:,1], Am[:,0]))
+		phaseB = np.degrees (np.arctan2 (Bn[:,1], Bn[:,0]))
+		
+		A, B = self.kernelLattices ()
+		maxNorm = self.maxVectorNorm ()
+		
+		if shells is not None:
+			shell = np.repeat (np.arange (len (shells) - 1), np.diff (shells))
+			key = shell*360.0 + self.polarAngle (Bn)
+			counts = np.maximum (shells[np.maximum (upper, lower)] - shells[lower], 0)
+		else:
+			counts = np.maximum (upper - lower, 0)
+		total = np.cumsum (counts)
+		
+		hits = [np.zeros ((0, 5), dtype=np.int32)]
+		evaluated = np.zeros (nAngles, dtype=bool)
+		
+		first = 0
+		while nAngles and first < len (counts):
+			last = max (int (np.searchsorted (total, total[first] - counts[first] + chunkSize, side='right')), first + 1)
+			if shells is not None:
+				iM, iN = self.shellPairs (np.arange (first, last), phaseA, key, shells, lower, upper, grid[0] - width, grid[-1] - grid[0] + 2*width)
+			else:
+				size = counts[first:last]
+				iM = np.repeat (np.arange (first, last), size)
+				iN = np.arange (size.sum()) - np.repeat (np.cumsum (size) - size, size) + np.repeat (lower[first:last], size)
+			
+			angle = grid[0] - width + np.mod (phaseB[iN] - phaseA[iM] - grid[0] + width, 360)
+			while angle.size and angle.min() - width <= grid[-1]:
+				start = np.searchsorted (grid, angle - width, side='left')
+				end = np.searchsorted (grid, angle + width, side='right')
+				steps = np.maximum (end - start, 0)
 				
-				s = Solution(float (lines.pop(0)))
-				for eachLine in lines:
-					if eachLine:
-						s.solutions.append([int (y) for y in eachLine.strip('\n').split(' ') if y])
+				pair = np.repeat (np.arange (len (angle)), steps)
+				index = np.arange (steps.sum()) - np.repeat (np.cumsum (steps) - steps, steps) + np.repeat (start, steps)
+				candidates = np.ascontiguousarray (np.column_stack ((index, m[iM[pair]], n[iN[pair]])), dtype=np.int32)
 				
-				self.allSolutions.append(s)
+				result = clattices_loop.clattices_solve_pairs (A, B, grid.tolist(), candidates, self.Nmax, self.tolerance, self.angle_tolerance, max_norm=maxNorm)
+				hits.append (np.asarray (result).reshape (-1, 5))
+				evaluated[index] = True
+				self.candidates += result.candidates
+				
+				angle = angle + 360
+			
+			first = last
+		
+		# Same order as the kernels: by angle index, then m1, m2, n1 and n2, sorted by a single key when it fits in 63 bits
+		hits = np.concatenate (hits)
+		base = 2*self.Nmax + 1
+		if float (nAngles)*base**4 < 2.0**62:
+			key = hits[:,0].astype (np.int64)
+			for column in range (1, 5):
+				key = key*base + (hits[:,column] + self.Nmax)
+			hits = hits[np.argsort (key, kind='stable')]
+		else:
+			hits = hits[np.lexsort (hits.T[::-1])]
 		
-		os.remove("lattices.tmp")
-		os.remove("coincidences.tmp")
+		self.anglesEvaluated = int (np.count_nonzero (evaluated))
+		bounds = np.searchsorted (hits[:,0], np.arange (nAngles + 1))
+		
+		for i, angle in enumerate (grid.tolist()):
+			s = Solution (float ("%.2f" % angle))
+			s.solutions = hits[bounds[i]:bounds[i+1], 1:].tolist()
+			
+			self.allSolutions.append(s)
 		
 		return self.allSolutions
 	
+	def polarAngle (self, vectors):
+		"""
+		Returns the polar angles of the given vectors in degrees, in the interval [0, 360).
+		"""
+		
+		angle = np.mod (np.degrees (np.arctan2 (vectors[:,1], vectors[:,0])), 360)
+		
+		# The modulo of tiny negative angles rounds to 360
+		return np.where (angle >= 360, angle - 360, angle)
+	
+	def shellPairs (self, indices, phaseA, key, shells, lower, upper, start, length):
+		"""
+		Returns the pairs (i, j) of vectors Am[i], for i in `indices`, and Bn[j] in the shells lower[i] <= k < upper[i] of B
+		such that phi(Bn[j]) - phi(Am[i]) lies in [start, start + length] modulo 360 degrees. The vectors of B are found
+		by a binary search of their `key`, the index of their shell times 360 plus their polar angle in [0, 360).
+		"""
+		
+		size = np.maximum (upper[indices] - lower[indices], 0)
+		iM = np.repeat (indices, size)
+		iS = np.arange (size.sum()) - np.repeat (np.cumsum (size) - size, size) + np.repeat (lower[indices], size)
+		
+		if length >= 360:
+			first, last = shells[iS], shells[iS + 1]
+		else:
+			# Polar angles of Bn in [begin, begin + length], wrapping around 360 degrees into a second interval
+			begin = np.mod (phaseA[iM] + start, 360)
+			end = begin + length
+			wrap = end >= 360
+			first = np.searchsorted (key, iS*360.0 + begin, side='left')
+			last = np.where (wrap, shells[iS + 1], np.searchsorted (key, iS*360.0 + end, side='right'))
+			
+			iM = np.concatenate ((iM, iM[wrap]))
+			first = np.concatenate ((first, shells[iS[wrap]]))
+			last = np.concatenate ((last, np.searchsorted (key, iS[wrap]*360.0 + end[wrap] - 360, side='right')))
+		
+		size = np.maximum (last - first, 0)
+		iN = np.arange (size.sum()) - np.repeat (np.cumsum (size) - size, size) + np.repeat (first, size)
+		
+		return np.repeat (iM, size), iN
+	
+	def latticePoints (self, lattice):
+		"""
+		Returns the integer vectors (k1, k2), with |k1|, |k2| <= Nmax and (k1, k2) != (0, 0),
+		and the cartesian vectors of the given lattice associated to them.
+		"""
+		
+		k = np.arange (-self.Nmax, self.Nmax + 1)
+		indices = np.stack (np.meshgrid (k, k, indexing='ij'), axis=-1).reshape (-1, 2)
+		indices = indices[np.any (indices != 0, axis=1)]
+		
+		return indices, indices.dot (np.asarray (lattice).T)
+	
+	def findAnalyticSolutions (self):
+		"""
+		Finds the solutions (m1, m2, n1, n2) of the eq. 11 without sweeping a grid of angles.
+		
+		The vectors Am and Bn of both crystals are enumerated up to `Nmax` and sorted by norm.
+		Each pair with |Am| and |Bn| within `tolerance` is a coincidence for the angle which rotates
+		Bn onto Am, namely the difference of their polar angles. The angles inside the range given
+		by `angles[0]` and `angles[1]` are sorted and grouped within `angle_tolerance`, each group
+		becoming a `Solution` at the mean angle of the group. The step `angles[2]` is not used.
+		The cost is O(N^2 log N) per combination and the angles found are continuous.
+		Vectors Am longer than `maxVectorNorm` are discarded.
+		"""
+		
+		self.allSolutions = []
+		
+		m, Am = self.latticePoints (self.crystal_1.latticeVectors)
+		n, Bn = self.latticePoints (self.crystal_2.latticeVectors)
+		
+		normA = np.hypot (Am[:,0], Am[:,1])
+		normB = np.hypot (Bn[:,0], Bn[:,1])
+		
+		maxNorm = self.maxVectorNorm ()
+		if maxNorm > 0:
+			m, Am, normA = m[normA <= maxNorm], Am[normA <= maxNorm], normA[normA <= maxNorm]
+		
+		# Norm shells: |Am - MBn|/min(|Am|, |MBn|) < tolerance when both vectors are parallel
+		order = np.argsort (normB)
+		normB_sorted = normB[order]
+		lower = np.searchsorted (normB_sorted, normA/(1 + self.tolerance), side='right')
+		upper = np.searchsorted (normB_sorted, normA*(1 + self.tolerance), side='left')
+		counts = np.maximum (upper - lower, 0)
+		
+		iA = np.repeat (np.arange (len (normA)), counts)
+		offsets = np.repeat (np.cumsum (counts) - counts, counts)
+		iB = order[np.arange (counts.sum()) - offsets + np.repeat (lower, counts)]
+		self.candidates = int (counts.sum())
+		
+		# M rotates clockwise by the angle, so MBn is parallel to Am for angle = phi(Bn) - phi(Am)
+		angle = np.degrees (np.arctan2 (Bn[iB,1], Bn[iB,0]) - np.arctan2 (Am[iA,1], Am[iA,0]))
+		angle = self.angles[0] + np.mod (angle - self.angles[0], 360)
+		
+		# Copies of the angles for ranges larger than 360 degrees
+		copies = [angle]
+		while copies[-1].size and copies[-1].min() + 360 <= self.angles[1]:
+			copies.append (copies[-1] + 360)
+		angle = np.concatenate (copies)
+		iA = np.tile (iA, len (copies))
+		iB = np.tile (iB, len (copies))
+		
+		inside = angle <= self.angles[1]
+		angle, iA, iB = angle[inside], iA[inside], iB[inside]
+		
+		order = np.lexsort ((iB, iA, angle))
+		angle, iA, iB = angle[order], iA[order], iB[order]
+		
+		# Groups the angles within angle_tolerance from the first angle of each group
+		start = 0
+		while start < len (angle):
+			end = np.searchsorted (angle, angle[start] + self.angle_tolerance, side='left')
+			end = max (end, start + 1)
+			
+			s = Solution (float (np.mean (angle[start:end])))
+			s.solutions = np.hstack ((m[iA[start:end]], n[iB[start:end]])).tolist()
+			self.allSolutions.append (s)
+			
+			start = end
+		
+		return self.allSolutions
+	
+	def findMinimumAreaPair (self, solutions, chunkSize=2**20):
+		"""
+		Finds the pair of solutions (m1, m2, n1, n2), (m1', m2', n1', n2') of a single angle
+		which has minimum area |m x m'| >= 1, considering only pairs (i, j) with i < j.
+		If both crystals are hexagonal, the vectors Am and Am' must also make an angle of 60 degrees.
+		Ties are resolved in favour of the last pair, as in a loop over i < j.
+		All pairs are evaluated with array operations, in blocks of about `chunkSize` pairs.
+		Returns an empty list if no pair is found.
+		"""
+		
+		S = np.asarray (solutions)
+		k = len (S)
+		if k < 2:
+			return []
+		
+		A = np.asarray (self.crystal_1.latticeVectors)
+		x = S[:,0]*A[0,0] + S[:,1]*A[0,1]
+		y = S[:,0]*A[1,0] + S[:,1]*A[1,1]
+		norm = np.sqrt (x*x + y*y)
+		
+		hexagonal = self.crystal_1.bravaisLattice == "hexagonal" and self.crystal_2.bravaisLattice == "hexagonal"
+		
+		minArea = None
+		minAreaPair = []
+		
+		j = np.arange (k)
+		rows = max (1, chunkSize // k)
+		for start in range (0, k, rows):
+			i = np.arange (start, min (start + rows, k))[:,np.newaxis]
+			
+			area = S[i,0]*S[j,1] - S[j,0]*S[i,1]
+			valid = (j > i) & (area >= 1)
+			
+			if hexagonal:
+				# To prevent rounding errors when using arccos
+				with np.errstate (invalid='ignore', divide='ignore'):
+					cosAngleVectors = np.clip ((x[i]*x[j] + y[i]*y[j])/(norm[i]*norm[j]), -1, 1)
+					angleVectors = np.arccos (cosAngleVectors)*180/np.pi
+					valid &= np.abs (angleVectors - 60) < self.tolerance
+			
+			if not valid.any():
+				continue
+			
+			blockMinimum = area[valid].min()
+			if minArea is None or blockMinimum <= minArea:
+				minArea = blockMinimum
+				last = np.flatnonzero (valid & (area == blockMinimum))[-1]
+				row, column = np.unravel_index (last, area.shape)
+				minAreaPair = [solutions[start + row], solutions[column]]
+		
+		return minAreaPair
+	
+	def gaussReduction (self, u, v):
+		"""
+		Lagrange-Gauss reduction of the basis (u, v) of solutions (m1, m2, n1, n2), using the metric
+		of the first crystal for the m part. The n part is carried along by the same integer operations.
+		Returns the reduced basis (u, v) with |Au| <= |Av|.
+		"""
+		
+		A = np.asarray (self.crystal_1.latticeVectors)
+		G = A.T.dot (A)
+		dot = lambda p, q: p[:2].dot (G).dot (q[:2])
+		
+		if dot (u, u) > dot (v, v):
+			u, v = v, u
+		
+		while True:
+			q = int (round (dot (u, v)/dot (u, u)))
+			v = v - q*u
+			if dot (v, v) >= dot (u, u):
+				break
+			u, v = v, u
+		
+		return u, v
+	
+	def findReducedPair (self, solutions):
+		"""
+		Finds a basis (m1, m2, n1, n2), (m1', m2', n1', n2') of the coincidence sublattice formed by the
+		solutions of a single angle, with minimum area |m x m'| >= 1, in about linear time.
+		
+		The shortest solution u is primitive in the sublattice, so the solution v with the smallest
+		nonzero |u x v| completes a basis of it. The basis is then Gauss-reduced. If both crystals
+		are hexagonal, the second vector is chosen among v, u + v and u - v (and their opposites)
+		such that Au and Av make an angle of 60 degrees, as in `findMinimumAreaPair`.
+		
+		With finite tolerances the solutions may not form a sublattice. The basis is only accepted if both
+		vectors are solutions and every solution is an integer combination of them, in which case no pair
+		of solutions has a smaller area. Otherwise, the pair is searched with `findMinimumAreaPair`.
+		"""
+		
+		S = np.asarray (solutions, dtype=np.int64)
+		if len (S) < 2:
+			return []
+		
+		A = np.asarray (self.crystal_1.latticeVectors)
+		Am = S[:,:2].dot (A.T)
+		normSquared = np.sum (Am**2, axis=1)
+		
+		u = S[np.argmin (normSquared)]
+		cross = np.abs (u[0]*S[:,1] - S[:,0]*u[1])
+		if not np.any (cross):
+			return []
+		
+		candidates = np.flatnonzero (cross == cross[cross > 0].min())
+		v = S[candidates[np.argmin (normSquared[candidates])]]
+		
+		u, v = self.gaussReduction (u, v)
+		
+		# Coordinates of all solutions in the basis (u, v), which must be integers
+		area = u[0]*v[1] - v[0]*u[1]
+		a = S[:,0]*v[1] - v[0]*S[:,1]
+		b = u[0]*S[:,1] - S[:,0]*u[1]
+		if np.any (a % area) or np.any (b % area) or np.any (S != np.outer (a // area, u) + np.outer (b // area, v)):
+			return self.findMinimumAreaPair (solutions)
+		
+		if self.crystal_1.bravaisLattice == "hexagonal" and self.crystal_2.bravaisLattice == "hexagonal":
+			Au = A.dot (u[:2])
+			found = False
+			for w in [v, u + v, u - v, -v, -u - v, v - u]:
+				if u[0]*w[1] - w[0]*u[1] < 1:
+					continue
+				
+				Aw = A.dot (w[:2])
+				cosAngleVectors = min (max (Au.dot (Aw)/(np.linalg.norm (Au)*np.linalg.norm (Aw)), -1), 1)
+				if abs (np.arccos (cosAngleVectors)*180/np.pi - 60) < self.tolerance:
+					v = w
+					found = True
+					break
+			
+			if not found:
+				return self.findMinimumAreaPair (solutions)
+		elif u[0]*v[1] - v[0]*u[1] < 0:
+			v = -v
+		
+		if not np.all (S == u, axis=1).any() or not np.all (S == v, axis=1).any():
+			return self.findMinimumAreaPair (solutions)
+		
+		return [[int (x) for x in u], [int (x) for x in v]]
+	
 	def findMinimumArea (self):
 		"""
 		Finds a pair of linearly independent solutions (m1, m2, n1, n2), (m1', m2', n1', n2')
 		which has minimum area. For each angle, minimizes |m x m'|. 
+		The pair is found by `findMinimumAreaPair` or `findReducedPair`, according to `supercellSearch`.
+		The supercells are returned as a `SupercellTable`.
 		"""
 		
-		a1 = self.crystal_1.latticeVectors[:,0]
-		a2 = self.crystal_1.latticeVectors[:,1]
-		
-		self.supercell = []
+		angles = []
+		pairs = []
 		for s in self.allSolutions:
 			
-			minArea = sys.maxsize
-			minAreaPair = []
-			
-			for i in range (len (s.solutions)):
-				for j in range (i+1, len (s.solutions)):
-					m1 = s.solutions[i][0]
-					m2 = s.solutions[i][1]
-					
-					m1_prime = s.solutions[j][0]
-					m2_prime = s.solutions[j][1]
-					
-					Am = m1*a1 + m2*a2
-					Am_prime = m1_prime*a1 + m2_prime*a2
-					
-					area = m1*m2_prime - m1_prime*m2
-					
-					normAm = np.linalg.norm(Am)
-					normAm_prime = np.linalg.norm(Am_prime)
-					
-					# To prevent rounding errors when using arcsin
-					cosAngleVectors = (np.transpose(Am)*Am_prime).item(0,0)/(normAm*normAm_prime)
-					if cosAngleVectors > 1:
-						cosAngleVectors = 1
-					elif cosAngleVectors < -1:
-						cosAngleVectors = -1
-						
-					angleVectors = np.arccos(cosAngleVectors)*180/np.pi
-					
-					if self.crystal_1.bravaisLattice == "hexagonal" and self.crystal_2.bravaisLattice == "hexagonal":
-						if  area >= 1 and area <= minArea and abs(angleVectors - 60) < self.tolerance:
-							minArea = area
-							minAreaPair = [s.solutions[i], s.solutions[j]]
-					elif  area >= 1 and area <= minArea:
-						minArea = area
-						minAreaPair = [s.solutions[i], s.solutions[j]]
+			if self.supercellSearch == "reduction":
+				minAreaPair = self.findReducedPair (s.solutions)
+			else:
+				minAreaPair = self.findMinimumAreaPair (s.solutions)
 			
 			if minAreaPair:
-				minAreaSolution = Solution (s.angle)
-				minAreaSolution.solutions = minAreaPair
-				
-				cell = Supercell (minAreaSolution, self)
-				self.supercell.append (cell)
+				angles.append (s.angle)
+				pairs.append (minAreaPair)
+		
+		self.supercell = SupercellTable (angles, pairs, self)
 		
 		return self.supercell
 		
@@ -1,5 +1,8 @@
 import sys
 import re
+import os
+import csv
+import json
 import numpy as np
 
 class Crystal (object):
@@ -17,11 +20,13 @@ class Crystal (object):
 	2.467
 	"""
 	
-	def __init__ (self, filename):
+	def __init__ (self, filename, lines=None):
 		"""
 		Initializes the 2D crystal by associating it to the `filename` given as argument.
 		Each `filename` must contain a label for the material, the number of atoms inside the unit cell,
 		the Bravais lattice and the lattice parameter.
+		The file is read only once. If the list `lines` is given, the description is taken from it
+		instead and `filename` is only used to identify the crystal in messages.
 		"""
 		
 		self.filename = filename
@@ -29,12 +34,15 @@ class Crystal (object):
 		The input file which describes the 2D crystal.
 		"""
 		
-		self.label = self.getLabel ()
+		if lines is None:
+			lines = self.readLines ()
+		
+		self.label = self.getLabel (lines)
 		"""
 		The label of the 2D crystal.
 		"""
 		
-		self.nAtoms = self.getNatoms ()
+		self.nAtoms = self.getNatoms (lines)
 		"""
 		The number of atoms inside the 2D crystal unit cell.
 		"""
@@ -44,16 +52,16 @@ class Crystal (object):
 		The Bravais lattice of the 2D crystal: square, rectangular, oblique and hexagonal.
 		"""
 		
-		self.latticeVectors = self.getBravaisLattice ()
+		self.latticeVectors = self.getBravaisLattice (lines)
 		"""
 		The Bravais lattice of the 2D crystal denoted by the matrix A (or B) shown Eq. 11 of the paper.
 		"""
 		
-	def getLabel (self):
+	def readLines (self):
 		"""
-		Reads the label of the 2D crystal given in `filename`. The label must
-		be the first line in the file.
+		Reads all lines of the file `filename`.
 		"""
+		
 		try:
 			with open (self.filename, 'r') as f:
 				lines = f.readlines()
@@ -61,20 +69,27 @@ class Crystal (object):
 			print ("File " + self.filename + "not found! Please check the arguments!\n")
 			sys.exit(1)
 		
+		return lines
+	
+	def getLabel (self, lines=None):
+		"""
+		Reads the label of the 2D crystal given in `filename` (or in `lines`, if given). The label must
+		be the first line in the file.
+		"""
+		
+		if lines is None:
+			lines = self.readLines ()
+		
 		return lines[0].strip('\n')
 	
-	def getNatoms (self):
+	def getNatoms (self, lines=None):
 		"""
-		Reads the number of atoms inside the unit cell of the 2D crystal given in `filename`.
+		Reads the number of atoms inside the unit cell of the 2D crystal given in `filename` (or in `lines`, if given).
 		This information must be the second line in the file.
 		"""
 		
-		try:
-			with open (self.filename, 'r') as f:
-				lines = f.readlines()
-		except FileNotFoundError:
-			print ("File " + self.filename + "not found! Please check the arguments!\n")
-			sys.exit(1)
+		if lines is None:
+			lines = self.readLines ()
 		
 		try:
 			nAtoms = int(lines[1])
@@ -84,9 +99,9 @@ class Crystal (object):
 			
 		return nAtoms
 	
-	def getBravaisLattice (self):
+	def getBravaisLattice (self, lines=None):
 		"""
-		Reads the Bravais Lattice of the 2D crystal given in `filename`.
+		Reads the Bravais Lattice of the 2D crystal given in `filename` (or in `lines`, if given).
 		This information must be the third and fourth line of the file.
 		
 		Accepted values are: Oblique, Rectangular, Hexagonal and Square (non-case sensitive).
@@ -100,12 +115,8 @@ class Crystal (object):
 		
 		BravaisLattices = ['oblique', 'rectangular', 'hexagonal','square']
 		
-		try:
-			with open (self.filename, 'r') as f:
-				lines = f.readlines()
-		except FileNotFoundError:
-			print ("File " + self.filename + "not found! Please check the arguments!\n")
-			sys.exit(1)
+		if lines is None:
+			lines = self.readLines ()
 		
 		latticeName = re.sub('[\n\s]', '', lines[2].lower())
 		if latticeName not in BravaisLattices:
@@ -173,5 +184,72 @@ class Crystal (object):
 		
 		return lattice
 		
+
+databaseFormats = {'.json': None, '.csv': ',', '.tsv': '\t'}
+"""
+Extensions of the database files holding many crystals and their delimiters (`None` for JSON).
+"""
+
+def loadDatabase (filename):
+	"""
+	Loads all 2D crystals described in a single database file, which is read only once.
+	
+	The format is given by the extension of `filename`. A JSON file must contain a list of objects such as
+	`{"label": "Ph", "n_atoms": 4, "lattice": "Rectangular", "parameters": [4.504, 3.305]}`.
+	CSV and TSV files must have a header with the columns `label`, `n_atoms`, `lattice` and `parameters`,
+	the parameters being separated by spaces. Each crystal is identified as `filename:entry` in messages.
+	"""
+	
+	delimiter = databaseFormats[os.path.splitext (filename)[1].lower()]
+	
+	try:
+		with open (filename, 'r') as f:
+			if delimiter is None:
+				records = json.load (f)
+			else:
+				records = list (csv.DictReader (f, delimiter=delimiter))
+	except FileNotFoundError:
+		print ("File " + filename + "not found! Please check the arguments!\n")
+		sys.exit(1)
+	except ValueError:
+		print ("Invalid database of 2D crystals: " + filename + "\n")
+		sys.exit(14)
+	
+	crystals = []
+	for i, record in enumerate (records if isinstance (records, list) else []):
+		try:
+			parameters = record['parameters']
+			if not isinstance (parameters, str):
+				parameters = " ".join (str (x) for x in parameters)
+			
+			lines = [str (record['label']), str (record['n_atoms']), str (record['lattice']), parameters]
+		except (KeyError, TypeError):
+			print ("Invalid entry %d in the database %s: label, n_atoms, lattice and parameters are required\n" % (i + 1, filename))
+			sys.exit(15)
+		
+		crystals.append (Crystal ("%s:%d" % (filename, i + 1), lines=lines))
+	
+	return crystals
+
+def loadCrystals (filenames):
+	"""
+	Loads the 2D crystals described in the given files, in order. Files with an extension listed in
+	`databaseFormats` are read as databases with many crystals (see `loadDatabase`), while all other
+	files describe a single crystal.
+	"""
 	
+	crystals = []
+	for filename in filenames:
+		if os.path.splitext (filename)[1].lower() in databaseFormats:
+			crystals.extend (loadDatabase (filename))
+		else:
+			crystals.append (Crystal (filename))
+	
+	return crystals
+
+def latticeArray (crystals):
+	"""
+	Returns the lattice vectors of the given crystals stacked in an array of shape (n, 2, 2).
+	"""
 	
+	return np.array ([np.asarray (c.latticeVectors) for c in crystals], dtype=float).reshape (-1, 2, 2)
@@ -1,3 +1,6 @@
+import os
+import re
+
 class Printer (object):
 	"""
 	Base class to print all information from the investigation to the output.
@@ -51,24 +54,76 @@ class Printer (object):
 		"""
 		Spacing for the sixth column
 		"""
+		
+		self.stream = None
+		"""
+		Output file kept open by `open` to stream the results, or `None` if the file is reopened at each call.
+		"""
+		
+	def open (self, bufferSize=1024*1024):
+		"""
+		Opens (and truncates) the output file and keeps it open, so that each list of supercells
+		is written as soon as it is printed, through a buffer of `bufferSize` bytes.
+		Returns the printer itself, which can be used in a `with` statement to close the file.
+		"""
+		
+		self.stream = open (self.outputFile, 'w', buffering=bufferSize)
+		return self
+		
+	def flush (self, sync=False):
+		"""
+		Flushes the buffered output to the output file kept open by `open`.
+		If `sync` is True, also forces the operating system to write it to disk.
+		"""
+		
+		if self.stream is not None:
+			self.stream.flush()
+			if sync:
+				os.fsync (self.stream.fileno())
+		
+	def close (self):
+		"""
+		Closes the output file kept open by `open`.
+		"""
+		
+		if self.stream is not None:
+			self.stream.close()
+			self.stream = None
+		
+	def __enter__ (self):
+		return self
+		
+	def __exit__ (self, *args):
+		self.close()
+		
 	def printMatrixNotationHeader (self):
 		"""
 		Prints the header of the output table using a matrix notation.
 		"""
 		
-		with open (self.outputFile, 'w') as f:
-			f.write (self.columnTitle.ljust(self.spaceCol_1))
-			f.write ("[  m1   m1']".rjust(self.spaceCol_2))
-			f.write ("[  n1   n1']".rjust(self.spaceCol_3))
-			f.write ("angle (deg)".rjust(self.spaceCol_4))
-			f.write ("N".rjust(self.spaceCol_5))
-			f.write ("e (%)".rjust(self.spaceCol_6))
-			f.write ("\n")
-			f.write ("".rjust(self.spaceCol_1))
-			f.write ("[  m2   m2']".rjust(self.spaceCol_2))
-			f.write ("[  n2   n2']".rjust(self.spaceCol_3))
-			f.write ("".rjust(self.spaceCol_4 + self.spaceCol_5 + self.spaceCol_6))
-			f.write ("\n\n")
+		if self.stream is not None:
+			self.writeMatrixNotationHeader (self.stream)
+		else:
+			with open (self.outputFile, 'w') as f:
+				self.writeMatrixNotationHeader (f)
+		
+	def writeMatrixNotationHeader (self, f):
+		"""
+		Writes the header of the output table using a matrix notation to the file object `f`.
+		"""
+		
+		f.write (self.columnTitle.ljust(self.spaceCol_1))
+		f.write ("[  m1   m1']".rjust(self.spaceCol_2))
+		f.write ("[  n1   n1']".rjust(self.spaceCol_3))
+		f.write ("angle (deg)".rjust(self.spaceCol_4))
+		f.write ("N".rjust(self.spaceCol_5))
+		f.write ("e (%)".rjust(self.spaceCol_6))
+		f.write ("\n")
+		f.write ("".rjust(self.spaceCol_1))
+		f.write ("[  m2   m2']".rjust(self.spaceCol_2))
+		f.write ("[  n2   n2']".rjust(self.spaceCol_3))
+		f.write ("".rjust(self.spaceCol_4 + self.spaceCol_5 + self.spaceCol_6))
+		f.write ("\n\n")
 		
 	def printMatrixNotation (self, supercellList, maxAtoms):
 		"""
@@ -77,29 +132,82 @@ class Printer (object):
 		supercells written to file.
 		"""
 		
+		if self.stream is not None:
+			return self.writeMatrixNotation (self.stream, supercellList, maxAtoms)
+		
+		with open (self.outputFile, 'a') as f:
+			return self.writeMatrixNotation (f, supercellList, maxAtoms)
+		
+	def writeMatrixNotation (self, f, supercellList, maxAtoms):
+		"""
+		Writes the list of supercells given to the file object `f` using a matrix notation.
+		Returns the number of supercells written.
+		"""
+		
 		nCombinations = 0
-		with open (self.outputFile, 'a') as f:		
-			for s in supercellList:
-				if s.nAtoms <= maxAtoms:
-					f.write (("%s/%s" % (s.label_1, s.label_2)).ljust(self.spaceCol_1) )
-					f.write (("[% 4d  % 4d]" % (s.solutions[0][0], s.solutions[1][0])).rjust(self.spaceCol_2))
-					f.write (("[% 4d  % 4d]" % (s.solutions[0][2], s.solutions[1][2])).rjust(self.spaceCol_3))
-					f.write (("%2.1f" % s.angle).rjust(self.spaceCol_4))
-					f.write (("%d" % s.nAtoms).rjust(self.spaceCol_5))
-					f.write (("% 1.2f" % (100*s.strain[0])).rjust(self.spaceCol_6))
-					f.write ("\n")
-					f.write ("".rjust(self.spaceCol_1))
-					f.write (("[% 4d  % 4d]" % (s.solutions[0][1], s.solutions[1][1])).rjust(self.spaceCol_2))
-					f.write (("[% 4d  % 4d]" % (s.solutions[0][3], s.solutions[1][3])).rjust(self.spaceCol_3))
-					f.write ("".rjust(self.spaceCol_4 + self.spaceCol_5))
-					f.write (("% 1.2f" % (100*s.strain[1])).rjust(self.spaceCol_6))
-					f.write ("\n\n")
-					
-					nCombinations += 1
-					
+		for s in supercellList:
+			if s.nAtoms <= maxAtoms:
+				f.write (("%s/%s" % (s.label_1, s.label_2)).ljust(self.spaceCol_1) )
+				f.write (("[% 4d  % 4d]" % (s.solutions[0][0], s.solutions[1][0])).rjust(self.spaceCol_2))
+				f.write (("[% 4d  % 4d]" % (s.solutions[0][2], s.solutions[1][2])).rjust(self.spaceCol_3))
+				f.write (("%2.1f" % s.angle).rjust(self.spaceCol_4))
+				f.write (("%d" % s.nAtoms).rjust(self.spaceCol_5))
+				f.write (("% 1.2f" % (100*s.strain[0])).rjust(self.spaceCol_6))
+				f.write ("\n")
+				f.write ("".rjust(self.spaceCol_1))
+				f.write (("[% 4d  % 4d]" % (s.solutions[0][1], s.solutions[1][1])).rjust(self.spaceCol_2))
+				f.write (("[% 4d  % 4d]" % (s.solutions[0][3], s.solutions[1][3])).rjust(self.spaceCol_3))
+				f.write ("".rjust(self.spaceCol_4 + self.spaceCol_5))
+				f.write (("% 1.2f" % (100*s.strain[1])).rjust(self.spaceCol_6))
+				f.write ("\n\n")
+				
+				nCombinations += 1
+				
 		return nCombinations
 			
 
+matrixNotationLine = re.compile (r"^(.*?)\s*\[\s*(-?\d+)\s+(-?\d+)\]\s*\[\s*(-?\d+)\s+(-?\d+)\]\s+(\S+)\s+(-?\d+)\s+(\S+)\s*$")
+"""
+First line of a supercell in the matrix notation: label, m1, m1', n1, n1', angle, N and strain of the first vector.
+"""
+
+matrixNotationContinuation = re.compile (r"^\s*\[\s*(-?\d+)\s+(-?\d+)\]\s*\[\s*(-?\d+)\s+(-?\d+)\]\s+(\S+)\s*$")
+"""
+Second line of a supercell in the matrix notation: m2, m2', n2, n2' and strain of the second vector.
+"""
+
+def readMatrixNotation (filename):
+	"""
+	Reads a table written by `Printer.printMatrixNotation` and returns a list of dictionaries, one for each
+	supercell, with the keys `label_1`, `label_2`, `solutions` (the pair [(m1, m2, n1, n2), (m1', m2', n1', n2')]),
+	`angle`, `nAtoms` and `strain` (in %), with the precision printed in the table.
+	"""
+	
+	with open (filename) as f:
+		lines = f.read().splitlines()
+	
+	supercells = []
+	for i, line in enumerate (lines[:-1]):
+		first = matrixNotationLine.match (line)
+		second = matrixNotationContinuation.match (lines[i+1])
+		if first is None or second is None:
+			continue
+		
+		label_1, _, label_2 = first.group(1).partition ("/")
+		m1, m1_prime, n1, n1_prime = [int (x) for x in first.group (2, 3, 4, 5)]
+		m2, m2_prime, n2, n2_prime = [int (x) for x in second.group (1, 2, 3, 4)]
+		
+		supercells.append ({
+			'label_1': label_1,
+			'label_2': label_2,
+			'solutions': [[m1, m2, n1, n2], [m1_prime, m2_prime, n1_prime, n2_prime]],
+			'angle': float (first.group (6)),
+			'nAtoms': int (first.group (7)),
+			'strain': [float (first.group (8)), float (second.group (5))],
+		})
+	
+	return supercells
+
 class LaTeX_printer (object):
 	"""
 	Base class to print all information from the investigation to the output.
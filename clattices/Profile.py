@@ -0,0 +1,84 @@
+import csv
+import json
+import os
+
+def statistics (combination, supercells, times):
+	"""
+	Returns a dictionary with the statistics of a solved combination: the time of each stage in `times`,
+	the angles and vectors (m, n) evaluated by the kernel, the solutions found at each angle and the number of supercells.
+	"""
+	
+	hitsPerAngle = [len (s.solutions) for s in combination.allSolutions]
+	
+	record = {
+		'label_1': combination.crystal_1.label,
+		'label_2': combination.crystal_2.label,
+		'kernel': combination.kernel,
+		'cached': combination.fromCache,
+		'angles': len (hitsPerAngle),
+		'angles_evaluated': combination.anglesEvaluated,
+		'candidates': combination.candidates,
+		'hits': sum (hitsPerAngle),
+		'angles_with_hits': sum (1 for n in hitsPerAngle if n),
+		'max_hits_per_angle': max (hitsPerAngle) if hitsPerAngle else 0,
+		'hits_per_angle': hitsPerAngle,
+		'supercells': len (supercells),
+	}
+	
+	for stage, t in times.items():
+		record['time_' + stage] = t
+	
+	return record
+
+class Profile (object):
+	"""
+	Report with the statistics of each combination, written as JSON or CSV according to the extension of `outputFile`.
+	"""
+	
+	columns = ['label_1', 'label_2', 'kernel', 'cached', 'angles', 'angles_evaluated', 'candidates', 'hits', 'angles_with_hits',
+			   'max_hits_per_angle', 'supercells', 'supercells_kept', 'time_solutions', 'time_supercells', 'time_output', 'time_total']
+	"""
+	Columns of the CSV report. The JSON report also has the list `hits_per_angle` for each combination.
+	"""
+	
+	def __init__ (self, outputFile):
+		"""
+		Initializes an empty report.
+		"""
+		
+		self.outputFile = outputFile
+		"""
+		File where the report is written.
+		"""
+		
+		self.records = []
+		"""
+		Statistics of each combination, as returned by `statistics`.
+		"""
+	
+	def add (self, record, outputTime, kept):
+		"""
+		Adds the statistics of a combination, with the time spent writing its supercells and
+		the number of supercells kept after the filter of the number of atoms.
+		"""
+		
+		record = dict (record)
+		record['time_output'] = outputTime
+		record['supercells_kept'] = kept
+		record['time_total'] = record.get ('time_solutions', 0) + record.get ('time_supercells', 0) + outputTime
+		
+		self.records.append (record)
+	
+	def write (self):
+		"""
+		Writes the report to `outputFile`, as CSV if its extension is .csv and as JSON otherwise.
+		"""
+		
+		if os.path.splitext (self.outputFile)[1].lower() == '.csv':
+			with open (self.outputFile, 'w', newline='') as f:
+				writer = csv.DictWriter (f, fieldnames=self.columns, extrasaction='ignore')
+				writer.writeheader()
+				writer.writerows (self.records)
+		else:
+			with open (self.outputFile, 'w') as f:
+				json.dump ({'combinations': self.records}, f, indent=1)
@@ -0,0 +1,97 @@
+import collections
+import multiprocessing
+from . import Crystal
+from . import Combination
+
+def pairs (crystals, selfCombinations=False, first=False):
+	"""
+	Yields the pairs of crystals screened, in the order of the command line: each crystal with the following ones,
+	also with itself if `selfCombinations` is True, and only for the first crystal if `first` is True.
+	"""
+	
+	for i in range (len (crystals) if not first else min (1, len (crystals))):
+		for j in range (i if selfCombinations else i + 1, len (crystals)):
+			yield crystals[i], crystals[j]
+
+def solve (combination):
+	"""
+	Finds the supercells of minimum area of a combination. Returns the combination, solved, and its supercells,
+	which are `None` if it does not fit in the memory available.
+	"""
+	
+	try:
+		combination.findSolutions()
+		return combination, combination.findMinimumArea()
+	except MemoryError:
+		return combination, None
+
+def solveTable (combination, maxAtoms):
+	"""
+	Finds the supercells of a combination in a worker process and returns only the ones with at most `maxAtoms` atoms,
+	as a `Combination.SupercellTable`, or `None` if it does not fit in the memory available. The solutions of the
+	combination are not returned, so that only the supercells are sent back to the parent process.
+	"""
+	
+	combination, supercells = solve (combination)
+	if supercells is None:
+		return None
+	
+	kept = supercells.nAtoms <= maxAtoms
+	return Combination.SupercellTable (supercells.angle[kept], supercells.solutions[kept], combination)
+
+def screen (crystals, angles, limits, maxAtoms=100, selfCombinations=False, first=False, kernel="brute", threads=0, supercellSearch="pairwise", cache=None, refinement=0, fastPath=True, fold="none", jobs=1):
+	"""
+	Screens the combinations of a library of crystals, yielding each combination with its supercells of at most
+	`maxAtoms` atoms as soon as it is solved, in the order given by `pairs`.
+	
+	The crystals are `Crystal.Crystal` objects or the files describing them (see `Crystal.loadCrystals`), and
+	`angles` = [min, max, step] and `limits` = [N, tolerance, angle tolerance] are given as for `Combination.Combination`,
+	as well as the other search parameters. The combinations are solved lazily, so that only the solutions of the combination
+	yielded are kept in memory, and the caller can stop at any time. With `jobs` worker processes, at most `jobs` combinations
+	are solved or waiting to be yielded at a time, and the workers only send back the supercells: the combinations yielded
+	are then the ones created in this process, without their solutions.
+	Combinations which do not fit in the memory available are yielded with an empty list of supercells.
+	With several worker processes, `threads` = 0 (all processors) is replaced by one thread per process.
+	
+	Example:
+		
+		for combination, supercells in clattices.screen (["Graphene", "hBN", "MoS2"], [0, 30, 0.1], [7, 0.02, 0.05]):
+			for s in supercells:
+				print (s.label_1, s.label_2, s.angle, s.nAtoms, s.strain)
+	"""
+	
+	# Avoids running one thread per processor inside each worker process
+	if jobs != 1 and threads == 0:
+		threads = 1
+	
+	library = []
+	for c in crystals:
+		if isinstance (c, Crystal.Crystal):
+			library.append (c)
+		else:
+			library.extend (Crystal.loadCrystals ([c]))
+	
+	combinations = (Combination.Combination ([crystal_1, crystal_2], angles, limits, kernel=kernel, threads=threads, supercellSearch=supercellSearch, cache=cache, refinement=refinement, fastPath=fastPath, fold=fold)
+					for crystal_1, crystal_2 in pairs (library, selfCombinations, first))
+	
+	if jobs == 1:
+		for c in combinations:
+			c, supercells = solve (c)
+			yield c, [s for s in supercells if s.nAtoms <= maxAtoms] if supercells is not None else []
+	else:
+		# The supercells are solved by the worker processes and yielded in the original order. A new combination
+		# is only submitted when the oldest one is yielded, so that the results do not pile up if the caller is slow
+		nProcesses = jobs if jobs > 0 else multiprocessing.cpu_count ()
+		pending = collections.deque ()
+		with multiprocessing.Pool (nProcesses) as pool:
+			for c in combinations:
+				pending.append ((c, pool.apply_async (solveTable, (c, maxAtoms))))
+				if len (pending) >= nProcesses:
+					c, result = pending.popleft ()
+					supercells = result.get ()
+					yield c, list (supercells) if supercells is not None else []
+			
+			while pending:
+				c, result = pending.popleft ()
+				supercells = result.get ()
+				yield c, list (supercells) if supercells is not None else []
@@ -0,0 +1,292 @@
+import sys
+import json
+import collections
+import multiprocessing
+import signal
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qsl
+from . import Combination
+
+def solve (combination):
+	"""
+	Finds the supercells of minimum area of a combination in a worker process. Returns the supercells
+	as a list of dictionaries, or `None` if the combination does not fit in the memory available.
+	"""
+	
+	try:
+		combination.findSolutions()
+		supercells = combination.findMinimumArea()
+	except MemoryError:
+		return None
+	
+	return [{
+		'label_1': s.label_1,
+		'label_2': s.label_2,
+		'angle': float (s.angle),
+		'nAtoms': int (s.nAtoms),
+		'strain': [float (x) for x in s.strain],
+		'solutions': [[int (x) for x in v] for v in s.solutions],
+	} for s in supercells]
+
+def ignoreInterrupt ():
+	"""
+	Initializes the worker processes, which are stopped by the server instead of by the interruption.
+	"""
+	
+	signal.signal (signal.SIGINT, signal.SIG_IGN)
+
+class Server (object):
+	"""
+	Local HTTP server which keeps a library of crystals loaded and answers queries for the coincidences of pairs of them.
+	
+	Each query gives the labels of two crystals and, optionally, the parameters of the search (see `parameters`),
+	whose defaults are the ones given to the server. The combinations are solved by a pool of worker processes,
+	and their supercells are kept in memory, so that a query repeated with the same parameters, or only with a
+	different number of atoms, is answered without solving the combination again. The least recently used
+	results are discarded once `cacheSize` results are kept.
+	
+	Endpoints (GET, parameters in the query string):
+		
+		/crystals        labels of the crystals loaded
+		/coincidences    supercells of the combination crystal_1/crystal_2 with at most n_atoms atoms
+		/status          number of results cached, hits and misses of the cache
+	"""
+	
+	parameters = collections.OrderedDict ([
+		('N', int),
+		('tolerance', float),
+		('angle_tolerance', float),
+		('angle_min', float),
+		('angle_max', float),
+		('angles_step', float),
+		('kernel', str),
+		('supercell', str),
+		('refine', int),
+		('n_atoms', int),
+	])
+	"""
+	Parameters of the search accepted by the queries, with their types.
+	"""
+	
+	def __init__ (self, crystals, defaults, jobs=1, cacheSize=256, cache=None):
+		"""
+		Initializes the server with the crystals, the default `parameters` of the search, the number of worker
+		processes (0 for all processors), the number of results kept in memory and an optional `Cache.Cache` on disk.
+		"""
+		
+		self.crystals = collections.OrderedDict ((c.label, c) for c in crystals)
+		"""
+		Crystals loaded, by label.
+		"""
+		
+		self.defaults = dict (defaults)
+		"""
+		Default parameters of the search.
+		"""
+		
+		self.jobs = jobs
+		"""
+		Number of worker processes solving combinations.
+		"""
+		
+		self.cacheSize = cacheSize
+		"""
+		Maximum number of results kept in memory.
+		"""
+		
+		self.cache = cache
+		"""
+		Cache of solutions on disk shared with the command line runs, or `None`.
+		"""
+		
+		self.results = collections.OrderedDict ()
+		"""
+		Results kept in memory, from the least to the most recently used, as pending or finished jobs of the pool.
+		"""
+		
+		self.hits = 0
+		self.misses = 0
+		"""
+		Number of queries answered from the results kept in memory and solved by the pool.
+		"""
+		
+		self.lock = threading.Lock ()
+		"""
+		Lock protecting the results, since each query is handled in its own thread.
+		"""
+		
+		self.pool = None
+		"""
+		Pool of worker processes, created by `serve`.
+		"""
+	
+	def query (self, arguments):
+		"""
+		Returns the parameters of a query with the defaults of the server, raising `ValueError` if they are invalid.
+		"""
+		
+		query = dict (self.defaults)
+		for name, value in arguments.items():
+			if name in ('crystal_1', 'crystal_2'):
+				query[name] = value
+			elif name in self.parameters:
+				try:
+					query[name] = self.parameters[name] (value)
+				except ValueError:
+					raise ValueError ("invalid value %s for %s" % (value, name))
+			else:
+				raise ValueError ("unknown parameter %s" % name)
+		
+		for name in ('crystal_1', 'crystal_2'):
+			if name not in query:
+				raise ValueError ("missing parameter %s" % name)
+			if query[name] not in self.crystals:
+				raise KeyError ("unknown crystal %s" % query[name])
+		
+		if query['kernel'] not in ('brute', 'solve', 'vector', 'analytic'):
+			raise ValueError ("invalid kernel %s" % query['kernel'])
+		if query['supercell'] not in ('pairwise', 'reduction'):
+			raise ValueError ("invalid supercell %s" % query['supercell'])
+		if query['N'] <= 0 or query['angles_step'] <= 0 or query['angle_max'] < query['angle_min']:
+			raise ValueError ("invalid N or angles")
+		
+		return query
+	
+	def combination (self, query):
+		"""
+		Returns the combination of crystals and parameters of a query.
+		"""
+		
+		crystals = [self.crystals[query['crystal_1']], self.crystals[query['crystal_2']]]
+		angles = [query['angle_min'], query['angle_max'], query['angles_step']]
+		limits = [query['N'], query['tolerance'], query['angle_tolerance']]
+		
+		# Each worker process sweeps the angles on a single thread
+		return Combination.Combination (crystals, angles, limits, kernel=query['kernel'], threads=1, supercellSearch=query['supercell'], cache=self.cache, refinement=query['refine'])
+	
+	def coincidences (self, query):
+		"""
+		Returns the supercells of a query with at most n_atoms atoms and whether they were kept in memory.
+		The supercells do not depend on n_atoms, so it is not part of the key of the results.
+		"""
+		
+		key = tuple (query[name] for name in ['crystal_1', 'crystal_2'] + list (self.parameters) if name != 'n_atoms')
+		
+		with self.lock:
+			result = self.results.get (key)
+			cached = result is not None
+			if cached:
+				self.results.move_to_end (key)
+				self.hits += 1
+			else:
+				result = self.pool.apply_async (solve, (self.combination (query),))
+				self.results[key] = result
+				self.misses += 1
+				while len (self.results) > self.cacheSize:
+					self.results.popitem (last=False)
+		
+		try:
+			supercells = result.get ()
+		except Exception as error:
+			self.discard (key, result)
+			raise RuntimeError ("could not solve %s/%s: %s" % (query['crystal_1'], query['crystal_2'], error))
+		
+		if supercells is None:
+			self.discard (key, result)
+			raise MemoryError ("not enough memory to solve %s/%s" % (query['crystal_1'], query['crystal_2']))
+		
+		return [s for s in supercells if s['nAtoms'] <= query['n_atoms']], cached
+	
+	def discard (self, key, result):
+		"""
+		Removes a failed result from the results kept in memory, so that the query is solved again when repeated.
+		"""
+		
+		with self.lock:
+			if self.results.get (key) is result:
+				del self.results[key]
+	
+	def status (self):
+		"""
+		Returns the number of results kept in memory and the hits and misses of the queries.
+		"""
+		
+		with self.lock:
+			return {'results': len (self.results), 'hits': self.hits, 'misses': self.misses, 'crystals': len (self.crystals)}
+	
+	def serve (self, host="127.0.0.1", port=8000, quiet=False):
+		"""
+		Starts the worker processes and serves the queries until interrupted.
+		"""
+		
+		try:
+			httpServer = ThreadingHTTPServer ((host, port), RequestHandler)
+		except (IOError, OSError) as error:
+			print ("Could not start the server on %s:%d: %s\n" % (host, port, error))
+			sys.exit(19)
+		
+		httpServer.application = self
+		httpServer.quiet = quiet
+		
+		self.pool = multiprocessing.Pool (self.jobs if self.jobs > 0 else None, initializer=ignoreInterrupt)
+		
+		try:
+			httpServer.serve_forever ()
+		except KeyboardInterrupt:
+			pass
+		finally:
+			httpServer.server_close ()
+			self.pool.terminate ()
+			self.pool.join ()
+
+class ThreadingHTTPServer (ThreadingMixIn, HTTPServer):
+	"""
+	HTTP server handling each request in its own thread.
+	"""
+	
+	daemon_threads = True
+
+class RequestHandler (BaseHTTPRequestHandler):
+	"""
+	Handles the queries of the `Server`, answering in JSON.
+	"""
+	
+	def do_GET (self):
+		url = urlparse (self.path)
+		arguments = dict (parse_qsl (url.query))
+		application = self.server.application
+		
+		try:
+			if url.path == "/crystals":
+				self.reply (200, {'crystals': list (application.crystals)})
+			elif url.path == "/status":
+				self.reply (200, application.status ())
+			elif url.path == "/coincidences":
+				query = application.query (arguments)
+				supercells, cached = application.coincidences (query)
+				self.reply (200, {'query': query, 'cached': cached, 'supercells': supercells})
+			else:
+				self.reply (404, {'error': "unknown endpoint %s" % url.path})
+		except KeyError as error:
+			self.reply (404, {'error': error.args[0]})
+		except ValueError as error:
+			self.reply (400, {'error': str (error)})
+		except MemoryError as error:
+			self.reply (503, {'error': str (error)})
+		except RuntimeError as error:
+			self.reply (500, {'error': str (error)})
+	
+	def reply (self, code, content):
+		body = json.dumps (content).encode ('utf-8')
+		
+		self.send_response (code)
+		self.send_header ("Content-Type", "application/json")
+		self.send_header ("Content-Length", str (len (body)))
+		self.end_headers ()
+		self.wfile.write (body)
+	
+	def log_message (self, format, *args):
+		if not self.server.quiet:
+			BaseHTTPRequestHandler.log_message (self, format, *args)
@@ -0,0 +1,138 @@
+import sys
+import json
+
+class Shard (object):
+	"""
+	Shard K of N of a run, i.e. the subset of the combinations solved by one of N independent processes.
+	
+	The combinations are assigned to the shards by their estimated cost (see `Combination.estimatedCost`),
+	from the most expensive to the cheapest, each one to the shard with the smallest total cost so far.
+	The assignment only depends on the combinations, so that every shard computes the same partition.
+	Each shard writes its output table and a manifest (`manifestFile`) with the index of its combinations
+	in the complete list, which `merge` uses to combine the tables in the original order.
+	"""
+	
+	def __init__ (self, description):
+		"""
+		Initializes the shard from a description "K/N", with 1 <= K <= N.
+		"""
+		
+		try:
+			index, count = [int (x) for x in description.split ("/")]
+		except ValueError:
+			index, count = 0, 0
+		
+		if not 1 <= index <= count:
+			print ("Invalid shard %s: expected K/N with 1 <= K <= N\n" % description)
+			sys.exit(17)
+		
+		self.index = index
+		"""
+		Index K of the shard, from 1 to N.
+		"""
+		
+		self.count = count
+		"""
+		Number N of shards.
+		"""
+	
+	def assign (self, costs):
+		"""
+		Returns the indices, in increasing order, of the combinations with the given costs which belong to this shard.
+		"""
+		
+		load = [0.0]*self.count
+		selected = []
+		
+		# Stable sort: combinations with the same cost are assigned in their original order
+		for i in sorted (range (len (costs)), key=lambda i: -costs[i]):
+			shard = min (range (self.count), key=lambda k: (load[k], k))
+			load[shard] += costs[i]
+			if shard == self.index - 1:
+				selected.append (i)
+		
+		return sorted (selected)
+	
+	def writeManifest (self, outputFile, nCombinations, entries):
+		"""
+		Writes the manifest of the output table `outputFile`, with the total number of combinations of the run
+		and a list of (index, label_1, label_2, number of supercells written) for each combination of the shard.
+		"""
+		
+		manifest = {
+			'shard': self.index,
+			'shards': self.count,
+			'combinations': nCombinations,
+			'entries': [{'index': i, 'label_1': label_1, 'label_2': label_2, 'coincidences': n} for i, label_1, label_2, n in entries],
+		}
+		
+		with open (manifestFile (outputFile), 'w') as f:
+			json.dump (manifest, f, indent=1)
+
+def manifestFile (outputFile):
+	"""
+	Returns the manifest written by a shard next to its output table.
+	"""
+	
+	return outputFile + ".shard"
+
+def merge (shardFiles, outputFile):
+	"""
+	Merges the output tables written by all shards of a run into `outputFile`, with the combinations in their
+	original order. Returns the total number of coincidences.
+	Each supercell takes three lines of the tables (two lines and a blank line), after a header of three lines.
+	"""
+	
+	blocks = {}
+	header = None
+	nShards = nCombinations = None
+	shards = set()
+	
+	for filename in shardFiles:
+		try:
+			with open (manifestFile (filename)) as f:
+				manifest = json.load (f)
+			with open (filename) as f:
+				lines = f.read().splitlines()
+		except (IOError, OSError, ValueError) as error:
+			print ("Could not read the shard %s: %s\n" % (filename, error))
+			sys.exit(17)
+		
+		if nShards is None:
+			nShards, nCombinations = manifest['shards'], manifest['combinations']
+			header = lines[:3]
+		elif (manifest['shards'], manifest['combinations']) != (nShards, nCombinations):
+			print ("The shard %s belongs to a different run\n" % filename)
+			sys.exit(17)
+		
+		if manifest['shard'] in shards:
+			print ("The shard %d/%d was given twice\n" % (manifest['shard'], nShards))
+			sys.exit(17)
+		shards.add (manifest['shard'])
+		
+		rows = lines[3:]
+		position = 0
+		for entry in manifest['entries']:
+			size = 3*entry['coincidences']
+			block = rows[position:position + size]
+			if len (block) != size or any (not line.startswith ("%s/%s" % (entry['label_1'], entry['label_2'])) for line in block[::3]):
+				print ("The output table %s does not match its manifest\n" % filename)
+				sys.exit(17)
+			blocks[entry['index']] = block
+			position += size
+	
+	missing = sorted (set (range (1, (nShards or 0) + 1)) - shards)
+	if missing or len (blocks) != nCombinations:
+		print ("Missing shard%s %s of %d\n" % ('' if len (missing) == 1 else 's', ", ".join (str (k) for k in missing), nShards or 0))
+		sys.exit(17)
+	
+	nCoincidences = 0
+	with open (outputFile, 'w') as f:
+		for line in header:
+			f.write (line + "\n")
+		for index in range (nCombinations):
+			for line in blocks[index]:
+				f.write (line + "\n")
+			nCoincidences += len (blocks[index])//3
+	
+	return nCoincidences
@@ -52,6 +52,16 @@ stopping criterion etc. All of these parameters are summarized when `clattices -
 rationale must be employed to interpret whether it corresponds or not to a plausible supercell. Different results can be
 obtained specially by tuning `tolerance` and `angle_tolerance`.
 
+Library
+-------------------------------------------------------------------------
+The screening of the command line is also available as a generator, `clattices.screen`, which yields each
+combination of a library of crystals with its supercells as soon as it is solved:
+
+	import clattices
+	
+	for combination, supercells in clattices.screen (["Graphene", "hBN"], [0, 30, 0.1], [7, 0.02, 0.05], maxAtoms=100):
+		print (combination.crystal_1.label, combination.crystal_2.label, len (supercells))
+
 Compatibility
 -------------------------------------------------------------------------
 `clattices` works properly on Python 3.5.1.
@@ -62,5 +72,7 @@ Contribution
 """
 
 __version__ = '1.0'
-__all__ = ["Crystal", "Combination", "Printer", "clattices_loop"]
+from .Screen import screen
+
+__all__ = ["Crystal", "Combination", "Printer", "Cache", "Profile", "Checkpoint", "Shard", "Binary", "Server", "Screen", "clattices_loop"]
 
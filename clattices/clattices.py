@@ -1,6 +1,13 @@
 #!/usr/bin/env python
 
 import argparse
+import collections
+import contextlib
+import functools
+import multiprocessing
+import os
+import sys
+import time
 import numpy as np
 from . import *
 
@@ -12,10 +19,12 @@ def parseArgs():
 	parser = argparse.ArgumentParser(description='Find coincidence lattices within combinations of 2D crystals.',
 									epilog= "If you find this script useful, please cite J. Phys. Chem. C, 2016, 120 (20), pp 10895-10908.")
 
-	parser.add_argument('input_files', nargs='+', help="2D crystals description files")
+	parser.add_argument('input_files', nargs='+', help="2D crystals description files, or databases with many crystals (.json, .csv or .tsv)")
 
 	parser.add_argument('-o', '--output_file', default='CoincidenceLattices.dat', help="output file for combinations table (default: CoincidenceLattices.dat file)")
 	
+	parser.add_argument('--binary', metavar="FILE", help="also write the supercells to FILE as fixed-size binary records, which can be memory-mapped and filtered by 'clattices query' (default: no binary output)")
+	
 	parser.add_argument('-a', '--angles', type=float, nargs=2, default=[0.0, 30.0], help="interval of angles (in degrees) to be investigated (default: 0 to 30 deg)", metavar=('ANGLE_MIN', 'ANGLE_MAX'))
 	
 	parser.add_argument('-s', '--angles_step', type=float, default=0.1, help="step for the investigation of angles (default: 0.1)")
@@ -26,7 +35,36 @@ def parseArgs():
 	
 	parser.add_argument('--angle_tolerance', type=float, default=0.05, help="tolerance for approximating angles when finding coincidence lattices (default: 0.05)")
 	
+	parser.add_argument('-k', '--kernel', choices=['brute', 'solve', 'vector', 'analytic'], default='brute', help="kernel used to search for coincidences: 'brute' tests all (m1, m2, n1, n2) at each angle, 'solve' inverts eq. 11 for each (m1, m2) and is much faster for large N, 'vector' tests the same vectors as 'brute' in vectorized batches and finds the same coincidences, 'analytic' matches vectors of equal norm and computes the exact twist angles without an angle grid (default: brute)")
+	
+	parser.add_argument('--supercell', choices=['pairwise', 'reduction'], default='pairwise', help="method to choose the supercell at each angle: 'pairwise' compares all pairs of solutions, 'reduction' applies a Gauss reduction to the coincidence sublattice (default: pairwise)")
+	
+	parser.add_argument('--no_fast_path', action='store_true', help="always sweep the whole grid of angles, instead of testing only the angles and vectors which may be coincident for homobilayers (combinations of crystals with the same lattice) and for combinations of lattices with integer Gram matrices up to a scale: hexagonal and square lattices, but also rectangular and oblique lattices with integer ratios of the products of their vectors. Both find the same coincidences (default: False)")
+	
+	parser.add_argument('--fold', choices=['none', 'irreducible', 'mapped'], default='none', help="fold the interval of angles by the rotations which leave both lattices invariant (60 deg for hexagonal, 90 deg for square and 180 deg for other lattices): 'irreducible' sweeps and reports only the first period of the interval, 'mapped' sweeps the first period and maps its coincidences to the rest of the interval, giving the same supercells as the whole sweep, unless the sweep of the first period, over a larger box of indices, is estimated to be slower (default: none)")
+	
+	parser.add_argument('--refine', type=int, default=0, metavar="K", help="sweep the angles every K steps with relaxed tolerances, then refine only around near-coincidences down to angles_step. Finds the same coincidences as the uniform sweep, 0 to disable (default: 0)")
+	
+	parser.add_argument('-T', '--threads', type=int, default=0, help="number of threads used to sweep the angles of each combination (default: 0, all processors)")
+	
+	parser.add_argument('-j', '--jobs', type=int, default=1, help="number of worker processes solving combinations in parallel, 0 for all processors (default: 1). Unless --threads is given, each worker sweeps the angles on a single thread")
+	parser.add_argument('--max_memory', type=int, default=0, metavar="MB", help="maximum memory (address space) of each worker process in MB, or of the main process with --jobs 1, 0 for no limit (default: 0)")
+	
+	parser.add_argument('--cache_dir', help="directory where the solutions of each combination are cached and reused by later runs with the same crystals and search parameters (default: no cache)")
+	parser.add_argument('--cache_size', type=int, default=1024, metavar="MB", help="maximum size of the cache in MB, least recently used results are removed first, 0 for no limit (default: 1024 MB)")
+	parser.add_argument('--clear_cache', action='store_true', help="remove all results from the cache directory before running (default: False)")
+	
+	parser.add_argument('--fsync', type=int, default=0, metavar="K", help="force the output file to be written to disk every K combinations, so that partial results survive a crash, 0 to disable (default: 0)")
+	
+	parser.add_argument('--shard', metavar="K/N", help="solve only the shard K of N of the combinations, balanced by their estimated cost, and write a manifest next to the output file. The outputs of all shards are combined by 'clattices merge' (default: all combinations)")
+	
+	parser.add_argument('--checkpoint', metavar="FILE", help="record each finished combination and its supercells in FILE, so that an interrupted run can be continued with --resume (default: output file name with .checkpoint when --resume is given, otherwise no checkpoint)")
+	parser.add_argument('--resume', action='store_true', help="skip the combinations recorded in the checkpoint by a previous run with the same settings, keeping their results in the output file (default: False)")
+	
+	parser.add_argument('--profile', nargs='?', const='', metavar="REPORT", help="write the time of each stage and the statistics of the kernel for each combination to REPORT, as CSV if its extension is .csv and JSON otherwise (default: output file name with _profile.json)")
+	
 	parser.add_argument('-n', '--n_atoms', type=int, default=100, help="maximum number of atoms inside the supercell (default: 100 atoms)")
+	parser.add_argument('--prune', action='store_true', help="skip the vectors too long to belong to a reduced supercell with at most n_atoms atoms. Much faster for large N, but supercells formed by long, nearly parallel vectors are not found (default: False)")
 	
 	parser.add_argument('-l', '--label_size', type=int, default=20, help="spacing of the label in the first column of the output file (default: 20 chars)")
 	parser.add_argument('-q', '--quiet', action='store_true', help="do not display text on the output window (default: False)")
@@ -35,6 +73,184 @@ def parseArgs():
 	
 	return parser.parse_args()
 
+def parseMergeArgs (arguments):
+	"""
+	Parse the arguments of the subcommand `clattices merge`.
+	"""
+	parser = argparse.ArgumentParser(prog='clattices merge', description='Merge the output files written by the shards of a run (--shard K/N) into a single table.')
+	
+	parser.add_argument('shard_files', nargs='+', help="output files of all shards, each one with its manifest (.shard)")
+	parser.add_argument('-o', '--output_file', default='CoincidenceLattices.dat', help="output file for the merged table (default: CoincidenceLattices.dat file)")
+	parser.add_argument('-q', '--quiet', action='store_true', help="do not display text on the output window (default: False)")
+	
+	return parser.parse_args(arguments)
+
+def parseQueryArgs (arguments):
+	"""
+	Parse the arguments of the subcommand `clattices query`.
+	"""
+	parser = argparse.ArgumentParser(prog='clattices query', description='Filter the supercells of binary outputs (--binary FILE) and print them in matrix notation.')
+	
+	parser.add_argument('binary_files', nargs='+', help="binary outputs written with --binary")
+	parser.add_argument('-o', '--output_file', help="output file for the supercells found (default: standard output)")
+	parser.add_argument('--pair', metavar="LABEL_1/LABEL_2", help="keep only the combination of the crystals LABEL_1 and LABEL_2, in this order (default: all combinations)")
+	parser.add_argument('--label', help="keep only the combinations with the crystal LABEL (default: all combinations)")
+	parser.add_argument('-a', '--angles', type=float, nargs=2, metavar=('ANGLE_MIN', 'ANGLE_MAX'), help="keep only the supercells within the interval of angles, in degrees (default: all angles)")
+	parser.add_argument('-n', '--n_atoms', type=int, help="maximum number of atoms inside the supercell (default: no limit)")
+	parser.add_argument('-t', '--tolerance', type=float, help="maximum absolute strain of both vectors, as in the search (default: no limit)")
+	parser.add_argument('-l', '--label_size', type=int, default=20, help="spacing of the label in the first column of the output (default: 20 chars)")
+	parser.add_argument('-c', '--count', action='store_true', help="print only the number of supercells found (default: False)")
+	
+	return parser.parse_args(arguments)
+
+def parseServeArgs (arguments):
+	"""
+	Parse the arguments of the subcommand `clattices serve`.
+	"""
+	parser = argparse.ArgumentParser(prog='clattices serve', description='Serve the coincidences of pairs of crystals over HTTP on the local machine, keeping the crystals and the results loaded between queries.',
+									epilog="Queries: GET /coincidences?crystal_1=LABEL&crystal_2=LABEL, optionally with N, tolerance, angle_tolerance, angle_min, angle_max, angles_step, kernel, supercell, refine and n_atoms. GET /crystals lists the crystals and GET /status the use of the cache.")
+	
+	parser.add_argument('input_files', nargs='+', help="2D crystals description files, or databases with many crystals (.json, .csv or .tsv)")
+	parser.add_argument('--host', default='127.0.0.1', help="address where the server listens (default: 127.0.0.1)")
+	parser.add_argument('-p', '--port', type=int, default=8000, help="port where the server listens (default: 8000)")
+	parser.add_argument('-j', '--jobs', type=int, default=1, help="number of worker processes solving combinations, 0 for all processors (default: 1)")
+	parser.add_argument('--results', type=int, default=256, help="maximum number of results kept in memory, least recently used results are removed first (default: 256)")
+	parser.add_argument('--cache_dir', help="directory of the cache of solutions on disk, shared with the command line runs (default: no cache)")
+	parser.add_argument('--cache_size', type=int, default=1024, metavar="MB", help="maximum size of the cache in MB, 0 for no limit (default: 1024 MB)")
+	
+	parser.add_argument('-a', '--angles', type=float, nargs=2, default=[0.0, 30.0], metavar=('ANGLE_MIN', 'ANGLE_MAX'), help="default interval of angles in degrees (default: 0 to 30 deg)")
+	parser.add_argument('-s', '--angles_step', type=float, default=0.1, help="default step for the investigation of angles (default: 0.1)")
+	parser.add_argument('-N', type=int, default=7, metavar="Nmax", help="default integer cutoff for the stopping criterion (default: 7)")
+	parser.add_argument('-t', '--tolerance', type=float, default=0.02, help="default maximum strain (default: 0.02)")
+	parser.add_argument('--angle_tolerance', type=float, default=0.05, help="default tolerance for approximating angles (default: 0.05)")
+	parser.add_argument('-k', '--kernel', choices=['brute', 'solve', 'vector', 'analytic'], default='brute', help="default kernel (default: brute)")
+	parser.add_argument('--supercell', choices=['pairwise', 'reduction'], default='pairwise', help="default method to choose the supercell at each angle (default: pairwise)")
+	parser.add_argument('--refine', type=int, default=0, metavar="K", help="default refinement of the angles, 0 to disable (default: 0)")
+	parser.add_argument('-n', '--n_atoms', type=int, default=100, help="default maximum number of atoms inside the supercell (default: 100 atoms)")
+	parser.add_argument('-q', '--quiet', action='store_true', help="do not log the queries (default: False)")
+	
+	return parser.parse_args(arguments)
+
+def limitMemory (maxMemory):
+	"""
+	Limits the address space of the current process to `maxMemory` megabytes.
+	Used to initialize the worker processes when `--max_memory` is given, or the main process when it solves
+	the combinations itself (`--jobs 1`).
+	"""
+	
+	if maxMemory <= 0:
+		return
+	
+	try:
+		import resource
+	except ImportError:
+		print ("Memory limits are not supported on this platform: ignoring --max_memory\n")
+		return
+	
+	limit = maxMemory*1024*1024
+	resource.setrlimit (resource.RLIMIT_AS, (limit, limit))
+
+def solveCombination (combination, profile=False, maxAtoms=None):
+	"""
+	Finds the supercells of minimum area of the given combination.
+	Returns the supercells and, if `profile` is True, the statistics of the combination (see `Profile.statistics`).
+	If `maxAtoms` is given, only the supercells with at most `maxAtoms` atoms are returned, so that a worker process
+	does not send back the ones which are not printed. The supercells are `None` if the combination does not fit
+	in the memory available.
+	"""
+	
+	# Some functions of NumPy raise a SystemError instead of a MemoryError when an allocation fails
+	try:
+		start = time.perf_counter()
+		combination.findSolutions()
+		middle = time.perf_counter()
+		supercells = combination.findMinimumArea()
+		end = time.perf_counter()
+	except (MemoryError, SystemError):
+		return None, None
+	
+	statistics = Profile.statistics (combination, supercells, {'solutions': middle - start, 'supercells': end - middle}) if profile else None
+	
+	if maxAtoms is not None:
+		# The solutions of the copy of the combination in the worker are not needed anymore
+		combination.allSolutions = []
+		try:
+			kept = supercells.nAtoms <= maxAtoms
+			supercells = Combination.SupercellTable (supercells.angle[kept], supercells.solutions[kept], combination)
+		except (MemoryError, SystemError):
+			return None, None
+	
+	return supercells, statistics
+
+def solveCombinations (args, combinations):
+	"""
+	Solves all combinations, serially or in a pool of `args.jobs` processes, and yields
+	each combination with its supercells and statistics as soon as it is finished, in the original order.
+	With a pool, at most one combination per process is solved or waiting to be yielded at a time, and
+	the workers only send back the supercells with at most `args.n_atoms` atoms.
+	"""
+	
+	solve = functools.partial (solveCombination, profile=args.profile is not None)
+	
+	if args.jobs == 1:
+		# The combinations are solved in this process, which takes the limit of a worker
+		limitMemory (args.max_memory)
+		for c in combinations:
+			if not args.quiet:
+				print ("%s/%s" % (c.crystal_1.label, c.crystal_2.label))
+			supercells, statistics = solve (c)
+			if supercells is None:
+				print ("Not enough memory to solve %s/%s: skipping the combination" % (c.crystal_1.label, c.crystal_2.label), file=sys.stderr)
+				supercells = []
+			yield c, supercells, statistics
+	else:
+		# The results are collected in the same order as the combinations. A new combination is only submitted
+		# when the oldest one is yielded, so that the results do not pile up if the output is slow
+		nProcesses = args.jobs if args.jobs > 0 else multiprocessing.cpu_count ()
+		solve = functools.partial (solveCombination, profile=args.profile is not None, maxAtoms=args.n_atoms)
+		pending = collections.deque ()
+		
+		def collect ():
+			c, result = pending.popleft ()
+			supercells, statistics = result.get ()
+			if supercells is None:
+				print ("Not enough memory to solve %s/%s: skipping the combination" % (c.crystal_1.label, c.crystal_2.label), file=sys.stderr)
+				supercells = []
+			elif not args.quiet:
+				print ("%s/%s" % (c.crystal_1.label, c.crystal_2.label))
+			return c, supercells, statistics
+		
+		with multiprocessing.Pool (nProcesses, initializer=limitMemory, initargs=(args.max_memory,)) as pool:
+			for c in combinations:
+				pending.append ((c, pool.apply_async (solve, (c,))))
+				if len (pending) >= nProcesses:
+					yield collect ()
+			
+			while pending:
+				yield collect ()
+
+def checkpointSettings (args):
+	"""
+	Returns the settings which must be the same to resume a run from its checkpoint.
+	"""
+	
+	return {
+		'input_files': [os.path.abspath (f) for f in args.input_files],
+		'angles': args.angles,
+		'angles_step': args.angles_step,
+		'N': args.N,
+		'tolerance': args.tolerance,
+		'angle_tolerance': args.angle_tolerance,
+		'kernel': args.kernel,
+		'supercell': args.supercell,
+		'fold': args.fold,
+		'prune': args.prune,
+		'n_atoms': args.n_atoms,
+		'self_combinations': args.self_combinations,
+		'first': args.first,
+		'shard': args.shard,
+	}
+
 def printRunDescription (args, crystals, combinations):
 	'''
 	Print description of the options chosen and the crystals input.
@@ -48,10 +264,102 @@ def printRunDescription (args, crystals, combinations):
 	print ("angles_step:".ljust(leftJustSpace) + "%.2f deg" % args.angles_step)
 	print ("tolerance:".ljust(leftJustSpace) + "%2.2f" % args.tolerance)
 	print ("angle_tolerance:".ljust(leftJustSpace) + "%.2f" % args.angle_tolerance)
-	print ("n_atoms:".ljust(leftJustSpace) + "%d\n" % args.n_atoms)
+	print ("kernel:".ljust(leftJustSpace) + "%s" % args.kernel)
+	print ("supercell:".ljust(leftJustSpace) + "%s" % args.supercell)
+	print ("fast path:".ljust(leftJustSpace) + "%s" % ("disabled" if args.no_fast_path else "homobilayers and lattices with integer forms"))
+	print ("fold:".ljust(leftJustSpace) + "%s" % args.fold)
+	print ("refine:".ljust(leftJustSpace) + ("every %d steps" % args.refine if args.refine > 1 else "disabled"))
+	print ("threads:".ljust(leftJustSpace) + ("%d" % args.threads if args.threads > 0 else "all processors"))
+	print ("binary output:".ljust(leftJustSpace) + "%s" % (args.binary if args.binary else "disabled"))
+	print ("cache:".ljust(leftJustSpace) + "%s" % (args.cache_dir if args.cache_dir else "disabled"))
+	print ("jobs:".ljust(leftJustSpace) + ("%d" % args.jobs if args.jobs > 0 else "all processors"))
+	print ("shard:".ljust(leftJustSpace) + "%s" % (args.shard if args.shard else "disabled"))
+	print ("n_atoms:".ljust(leftJustSpace) + "%d" % args.n_atoms)
+	print ("pruning:".ljust(leftJustSpace) + "%s\n" % ("enabled" if args.prune else "disabled"))
+	
+	
+def merge (arguments):
+	"""
+	Subcommand `clattices merge`: combines the outputs of the shards of a run in the original order of the combinations.
+	"""
+	args = parseMergeArgs (arguments)
+	
+	nCoincidences = Shard.merge (args.shard_files, args.output_file)
+	
+	if not args.quiet:
+		print ("%d coincidence lattice%s found in %d shard%s\n" % (nCoincidences, '' if nCoincidences == 1 else 's', len (args.shard_files), '' if len (args.shard_files) == 1 else 's'))
+	
+def query (arguments):
+	"""
+	Subcommand `clattices query`: prints the supercells of binary outputs which match the filters given,
+	reading the files in chunks so that they are never loaded into memory at once.
+	"""
+	args = parseQueryArgs (arguments)
+	
+	pair = None
+	if args.pair:
+		pair = args.pair.split ("/")
+		if len (pair) != 2:
+			print ("Invalid pair %s: expected LABEL_1/LABEL_2\n" % args.pair)
+			sys.exit(18)
+	
+	printer = Printer.Printer (args.output_file, labelSpacing=args.label_size)
+	f = open (args.output_file, 'w') if args.output_file else sys.stdout
+	
+	nCoincidences = 0
+	if not args.count:
+		printer.writeMatrixNotationHeader (f)
+	for filename in args.binary_files:
+		for records in Binary.query (filename, pair=pair, label=args.label, angles=args.angles, maxAtoms=args.n_atoms, maxStrain=args.tolerance):
+			if args.count:
+				nCoincidences += len (records)
+			else:
+				nCoincidences += printer.writeMatrixNotation (f, [Binary.BinaryRow (r) for r in records], float ('inf'))
+	
+	if args.count:
+		f.write ("%d\n" % nCoincidences)
+	
+	if f is not sys.stdout:
+		f.close()
 	
+def serve (arguments):
+	"""
+	Subcommand `clattices serve`: loads the crystals once and answers queries for their coincidences until interrupted.
+	"""
+	args = parseServeArgs (arguments)
+	
+	crystals = Crystal.loadCrystals (args.input_files)
+	
+	cache = Cache.Cache (args.cache_dir, maxSize=args.cache_size*1024*1024) if args.cache_dir else None
+	
+	defaults = {
+		'N': args.N,
+		'tolerance': args.tolerance,
+		'angle_tolerance': args.angle_tolerance,
+		'angle_min': args.angles[0],
+		'angle_max': args.angles[1],
+		'angles_step': args.angles_step,
+		'kernel': args.kernel,
+		'supercell': args.supercell,
+		'refine': args.refine,
+		'n_atoms': args.n_atoms,
+	}
+	
+	server = Server.Server (crystals, defaults, jobs=args.jobs, cacheSize=args.results, cache=cache)
+	
+	if not args.quiet:
+		print ("Serving %d crystal%s on http://%s:%d/" % (len (crystals), '' if len (crystals) == 1 else 's', args.host, args.port))
+	
+	server.serve (args.host, args.port, quiet=args.quiet)
 	
 def main():
+	if len (sys.argv) > 1 and sys.argv[1] == "merge":
+		return merge (sys.argv[2:])
+	if len (sys.argv) > 1 and sys.argv[1] == "query":
+		return query (sys.argv[2:])
+	if len (sys.argv) > 1 and sys.argv[1] == "serve":
+		return serve (sys.argv[2:])
+	
 	args = parseArgs()
 	
 	if not args.quiet:
@@ -60,43 +368,115 @@ def main():
 		print ("***********************")
 	
 	# Creates a list with the 2D crystals
-	crystals = []
-	for crystalFile in args.input_files:
-		crystals.append (Crystal.Crystal(crystalFile))
+	crystals = Crystal.loadCrystals (args.input_files)
+	
+	# The labels must fit in the records of the binary output, which is checked before solving any combination
+	if args.binary:
+		for crystal in crystals:
+			Binary.encodeLabel (crystal.label)
 	
 	# Arguments passed by the command line
 	angles = [args.angles[0], args.angles[1], args.angles_step]
 	
+	# Cache of solutions shared by all combinations
+	cache = None
+	if args.cache_dir:
+		cache = Cache.Cache (args.cache_dir, maxSize=args.cache_size*1024*1024)
+		if args.clear_cache:
+			cache.clear()
+	
+	# Avoids running one thread per processor inside each worker process
+	if args.jobs != 1 and args.threads == 0:
+		args.threads = 1
+	
 	# Creates a list of combinations for each pair of crystals
 	combinations = []
-	if args.self_combinations:
-		for i in range (len(crystals) if not args.first else 1):
-			for j in range (i, len(crystals)):
-				combinations.append (Combination.Combination([crystals[i], crystals[j]], angles, [args.N, args.tolerance, args.angle_tolerance]))
-	else:
-		for i in range (len(crystals) if not args.first else 1):
-			for j in range (i+1, len(crystals)):
-				combinations.append (Combination.Combination([crystals[i], crystals[j]], angles, [args.N, args.tolerance, args.angle_tolerance]))
-
+	for crystal_1, crystal_2 in Screen.pairs (crystals, args.self_combinations, args.first):
+		combinations.append (Combination.Combination([crystal_1, crystal_2], angles, [args.N, args.tolerance, args.angle_tolerance], kernel=args.kernel, threads=args.threads, supercellSearch=args.supercell, cache=cache, maxAtoms=args.n_atoms if args.prune else None, refinement=args.refine, fastPath=not args.no_fast_path, fold=args.fold))
+	
+	# Keeps only the combinations of this shard, with their indices in the complete list
+	shard = None
+	nTotal = len (combinations)
+	indices = list (range (nTotal))
+	if args.shard:
+		shard = Shard.Shard (args.shard)
+		indices = shard.assign ([c.estimatedCost() for c in combinations])
+		combinations = [combinations[i] for i in indices]
+	
 	if not args.quiet:
 		printRunDescription (args, crystals, combinations)
 		print ("Finding coincidence lattices for the following bilayer system%s:" % ('' if len(combinations) == 1 else 's'))
 	
-	supercellCombinationsList = []
-	# Solve all combinations
-	for c in combinations:
-		if not args.quiet:
-			print ("%s/%s" % (c.crystal_1.label, c.crystal_2.label))
-		c.findSolutions()
-		supercellCombinationsList.append (c.findMinimumArea())
+	# Report with the statistics of each combination
+	profile = None
+	if args.profile is not None:
+		profile = Profile.Profile (args.profile if args.profile else os.path.splitext (args.output_file)[0] + "_profile.json")
 	
-	# Print everything
-	p = Printer.Printer (args.output_file, labelSpacing=args.label_size)
+	# Checkpoint with the combinations already finished
+	checkpoint = None
+	finished = []
+	if args.checkpoint or args.resume:
+		checkpoint = Checkpoint.Checkpoint (args.checkpoint if args.checkpoint else args.output_file + ".checkpoint", checkpointSettings (args))
+		if args.resume:
+			finished = checkpoint.load (combinations)
+			if not args.quiet:
+				print ("Resuming from %s: %d of %d combinations already finished" % (checkpoint.filename, len (finished), len (combinations)))
+		checkpoint.open (finished)
+	
+	# Solve all combinations, writing each one to the output file as soon as it is finished
 	nCoincidences = 0
+	entries = []
+	binary = Binary.BinaryPrinter (args.binary) if args.binary else None
+	with Printer.Printer (args.output_file, labelSpacing=args.label_size).open() as p, contextlib.ExitStack() as stack:
+		if binary is not None:
+			stack.enter_context (binary.open())
+		p.printMatrixNotationHeader()
+		
+		# The output file is rewritten with the results of the finished combinations
+		for record in finished:
+			c = combinations[record['index']]
+			supercells = checkpoint.supercells (record, c)
+			kept = p.printMatrixNotation (supercells, args.n_atoms)
+			if binary is not None:
+				binary.printSupercells (supercells, args.n_atoms)
+			nCoincidences += kept
+			entries.append ((indices[record['index']], c.crystal_1.label, c.crystal_2.label, kept))
+		
+		for index, (c, supercells, statistics) in enumerate (solveCombinations (args, combinations[len (finished):]), len (finished)):
+			start = time.perf_counter()
+			kept = p.printMatrixNotation(supercells, args.n_atoms)
+			if binary is not None:
+				binary.printSupercells (supercells, args.n_atoms)
+			nCoincidences += kept
+			entries.append ((indices[index], c.crystal_1.label, c.crystal_2.label, kept))
+			
+			if args.fsync > 0 and (index + 1) % args.fsync == 0:
+				p.flush (sync=True)
+				if binary is not None:
+					binary.flush (sync=True)
+			
+			if checkpoint is not None:
+				checkpoint.add (index, c, supercells)
+			
+			if profile is not None and statistics is not None:
+				profile.add (statistics, time.perf_counter() - start, kept)
+			
+			# The results of the combination are written, so that they can be released before solving the next one
+			c.allSolutions = []
+			c.supercell = []
+	
+	if checkpoint is not None:
+		checkpoint.close()
 	
-	p.printMatrixNotationHeader()
-	for s in supercellCombinationsList:
-		nCoincidences += p.printMatrixNotation(s, args.n_atoms)
+	if shard is not None:
+		shard.writeManifest (args.output_file, nTotal, entries)
+		if not args.quiet:
+			print ("Shard %d/%d: %d of %d combinations, manifest written to %s" % (shard.index, shard.count, len (combinations), nTotal, Shard.manifestFile (args.output_file)))
+	
+	if profile is not None:
+		profile.write()
+		if not args.quiet:
+			print ("Profile written to %s" % profile.outputFile)
 	
 	if not args.quiet:
 		print ("\n%d coincidence lattice%s found\n" % (nCoincidences, '' if nCoincidences == 1 else 's'))
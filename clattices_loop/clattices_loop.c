@@ -1,4 +1,6 @@
 #include <Python.h>
+#include <structmember.h>
+#include <string.h>
 #include "loop.h"
 
 struct module_state {
@@ -16,6 +18,96 @@ static char module_docstring[] =
     "The module provides quick calculations for loops in Python using C.";
 static char clattices_loop_docstring[] =
     "Calculates coincidences between two given crystals using eq. 11.";
+static char clattices_solve_docstring[] =
+    "clattices_solve(A, B, angle_start, angle_end, angle_step, Nmax, tolerance, angle_tolerance, kernel='brute', threads=0, max_norm=0)\n\n"
+    "Calculates coincidences between the 2x2 lattices A and B using eq. 11 without touching the disk.\n"
+    "The kernel 'brute' tests every (m1, m2, n1, n2), while 'solve' inverts MBn = Am for each (m1, m2)\n"
+    "and tests only the integer (n1, n2) around the solution, finding the same coincidences.\n"
+    "The kernel 'vector' tests every (m1, m2, n1, n2) as 'brute', screening the rotated vectors of each angle\n"
+    "in vectorized batches and comparing cosines instead of angles, and finds the same coincidences.\n"
+    "The angles are split among `threads` worker threads (all processors if threads <= 0), which run\n"
+    "with the GIL released. The results are always returned in angle order.\n"
+    "If max_norm > 0, only the vectors Am with |Am| <= max_norm are searched.\n"
+    "Returns a Hits object exposing an (n_hits, 5) int array through the buffer protocol, whose rows\n"
+    "are (angle index, m1, m2, n1, n2).";
+static char clattices_solve_angles_docstring[] =
+    "clattices_solve_angles(A, B, angles, Nmax, tolerance, angle_tolerance, kernel='brute', threads=0, max_norm=0)\n\n"
+    "Same as clattices_solve, for the given sequence of angles in degrees instead of a uniform sweep.\n"
+    "The angle index of each coincidence is its position in `angles`.";
+static char clattices_solve_pairs_docstring[] =
+    "clattices_solve_pairs(A, B, angles, candidates, Nmax, tolerance, angle_tolerance, max_norm=0)\n\n"
+    "Tests only the given candidates, a C-contiguous (n, 5) int32 buffer with rows (angle index, m1, m2, n1, n2),\n"
+    "with the same ranges and test as the brute force search. Returns a Hits object with the candidates\n"
+    "which are coincidences, in the order given.";
+static char hits_docstring[] =
+    "Read-only (n_hits, 5) int buffer with the coincidences (angle index, m1, m2, n1, n2).\n"
+    "The attribute `candidates` is the number of vectors (m, n) tested by the kernel to find them.";
+
+/* Container for the coincidences returned to Python, exported through the buffer protocol */
+typedef struct {
+	PyObject_HEAD
+	hit_buffer hits;
+	Py_ssize_t shape[2];
+	Py_ssize_t strides[2];
+} HitsObject;
+
+static void Hits_dealloc (HitsObject *self)
+{
+	hit_buffer_free (&self->hits);
+	Py_TYPE(self)->tp_free ((PyObject*) self);
+}
+
+static Py_ssize_t Hits_length (HitsObject *self)
+{
+	return (Py_ssize_t) self->hits.size;
+}
+
+static int Hits_getbuffer (PyObject *obj, Py_buffer *view, int flags)
+{
+	static int empty[HIT_FIELDS];
+	HitsObject *self = (HitsObject*) obj;
+
+	if (flags & PyBUF_WRITABLE) {
+		PyErr_SetString (PyExc_BufferError, "Hits buffer is read-only");
+		view->obj = NULL;
+		return -1;
+	}
+
+	view->obj = obj;
+	Py_INCREF (obj);
+	view->buf = self->hits.data ? (void*) self->hits.data : (void*) empty;
+	view->len = self->shape[0]*self->strides[0];
+	view->readonly = 1;
+	view->itemsize = sizeof(int);
+	view->format = (flags & PyBUF_FORMAT) ? "i" : NULL;
+	view->ndim = 2;
+	view->shape = (flags & PyBUF_ND) == PyBUF_ND ? self->shape : NULL;
+	view->strides = (flags & PyBUF_STRIDES) == PyBUF_STRIDES ? self->strides : NULL;
+	view->suboffsets = NULL;
+	view->internal = NULL;
+
+	return 0;
+}
+
+static PySequenceMethods Hits_as_sequence = {
+	(lenfunc) Hits_length,
+};
+
+static PyBufferProcs Hits_as_buffer = {
+	Hits_getbuffer,
+	NULL,
+};
+
+static PyMemberDef Hits_members[] = {
+	{"candidates", T_LONGLONG, offsetof(HitsObject, hits) + offsetof(hit_buffer, candidates), READONLY, "number of vectors (m, n) tested by the kernel"},
+	{NULL}
+};
+
+static PyTypeObject HitsType = {
+	PyVarObject_HEAD_INIT(NULL, 0)
+	"clattices_loop.Hits",
+	sizeof(HitsObject),
+};
 
 /* Loop for finding coincidence lattices module in C to be called from Python */
 static PyObject* clattices_loop (PyObject* self, PyObject* args)
@@ -28,15 +120,223 @@ static PyObject* clattices_loop (PyObject* self, PyObject* args)
         return NULL;
         
     loop (angle_start, angle_end, angle_step, Nmax, tolerance, angle_tolerance);	
-	return Py_None;
+	Py_RETURN_NONE;
+}
+
+/* Converts the name of a kernel to its constant, or sets a ValueError and returns -1 */
+static int parse_kernel (const char *kernelName)
+{
+	if (strcmp (kernelName, "brute") == 0)
+		return KERNEL_BRUTE_FORCE;
+	else if (strcmp (kernelName, "solve") == 0)
+		return KERNEL_SOLVE;
+	else if (strcmp (kernelName, "vector") == 0)
+		return KERNEL_VECTOR;
+
+	PyErr_Format (PyExc_ValueError, "Unknown kernel '%s': expected 'brute', 'solve' or 'vector'", kernelName);
+	return -1;
+}
+
+/* Creates an empty Hits object */
+static HitsObject* hits_new (void)
+{
+	HitsObject *result = PyObject_New (HitsObject, &HitsType);
+
+	if (result != NULL)
+		hit_buffer_init (&result->hits);
+
+	return result;
+}
+
+/* Sets the shape of the buffer of a Hits object filled by the kernel. Returns NULL if the kernel failed */
+static PyObject* hits_finish (HitsObject *result, int status)
+{
+	if (status) {
+		Py_DECREF (result);
+		return PyErr_NoMemory ();
+	}
+
+	result->shape[0] = (Py_ssize_t) result->hits.size;
+	result->shape[1] = HIT_FIELDS;
+	result->strides[0] = HIT_FIELDS*sizeof(int);
+	result->strides[1] = sizeof(int);
+
+	return (PyObject*) result;
+}
+
+/* Loop for finding coincidence lattices in memory, returning the solutions as a buffer */
+static PyObject* clattices_solve (PyObject* self, PyObject* args, PyObject* kwargs)
+{
+	static char *keywords[] = {"A", "B", "angle_start", "angle_end", "angle_step", "Nmax", "tolerance", "angle_tolerance", "kernel", "threads", "max_norm", NULL};
+	double A[4], B[4];
+	double angle_start, angle_end, angle_step, tolerance, angle_tolerance;
+	const char *kernelName = "brute";
+	int Nmax, kernel, status;
+	int nThreads = 0;
+	double max_norm = 0;
+	HitsObject *result;
+
+	/* Parse the input tuple */
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "((dd)(dd))((dd)(dd))dddidd|sid", keywords, &A[0], &A[1], &A[2], &A[3], &B[0], &B[1], &B[2], &B[3],
+									 &angle_start, &angle_end, &angle_step, &Nmax, &tolerance, &angle_tolerance, &kernelName, &nThreads, &max_norm))
+		return NULL;
+
+	kernel = parse_kernel (kernelName);
+	if (kernel < 0)
+		return NULL;
+
+	if (angle_step <= 0) {
+		PyErr_SetString (PyExc_ValueError, "angle_step must be positive");
+		return NULL;
+	}
+
+	result = hits_new ();
+	if (result == NULL)
+		return NULL;
+
+	Py_BEGIN_ALLOW_THREADS
+	status = loop_lattices (A, B, angle_start, angle_end, angle_step, Nmax, tolerance, angle_tolerance, max_norm, kernel, nThreads, &result->hits);
+	Py_END_ALLOW_THREADS
+
+	return hits_finish (result, status);
+}
+
+/* Same as clattices_solve, for an arbitrary sequence of angles */
+static PyObject* clattices_solve_angles (PyObject* self, PyObject* args, PyObject* kwargs)
+{
+	static char *keywords[] = {"A", "B", "angles", "Nmax", "tolerance", "angle_tolerance", "kernel", "threads", "max_norm", NULL};
+	double A[4], B[4];
+	double tolerance, angle_tolerance;
+	const char *kernelName = "brute";
+	int Nmax, kernel, status;
+	int nThreads = 0;
+	double max_norm = 0;
+	double *angles;
+	Py_ssize_t nAngles, i;
+	PyObject *angleList, *sequence;
+	HitsObject *result;
+
+	/* Parse the input tuple */
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "((dd)(dd))((dd)(dd))Oidd|sid", keywords, &A[0], &A[1], &A[2], &A[3], &B[0], &B[1], &B[2], &B[3],
+									 &angleList, &Nmax, &tolerance, &angle_tolerance, &kernelName, &nThreads, &max_norm))
+		return NULL;
+
+	kernel = parse_kernel (kernelName);
+	if (kernel < 0)
+		return NULL;
+
+	sequence = PySequence_Fast (angleList, "angles must be a sequence of floats");
+	if (sequence == NULL)
+		return NULL;
+
+	nAngles = PySequence_Fast_GET_SIZE (sequence);
+	angles = malloc ((nAngles > 0 ? nAngles : 1)*sizeof(double));
+	if (angles == NULL) {
+		Py_DECREF (sequence);
+		return PyErr_NoMemory ();
+	}
+
+	for (i = 0; i < nAngles; i++) {
+		angles[i] = PyFloat_AsDouble (PySequence_Fast_GET_ITEM (sequence, i));
+		if (angles[i] == -1.0 && PyErr_Occurred ()) {
+			free (angles);
+			Py_DECREF (sequence);
+			return NULL;
+		}
+	}
+	Py_DECREF (sequence);
+
+	result = hits_new ();
+	if (result == NULL) {
+		free (angles);
+		return NULL;
+	}
+
+	Py_BEGIN_ALLOW_THREADS
+	status = loop_angles (A, B, angles, (int) nAngles, Nmax, tolerance, angle_tolerance, max_norm, kernel, nThreads, &result->hits);
+	Py_END_ALLOW_THREADS
+
+	free (angles);
+
+	return hits_finish (result, status);
 }
 
 
+/* Tests the candidates (angle index, m1, m2, n1, n2) given in a buffer */
+static PyObject* clattices_solve_pairs (PyObject* self, PyObject* args, PyObject* kwargs)
+{
+	static char *keywords[] = {"A", "B", "angles", "candidates", "Nmax", "tolerance", "angle_tolerance", "max_norm", NULL};
+	double A[4], B[4];
+	double tolerance, angle_tolerance;
+	int Nmax, status;
+	double max_norm = 0;
+	double *angles;
+	Py_ssize_t nAngles, i;
+	PyObject *angleList, *sequence;
+	Py_buffer candidates;
+	HitsObject *result;
+
+	/* Parse the input tuple */
+	if (!PyArg_ParseTupleAndKeywords(args, kwargs, "((dd)(dd))((dd)(dd))Oy*idd|d", keywords, &A[0], &A[1], &A[2], &A[3], &B[0], &B[1], &B[2], &B[3],
+									 &angleList, &candidates, &Nmax, &tolerance, &angle_tolerance, &max_norm))
+		return NULL;
+
+	if (candidates.len % (HIT_FIELDS*sizeof(int)) != 0) {
+		PyBuffer_Release (&candidates);
+		PyErr_SetString (PyExc_ValueError, "candidates must be an (n, 5) int32 buffer");
+		return NULL;
+	}
+
+	sequence = PySequence_Fast (angleList, "angles must be a sequence of floats");
+	if (sequence == NULL) {
+		PyBuffer_Release (&candidates);
+		return NULL;
+	}
+
+	nAngles = PySequence_Fast_GET_SIZE (sequence);
+	angles = malloc ((nAngles > 0 ? nAngles : 1)*sizeof(double));
+	if (angles == NULL) {
+		Py_DECREF (sequence);
+		PyBuffer_Release (&candidates);
+		return PyErr_NoMemory ();
+	}
+
+	for (i = 0; i < nAngles; i++) {
+		angles[i] = PyFloat_AsDouble (PySequence_Fast_GET_ITEM (sequence, i));
+		if (angles[i] == -1.0 && PyErr_Occurred ()) {
+			free (angles);
+			Py_DECREF (sequence);
+			PyBuffer_Release (&candidates);
+			return NULL;
+		}
+	}
+	Py_DECREF (sequence);
+
+	result = hits_new ();
+	if (result == NULL) {
+		free (angles);
+		PyBuffer_Release (&candidates);
+		return NULL;
+	}
+
+	Py_BEGIN_ALLOW_THREADS
+	status = loop_pairs (A, B, angles, (int) nAngles, (const int*) candidates.buf, (size_t) candidates.len/(HIT_FIELDS*sizeof(int)), Nmax, tolerance, angle_tolerance, max_norm, &result->hits);
+	Py_END_ALLOW_THREADS
+
+	free (angles);
+	PyBuffer_Release (&candidates);
+
+	return hits_finish (result, status);
+}
+
 /*
  * Bind Python function names to our C functions
  */
 static PyMethodDef clattices_loop_methods[] = {
 	{"clattices_loop", clattices_loop, METH_VARARGS, clattices_loop_docstring},
+	{"clattices_solve", (PyCFunction) clattices_solve, METH_VARARGS | METH_KEYWORDS, clattices_solve_docstring},
+	{"clattices_solve_angles", (PyCFunction) clattices_solve_angles, METH_VARARGS | METH_KEYWORDS, clattices_solve_angles_docstring},
+	{"clattices_solve_pairs", (PyCFunction) clattices_solve_pairs, METH_VARARGS | METH_KEYWORDS, clattices_solve_pairs_docstring},
 	{NULL, NULL}
 };
 
@@ -66,6 +366,19 @@ void
 initclattices_loop(void)
 #endif
 {
+    HitsType.tp_dealloc = (destructor) Hits_dealloc;
+    HitsType.tp_as_sequence = &Hits_as_sequence;
+    HitsType.tp_as_buffer = &Hits_as_buffer;
+    HitsType.tp_members = Hits_members;
+#if PY_MAJOR_VERSION >= 3
+    HitsType.tp_flags = Py_TPFLAGS_DEFAULT;
+#else
+    HitsType.tp_flags = Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_NEWBUFFER;
+#endif
+    HitsType.tp_doc = hits_docstring;
+    if (PyType_Ready(&HitsType) < 0)
+        INITERROR;
+
 #if PY_MAJOR_VERSION >= 3
     PyObject *module = PyModule_Create(&moduledef);
 #else
@@ -82,6 +395,9 @@ initclattices_loop(void)
         INITERROR;
     }
 
+    Py_INCREF(&HitsType);
+    PyModule_AddObject(module, "Hits", (PyObject*) &HitsType);
+
 #if PY_MAJOR_VERSION >= 3
     return module;
 #endif
@@ -1,97 +1,727 @@
 #include <stdio.h>
 #include <stdlib.h>
+#include <string.h>
 #include <math.h>
 #include "loop.h"
 
+#ifdef _WIN32
+#include <windows.h>
+#include <process.h>
+#else
+#include <pthread.h>
+#include <unistd.h>
+#endif
+
+/* Band [cos_low, cos_high) of the cosines between Am and MBn around the cosine of angle_tolerance.
+ * Cosines above the band pass the angle test and cosines below it fail, without computing acos.
+ */
+typedef struct {
+	double cos_low, cos_high;
+} angle_threshold;
+
+/* Rotated vectors MBn of the whole (n1, n2) plane for one angle, with their squared norms,
+ * and the excess of each vector over the bound of the screening of the vectorized kernel
+ */
+typedef struct {
+	double *x, *y, *norm2, *excess;
+	size_t size;
+} plane_buffer;
+
+/* Range of angles searched by one worker thread, with its own buffer of coincidences */
+typedef struct {
+	const double *A, *B;
+	const double *angles;
+	int first, last;
+	const search_range *range;
+	double tolerance, angle_tolerance;
+	int kernel;
+	angle_threshold threshold;
+	plane_buffer plane;
+	hit_buffer hits;
+	int status;
+} sweep_task;
+
+void hit_buffer_init (hit_buffer *hits)
+{
+	hits->data = NULL;
+	hits->size = 0;
+	hits->capacity = 0;
+	hits->candidates = 0;
+}
+
+void hit_buffer_free (hit_buffer *hits)
+{
+	free (hits->data);
+	hit_buffer_init (hits);
+}
+
+/* Appends the coincidence (angle index, m1, m2, n1, n2) to the buffer.
+ * Returns 0 on success and -1 if the buffer could not be enlarged.
+ */
+static int hit_buffer_append (hit_buffer *hits, int angleIndex, int m1, int m2, int n1, int n2)
+{
+	int *row;
+
+	if (hits->size == hits->capacity) {
+		size_t capacity = hits->capacity ? 2*hits->capacity : 256;
+		int *data = realloc (hits->data, capacity*HIT_FIELDS*sizeof(int));
+
+		if (data == NULL)
+			return -1;
+
+		hits->data = data;
+		hits->capacity = capacity;
+	}
+
+	row = hits->data + HIT_FIELDS*hits->size;
+	row[0] = angleIndex;
+	row[1] = m1;
+	row[2] = m2;
+	row[3] = n1;
+	row[4] = n2;
+	hits->size++;
+
+	return 0;
+}
+
+/* Tests whether Am and MBn are coincident, i.e. |Am - MBn| < tolerance and
+ * the angle between the two vectors is smaller than angle_tolerance
+ */
+static int is_coincidence (double xAm, double yAm, double xMBn, double yMBn, double tolerance, double angle_tolerance)
+{
+	double angle_Am_MBn, cosAngle;
+	double norm, normA, normB;
+
+	normA = sqrtf (pow(xAm, 2) + pow(yAm, 2));
+	normB = sqrtf (pow(xMBn, 2) + pow(yMBn, 2));
+
+	if (normA >= normB)
+		norm = normB;
+	else
+		norm = normA;
+
+	// Angle between the two vectors
+	cosAngle = (xAm*xMBn + yAm*yMBn)/(normA*normB);
+
+	// To prevent rounding errors, which lead to cos > 1
+	if (cosAngle > 1.0)
+		cosAngle = 1.0;
+
+	angle_Am_MBn = 180*acos(cosAngle)/PI;
+
+	return sqrtf (pow(xAm - xMBn, 2) + pow(yAm - yMBn, 2))/norm < tolerance && fabs(angle_Am_MBn) < angle_tolerance;
+}
+
+/* Sets the band of cosines around cos(angle_tolerance). The band is much wider than the rounding errors of cos
+ * and acos, so that every cosine outside of it gives the same result as the angle computed by is_coincidence.
+ * For angle tolerances outside (0, 180) the band covers every cosine, which are all tested with acos.
+ */
+static void angle_threshold_init (angle_threshold *threshold, double angle_tolerance)
+{
+	double cosAngle;
+
+	if (angle_tolerance > 0 && angle_tolerance < 180) {
+		cosAngle = cos (angle_tolerance*PI/180);
+		threshold->cos_low = cosAngle - 1e-12;
+		threshold->cos_high = cosAngle + 1e-12;
+	}
+	else {
+		threshold->cos_low = -INFINITY;
+		threshold->cos_high = INFINITY;
+	}
+}
+
+/* Same test as is_coincidence, comparing the cosine between Am and MBn with the band of the threshold
+ * instead of computing the angle, which is only done for the cosines inside the band
+ */
+static int is_coincidence_threshold (double xAm, double yAm, double xMBn, double yMBn, double tolerance, double angle_tolerance, const angle_threshold *threshold)
+{
+	double cosAngle;
+	double norm, normA, normB;
+
+	normA = sqrtf (xAm*xAm + yAm*yAm);
+	normB = sqrtf (xMBn*xMBn + yMBn*yMBn);
+
+	if (normA >= normB)
+		norm = normB;
+	else
+		norm = normA;
+
+	if (!(sqrtf ((xAm - xMBn)*(xAm - xMBn) + (yAm - yMBn)*(yAm - yMBn))/norm < tolerance))
+		return 0;
+
+	cosAngle = (xAm*xMBn + yAm*yMBn)/(normA*normB);
+
+	if (cosAngle >= threshold->cos_high)
+		return 1;
+	if (cosAngle < threshold->cos_low)
+		return 0;
+
+	return is_coincidence (xAm, yAm, xMBn, yMBn, tolerance, angle_tolerance);
+}
+
+/* Returns the largest integer k <= Nmax such that |k| * rowNorm <= max_norm */
+static int index_bound (int Nmax, double max_norm, double rowNorm)
+{
+	double bound = floor (max_norm*rowNorm);
+
+	return bound < Nmax ? (int) bound : Nmax;
+}
+
+/* Sets the ranges of indices searched for the lattices A and B. Without a maximum norm, the ranges are
+ * |m1|, |m2|, |n1| <= Nmax and -Nmax <= n2 < Nmax. Otherwise, vectors with |Am| > max_norm are skipped, and
+ * so are vectors with |Bn| > max_norm/(1 - tolerance), which cannot be coincident with any of the remaining Am.
+ * The ranges of the indices are reduced accordingly using the norm of the rows of A^-1 and B^-1.
+ */
+void search_range_init (search_range *range, const double A[4], const double B[4], int Nmax, double tolerance, double max_norm)
+{
+	double detA = A[0]*A[3] - A[1]*A[2];
+	double detB = B[0]*B[3] - B[1]*B[2];
+	double max_norm_B = max_norm/(1 - tolerance);
+
+	range->m1_max = range->m2_max = range->n1_max = Nmax;
+	range->n2_min = -Nmax;
+	range->n2_max = Nmax - 1;
+	range->max_norm = max_norm;
+
+	if (max_norm <= 0 || detA == 0 || detB == 0)
+		return;
+
+	range->m1_max = index_bound (Nmax, max_norm, sqrt (pow(A[3], 2) + pow(A[1], 2))/fabs(detA));
+	range->m2_max = index_bound (Nmax, max_norm, sqrt (pow(A[2], 2) + pow(A[0], 2))/fabs(detA));
+
+	if (tolerance >= 1)
+		return;
+
+	range->n1_max = index_bound (Nmax, max_norm_B, sqrt (pow(B[3], 2) + pow(B[1], 2))/fabs(detB));
+	range->n2_min = -index_bound (Nmax, max_norm_B, sqrt (pow(B[2], 2) + pow(B[0], 2))/fabs(detB));
+	if (range->n2_max > -range->n2_min)
+		range->n2_max = -range->n2_min;
+}
+
+/* Tests whether the vector Am is longer than the maximum norm of the range */
+static int range_excludes (const search_range *range, double xAm, double yAm)
+{
+	return range->max_norm > 0 && pow(xAm, 2) + pow(yAm, 2) > pow(range->max_norm, 2);
+}
+
+/* Brute force search over all (m1, m2, n1, n2) for a single angle */
+static int loop_brute_force (const double A[4], const double B[4], double angleRad, int angleIndex, const search_range *range, double tolerance, double angle_tolerance, hit_buffer *hits)
+{
+	double xA_1 = A[0], xA_2 = A[1], yA_1 = A[2], yA_2 = A[3];
+	double xB_1 = B[0], xB_2 = B[1], yB_1 = B[2], yB_2 = B[3];
+
+	int m1, m2, n1, n2;
+	double xAm, yAm, xMBn, yMBn;
+
+	for (m1 = -range->m1_max; m1 <= range->m1_max; m1++) {
+		for (m2 = -range->m2_max; m2 <= range->m2_max; m2++) {
+			if (range_excludes (range, m1*xA_1 + m2*xA_2, m1*yA_1 + m2*yA_2))
+				continue;
+
+			hits->candidates += (long long) (2*range->n1_max + 1)*(range->n2_max - range->n2_min + 1);
+
+			for (n1 = -range->n1_max; n1 <= range->n1_max; n1++) {
+				for (n2 = range->n2_min; n2 <= range->n2_max; n2++) {
+					// |Am - MBn| < tolerance
+					xAm = m1*xA_1 + m2*xA_2;
+					xMBn = n1*(xB_1*cos(angleRad) + yB_1*sin(angleRad)) + n2*(xB_2*cos(angleRad) + yB_2*sin(angleRad));
+
+					yAm = m1*yA_1 + m2*yA_2;
+					yMBn = n1*(-xB_1*sin(angleRad) + yB_1*cos(angleRad)) + n2*(-xB_2*sin(angleRad) + yB_2*cos(angleRad));
+
+					if (is_coincidence (xAm, yAm, xMBn, yMBn, tolerance, angle_tolerance))
+						if (hit_buffer_append (hits, angleIndex, m1, m2, n1, n2))
+							return -1;
+				}
+			}
+		}
+	}
+
+	return 0;
+}
+
+/* Allocates the plane of rotated vectors for the ranges of n. Returns 0 on success and -1 on failure */
+static int plane_buffer_init (plane_buffer *plane, const search_range *range)
+{
+	int width = range->n2_max - range->n2_min + 1;
+
+	plane->size = width > 0 ? (size_t) (2*range->n1_max + 1)*width : 0;
+	plane->x = malloc ((plane->size + 1)*sizeof(double));
+	plane->y = malloc ((plane->size + 1)*sizeof(double));
+	plane->norm2 = malloc ((plane->size + 1)*sizeof(double));
+	plane->excess = malloc ((plane->size + 1)*sizeof(double));
+
+	return plane->x && plane->y && plane->norm2 && plane->excess ? 0 : -1;
+}
+
+static void plane_buffer_free (plane_buffer *plane)
+{
+	free (plane->x);
+	free (plane->y);
+	free (plane->norm2);
+	free (plane->excess);
+	plane->x = plane->y = plane->norm2 = plane->excess = NULL;
+	plane->size = 0;
+}
+
+/* Brute force search over all (m1, m2, n1, n2) for a single angle, finding the same coincidences as loop_brute_force.
+ * The rotated vectors MBn of the (n1, n2) plane are computed once per angle, with the same expressions.
+ * For each Am, the whole plane is first screened by a branch-free loop over contiguous arrays, which the compiler
+ * vectorizes, computing the excess |Am - MBn|^2 - ((1 + 1e-6)*tolerance)^2*min(|Am|^2, |MBn|^2). The margin covers
+ * the single precision of the test, so that only the vectors with a negative excess can be coincident, and only those are tested,
+ * in the order of the brute force search, by is_coincidence_threshold.
+ */
+static int loop_vector (const double A[4], const double B[4], double angleRad, int angleIndex, const search_range *range, double tolerance, double angle_tolerance, const angle_threshold *threshold, plane_buffer *plane, hit_buffer *hits)
+{
+	double xA_1 = A[0], xA_2 = A[1], yA_1 = A[2], yA_2 = A[3];
+	double xB_1 = B[0], xB_2 = B[1], yB_1 = B[2], yB_2 = B[3];
+
+	/* Rotated lattice vectors of B (columns of MB), with the same values as in loop_brute_force */
+	double xMB_1 = xB_1*cos(angleRad) + yB_1*sin(angleRad);
+	double yMB_1 = -xB_1*sin(angleRad) + yB_1*cos(angleRad);
+	double xMB_2 = xB_2*cos(angleRad) + yB_2*sin(angleRad);
+	double yMB_2 = -xB_2*sin(angleRad) + yB_2*cos(angleRad);
+
+	double bound = pow(tolerance*(1 + 1e-6), 2);
+	int width = range->n2_max - range->n2_min + 1;
+	int m1, m2, n1, n2;
+	double xAm, yAm, normA2, dx, dy, norm2;
+	double *x = plane->x, *y = plane->y, *normB2 = plane->norm2, *excess = plane->excess;
+	size_t k, size = plane->size;
+
+	k = 0;
+	for (n1 = -range->n1_max; n1 <= range->n1_max; n1++) {
+		for (n2 = range->n2_min; n2 <= range->n2_max; n2++, k++) {
+			x[k] = n1*xMB_1 + n2*xMB_2;
+			y[k] = n1*yMB_1 + n2*yMB_2;
+			normB2[k] = x[k]*x[k] + y[k]*y[k];
+		}
+	}
+
+	for (m1 = -range->m1_max; m1 <= range->m1_max; m1++) {
+		for (m2 = -range->m2_max; m2 <= range->m2_max; m2++) {
+			xAm = m1*xA_1 + m2*xA_2;
+			yAm = m1*yA_1 + m2*yA_2;
+
+			if (range_excludes (range, xAm, yAm))
+				continue;
+
+			hits->candidates += (long long) size;
+			normA2 = xAm*xAm + yAm*yAm;
+
+			for (k = 0; k < size; k++) {
+				dx = xAm - x[k];
+				dy = yAm - y[k];
+				norm2 = normB2[k] < normA2 ? normB2[k] : normA2;
+				excess[k] = dx*dx + dy*dy - bound*norm2;
+			}
+
+			for (k = 0; k < size; k++) {
+				if (!(excess[k] < 0) || !is_coincidence_threshold (xAm, yAm, x[k], y[k], tolerance, angle_tolerance, threshold))
+					continue;
+
+				n1 = (int) (k/width) - range->n1_max;
+				n2 = (int) (k%width) + range->n2_min;
+				if (hit_buffer_append (hits, angleIndex, m1, m2, n1, n2))
+					return -1;
+			}
+		}
+	}
+
+	return 0;
+}
+
+/* Search for a single angle solving MBn = Am for each (m1, m2).
+ * Only the integer (n1, n2) inside the bounding box of the region |MBn - Am| < tolerance*|Am|
+ * are tested, which contains every solution accepted by the brute force search.
+ * The test itself is the same, so both kernels find identical coincidences.
+ */
+static int loop_solve (const double A[4], const double B[4], double angleRad, int angleIndex, const search_range *range, double tolerance, double angle_tolerance, hit_buffer *hits)
+{
+	double xA_1 = A[0], xA_2 = A[1], yA_1 = A[2], yA_2 = A[3];
+	double xB_1 = B[0], xB_2 = B[1], yB_1 = B[2], yB_2 = B[3];
+
+	int m1, m2, n1, n2;
+	int n1_min, n1_max, n2_min, n2_max;
+	double xAm, yAm, xMBn, yMBn;
+	double n1_real, n2_real, radius;
+
+	/* Rotated lattice vectors of B (columns of MB) */
+	double xMB_1 = xB_1*cos(angleRad) + yB_1*sin(angleRad);
+	double yMB_1 = -xB_1*sin(angleRad) + yB_1*cos(angleRad);
+	double xMB_2 = xB_2*cos(angleRad) + yB_2*sin(angleRad);
+	double yMB_2 = -xB_2*sin(angleRad) + yB_2*cos(angleRad);
+
+	/* (MB)^-1 and the norm of its rows, which bound how far n can be from the real solution */
+	double det = xMB_1*yMB_2 - xMB_2*yMB_1;
+	double rowNorm_1 = sqrt (pow(yMB_2, 2) + pow(xMB_2, 2))/fabs(det);
+	double rowNorm_2 = sqrt (pow(yMB_1, 2) + pow(xMB_1, 2))/fabs(det);
+
+	if (det == 0)
+		return 0;
+
+	for (m1 = -range->m1_max; m1 <= range->m1_max; m1++) {
+		for (m2 = -range->m2_max; m2 <= range->m2_max; m2++) {
+			xAm = m1*xA_1 + m2*xA_2;
+			yAm = m1*yA_1 + m2*yA_2;
+
+			if (range_excludes (range, xAm, yAm))
+				continue;
+
+			// Real solution of MBn = Am
+			n1_real = (yMB_2*xAm - xMB_2*yAm)/det;
+			n2_real = (-yMB_1*xAm + xMB_1*yAm)/det;
+
+			// Small margin to account for the single precision used by the test
+			radius = 1.0001*tolerance*sqrt (pow(xAm, 2) + pow(yAm, 2));
+
+			n1_min = (int) ceil (n1_real - radius*rowNorm_1);
+			n1_max = (int) floor (n1_real + radius*rowNorm_1);
+			n2_min = (int) ceil (n2_real - radius*rowNorm_2);
+			n2_max = (int) floor (n2_real + radius*rowNorm_2);
+
+			// Same ranges as the brute force search
+			if (n1_min < -range->n1_max)
+				n1_min = -range->n1_max;
+			if (n1_max > range->n1_max)
+				n1_max = range->n1_max;
+			if (n2_min < range->n2_min)
+				n2_min = range->n2_min;
+			if (n2_max > range->n2_max)
+				n2_max = range->n2_max;
+
+			if (n1_max >= n1_min && n2_max >= n2_min)
+				hits->candidates += (long long) (n1_max - n1_min + 1)*(n2_max - n2_min + 1);
+
+			for (n1 = n1_min; n1 <= n1_max; n1++) {
+				for (n2 = n2_min; n2 <= n2_max; n2++) {
+					xMBn = n1*xMB_1 + n2*xMB_2;
+					yMBn = n1*yMB_1 + n2*yMB_2;
+
+					if (is_coincidence (xAm, yAm, xMBn, yMBn, tolerance, angle_tolerance))
+						if (hit_buffer_append (hits, angleIndex, m1, m2, n1, n2))
+							return -1;
+				}
+			}
+		}
+	}
+
+	return 0;
+}
+
+/* Searches the angles [first, last) of the task */
+static void run_sweep (sweep_task *task)
+{
+	int angleIndex;
+	double angleRad;
+
+	task->status = 0;
+	if (task->kernel == KERNEL_VECTOR) {
+		angle_threshold_init (&task->threshold, task->angle_tolerance);
+		task->status = plane_buffer_init (&task->plane, task->range);
+	}
+
+	for (angleIndex = task->first; angleIndex < task->last && !task->status; angleIndex++) {
+		angleRad = task->angles[angleIndex]*PI/180;
+
+		if (task->kernel == KERNEL_SOLVE)
+			task->status = loop_solve (task->A, task->B, angleRad, angleIndex, task->range, task->tolerance, task->angle_tolerance, &task->hits);
+		else if (task->kernel == KERNEL_VECTOR)
+			task->status = loop_vector (task->A, task->B, angleRad, angleIndex, task->range, task->tolerance, task->angle_tolerance, &task->threshold, &task->plane, &task->hits);
+		else
+			task->status = loop_brute_force (task->A, task->B, angleRad, angleIndex, task->range, task->tolerance, task->angle_tolerance, &task->hits);
+	}
+
+	if (task->kernel == KERNEL_VECTOR)
+		plane_buffer_free (&task->plane);
+}
+
+#ifdef _WIN32
+static unsigned __stdcall sweep_thread (void *task)
+{
+	run_sweep ((sweep_task*) task);
+	return 0;
+}
+#else
+static void* sweep_thread (void *task)
+{
+	run_sweep ((sweep_task*) task);
+	return NULL;
+}
+#endif
+
+/* Number of processors available to run the worker threads */
+int loop_cores (void)
+{
+#ifdef _WIN32
+	SYSTEM_INFO info;
+	GetSystemInfo (&info);
+	return info.dwNumberOfProcessors > 0 ? (int) info.dwNumberOfProcessors : 1;
+#else
+	long cores = sysconf (_SC_NPROCESSORS_ONLN);
+	return cores > 0 ? (int) cores : 1;
+#endif
+}
+
+/* Runs the tasks, each one in its own thread except for the first, which runs in the calling thread.
+ * If a thread cannot be created, its task is run serially.
+ */
+static void run_tasks (sweep_task *tasks, int nTasks)
+{
+	int i;
+#ifdef _WIN32
+	HANDLE *threads = calloc (nTasks, sizeof(HANDLE));
+#else
+	pthread_t *threads = calloc (nTasks, sizeof(pthread_t));
+	int *started = calloc (nTasks, sizeof(int));
+#endif
+
+#ifdef _WIN32
+	for (i = 1; i < nTasks; i++)
+		threads[i] = threads ? (HANDLE) _beginthreadex (NULL, 0, sweep_thread, &tasks[i], 0, NULL) : NULL;
+
+	run_sweep (&tasks[0]);
+
+	for (i = 1; i < nTasks; i++) {
+		if (threads && threads[i]) {
+			WaitForSingleObject (threads[i], INFINITE);
+			CloseHandle (threads[i]);
+		}
+		else
+			run_sweep (&tasks[i]);
+	}
+#else
+	for (i = 1; i < nTasks; i++)
+		if (threads && started)
+			started[i] = pthread_create (&threads[i], NULL, sweep_thread, &tasks[i]) == 0;
+
+	run_sweep (&tasks[0]);
+
+	for (i = 1; i < nTasks; i++) {
+		if (threads && started && started[i])
+			pthread_join (threads[i], NULL);
+		else
+			run_sweep (&tasks[i]);
+	}
+
+	free (started);
+#endif
+	free (threads);
+}
+
+/* Searches the coincidences between the lattices A and B, given as {x1, x2, y1, y2}
+ * (the columns are the lattice vectors), for each of the nAngles angles in degrees.
+ * Every solution is stored in `hits` together with the index of its angle in `angles`.
+ * Vectors with |Am| > max_norm are not searched (no limit if max_norm <= 0), see search_range_init.
+ * `kernel` selects the search used for each angle (KERNEL_BRUTE_FORCE or KERNEL_SOLVE).
+ * The angles are split in contiguous ranges among `nThreads` worker threads (all processors if
+ * nThreads <= 0) and the results are merged in angle order, so the output does not depend on nThreads.
+ * Returns 0 on success and -1 if memory could not be allocated.
+ */
+int loop_angles (const double A[4], const double B[4], const double *angles, int nAngles, int Nmax, double tolerance, double angle_tolerance, double max_norm, int kernel, int nThreads, hit_buffer *hits)
+{
+	int i, status;
+	size_t total;
+	sweep_task *tasks;
+	search_range range;
+
+	if (nAngles <= 0)
+		return 0;
+
+	search_range_init (&range, A, B, Nmax, tolerance, max_norm);
+
+	if (nThreads <= 0)
+		nThreads = loop_cores ();
+	if (nThreads > nAngles)
+		nThreads = nAngles;
+
+	tasks = calloc (nThreads, sizeof(sweep_task));
+	if (tasks == NULL)
+		return -1;
+
+	for (i = 0; i < nThreads; i++) {
+		tasks[i].A = A;
+		tasks[i].B = B;
+		tasks[i].angles = angles;
+		tasks[i].first = (int) ((long long) nAngles*i/nThreads);
+		tasks[i].last = (int) ((long long) nAngles*(i + 1)/nThreads);
+		tasks[i].range = &range;
+		tasks[i].tolerance = tolerance;
+		tasks[i].angle_tolerance = angle_tolerance;
+		tasks[i].kernel = kernel;
+		hit_buffer_init (&tasks[i].hits);
+	}
+
+	run_tasks (tasks, nThreads);
+
+	/* Merges the results of each range in angle order */
+	status = 0;
+	total = hits->size;
+	for (i = 0; i < nThreads; i++) {
+		status |= tasks[i].status;
+		total += tasks[i].hits.size;
+		hits->candidates += tasks[i].hits.candidates;
+	}
+
+	if (!status && total > hits->capacity) {
+		int *data = realloc (hits->data, total*HIT_FIELDS*sizeof(int));
+
+		if (data == NULL)
+			status = -1;
+		else {
+			hits->data = data;
+			hits->capacity = total;
+		}
+	}
+
+	for (i = 0; i < nThreads; i++) {
+		if (!status && tasks[i].hits.size) {
+			memcpy (hits->data + HIT_FIELDS*hits->size, tasks[i].hits.data, tasks[i].hits.size*HIT_FIELDS*sizeof(int));
+			hits->size += tasks[i].hits.size;
+		}
+		hit_buffer_free (&tasks[i].hits);
+	}
+
+	free (tasks);
+
+	return status ? -1 : 0;
+}
+
+/* Tests the given candidates (angle index, m1, m2, n1, n2) with the same ranges and the same test as
+ * the brute force search, so that the coincidences found among them are exactly the ones the brute force
+ * search finds with these indices. The candidates are tested in the order given, which is kept in `hits`.
+ * Returns 0 on success and -1 if memory could not be allocated.
+ */
+int loop_pairs (const double A[4], const double B[4], const double *angles, int nAngles, const int *candidates, size_t nCandidates, int Nmax, double tolerance, double angle_tolerance, double max_norm, hit_buffer *hits)
+{
+	double xA_1 = A[0], xA_2 = A[1], yA_1 = A[2], yA_2 = A[3];
+	double xB_1 = B[0], xB_2 = B[1], yB_1 = B[2], yB_2 = B[3];
+
+	int angleIndex, m1, m2, n1, n2;
+	double angleRad, xAm, yAm, xMBn, yMBn;
+	const int *row;
+	size_t i;
+	search_range range;
+
+	search_range_init (&range, A, B, Nmax, tolerance, max_norm);
+
+	for (i = 0; i < nCandidates; i++) {
+		row = candidates + HIT_FIELDS*i;
+		angleIndex = row[0];
+		m1 = row[1];
+		m2 = row[2];
+		n1 = row[3];
+		n2 = row[4];
+
+		if (angleIndex < 0 || angleIndex >= nAngles || abs (m1) > range.m1_max || abs (m2) > range.m2_max
+				|| abs (n1) > range.n1_max || n2 < range.n2_min || n2 > range.n2_max)
+			continue;
+
+		xAm = m1*xA_1 + m2*xA_2;
+		yAm = m1*yA_1 + m2*yA_2;
+
+		if (range_excludes (&range, xAm, yAm))
+			continue;
+
+		hits->candidates++;
+
+		// Same expressions as the brute force search, so that the values tested are identical
+		angleRad = angles[angleIndex]*PI/180;
+		xMBn = n1*(xB_1*cos(angleRad) + yB_1*sin(angleRad)) + n2*(xB_2*cos(angleRad) + yB_2*sin(angleRad));
+		yMBn = n1*(-xB_1*sin(angleRad) + yB_1*cos(angleRad)) + n2*(-xB_2*sin(angleRad) + yB_2*cos(angleRad));
+
+		if (is_coincidence (xAm, yAm, xMBn, yMBn, tolerance, angle_tolerance))
+			if (hit_buffer_append (hits, angleIndex, m1, m2, n1, n2))
+				return -1;
+	}
+
+	return 0;
+}
+
+/* Loops through the angles from angle_start to angle_end in steps of angle_step, searching
+ * for coincidences between the lattices A and B with loop_angles.
+ * The index of the angle stored with each solution is counted from angle_start.
+ * Returns 0 on success and -1 if memory could not be allocated.
+ */
+int loop_lattices (const double A[4], const double B[4], double angle_start, double angle_end, double angle_step, int Nmax, double tolerance, double angle_tolerance, double max_norm, int kernel, int nThreads, hit_buffer *hits)
+{
+	int nAngles, status;
+	double angle;
+	double *angles;
+
+	/* The angles are accumulated as in the serial sweep, so that the angle indices are the same */
+	nAngles = 0;
+	for (angle = angle_start; angle < angle_end + angle_step; angle = angle + angle_step)
+		nAngles++;
+
+	if (nAngles == 0)
+		return 0;
+
+	angles = malloc (nAngles*sizeof(double));
+	if (angles == NULL)
+		return -1;
+
+	nAngles = 0;
+	for (angle = angle_start; angle < angle_end + angle_step; angle = angle + angle_step)
+		angles[nAngles++] = angle;
+
+	status = loop_angles (A, B, angles, nAngles, Nmax, tolerance, angle_tolerance, max_norm, kernel, nThreads, hits);
+
+	free (angles);
+
+	return status;
+}
+
+/* Legacy interface: reads the lattices from lattices.tmp and prints
+ * the solutions for each angle to coincidences.tmp
+ */
 void loop (double angle_start, double angle_end, double angle_step, int Nmax, double tolerance, double angle_tolerance)
 {
 	FILE *outputFile, *inputFile;
-	//~ FILE *debugFile;
-	
-	double xA_1, yA_1, xA_2, yA_2;
-	double xB_1, yB_1, xB_2, yB_2;
-	
+
+	double A[4], B[4];
+	double angle;
+	int angleIndex;
+	size_t i;
+	hit_buffer hits;
+
 	/* Opens the temporary file to import the lattice parameters of the combination */
 	inputFile = fopen ("lattices.tmp", "r");
-	
+
 	if (inputFile == NULL) {
 		printf ("Couldn't find file lattices.tmp!\n");
 		return;
 	}
-		
-	fscanf (inputFile, "%lf %lf", &xA_1, &xA_2);
-	fscanf (inputFile, "%lf %lf", &yA_1, &yA_2);
-	fscanf (inputFile, "%lf %lf", &xB_1, &xB_2);
-	fscanf (inputFile, "%lf %lf", &yB_1, &yB_2);
-	
+
+	fscanf (inputFile, "%lf %lf", &A[0], &A[1]);
+	fscanf (inputFile, "%lf %lf", &A[2], &A[3]);
+	fscanf (inputFile, "%lf %lf", &B[0], &B[1]);
+	fscanf (inputFile, "%lf %lf", &B[2], &B[3]);
+
 	fclose(inputFile);
-	
-	/* Loops through the angles and vectors in order to seek coincidences
-	 * and prints the output file with the solutions for each angle
-	 */
-	 
+
+	hit_buffer_init (&hits);
+	if (loop_lattices (A, B, angle_start, angle_end, angle_step, Nmax, tolerance, angle_tolerance, 0, KERNEL_BRUTE_FORCE, 1, &hits)) {
+		printf ("Not enough memory to store the coincidences!\n");
+		hit_buffer_free (&hits);
+		return;
+	}
+
+	/* Prints the output file with the solutions for each angle */
 	outputFile = fopen ("coincidences.tmp", "w");
-		
-	//~ debugFile = fopen ("debug.tmp", "w");
-	
-	int m1, m2, n1, n2;
-	double angle, angleRad, angle_Am_MBn, cosAngle;
-	double xAm, yAm, xMBn, yMBn;
-	double norm, normA, normB;
-	
-	for (angle = angle_start; angle < angle_end + angle_step; angle = angle + angle_step) {
-		angleRad = angle*PI/180;
-		
+
+	i = 0;
+	angleIndex = 0;
+	for (angle = angle_start; angle < angle_end + angle_step; angle = angle + angle_step, angleIndex++) {
 		fprintf (outputFile, "%.2f\n", angle);
-		
-		for (m1 = -Nmax; m1 <= Nmax; m1++) {
-			for (m2 = -Nmax; m2 <= Nmax; m2++) {
-				for (n1 = -Nmax; n1 <= Nmax; n1++) {
-					for (n2 = -Nmax; n2 < Nmax; n2++) {
-						// |Am - MBn| < tolerance
-						xAm = m1*xA_1 + m2*xA_2;
-						xMBn = n1*(xB_1*cos(angleRad) + yB_1*sin(angleRad)) + n2*(xB_2*cos(angleRad) + yB_2*sin(angleRad));
-						
-						yAm = m1*yA_1 + m2*yA_2;
-						yMBn = n1*(-xB_1*sin(angleRad) + yB_1*cos(angleRad)) + n2*(-xB_2*sin(angleRad) + yB_2*cos(angleRad));
-						
-						normA = sqrtf (pow(xAm, 2) + pow(yAm, 2));
-						normB = sqrtf (pow(xMBn, 2) + pow(yMBn, 2));
-						
-						if (normA >= normB)
-							norm = normB;
-						else
-							norm = normA;
-						
-						
-						// Angle between the two vectors
-						cosAngle = (xAm*xMBn + yAm*yMBn)/(normA*normB);
-						
-						// To prevent rounding errors, which lead to cos > 1
-						if (cosAngle > 1.0)
-							cosAngle = 1.0;
-							
-						angle_Am_MBn = 180*acos(cosAngle)/PI;
-						
-						//~ For debugging:
-						
-						//~ fprintf (debugFile, "%d %d %d %d\n", m1, m2, n1, n2);
-						//~ fprintf (debugFile, "%lf %lf %lf %lf\n", xAm, xMBn, yAm, yMBn);
-						//~ fprintf (debugFile, "normA: %lf\n", normA);
-						//~ fprintf (debugFile, "normB: %lf\n", normB);
-						//~ fprintf (debugFile, "angle: %lf\n", angle_Am_MBn);
-						
-						if (sqrtf (pow(xAm - xMBn, 2) + pow(yAm - yMBn, 2))/norm < tolerance && fabs(angle_Am_MBn) < angle_tolerance)
-							fprintf (outputFile, "%d %d %d %d\n", m1, m2, n1, n2);
-					}
-				}
-			}
-		}
-		
+
+		for (; i < hits.size && hits.data[HIT_FIELDS*i] == angleIndex; i++)
+			fprintf (outputFile, "%d %d %d %d\n", hits.data[HIT_FIELDS*i + 1], hits.data[HIT_FIELDS*i + 2], hits.data[HIT_FIELDS*i + 3], hits.data[HIT_FIELDS*i + 4]);
+
 		fprintf (outputFile, "\n");
 	}
-	
-	fclose (outputFile);	
-	
-	//~ fclose (debugFile);	
+
+	fclose (outputFile);
+	hit_buffer_free (&hits);
 }
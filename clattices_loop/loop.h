@@ -1,9 +1,43 @@
 #ifndef LOOP_H
 #define LOOP_H
 
+#include <stddef.h>
 
 #define PI 3.14159265358979
+
+/* Kernels available to search for coincidences at each angle */
+#define KERNEL_BRUTE_FORCE 0
+#define KERNEL_SOLVE 1
+#define KERNEL_VECTOR 2
+
+/* Number of integers stored for each coincidence: angle index, m1, m2, n1, n2 */
+#define HIT_FIELDS 5
+
+/* Growable buffer of coincidences found by the kernel, with the number of vectors (m, n) tested to find them */
+typedef struct {
+	int *data;
+	size_t size;
+	size_t capacity;
+	long long candidates;
+} hit_buffer;
+
+/* Ranges of the indices searched: |m1| <= m1_max, |m2| <= m2_max, |n1| <= n1_max, n2_min <= n2 <= n2_max,
+ * and maximum norm of the vectors Am (no limit if max_norm <= 0)
+ */
+typedef struct {
+	int m1_max, m2_max;
+	int n1_max, n2_min, n2_max;
+	double max_norm;
+} search_range;
+
+void hit_buffer_init (hit_buffer *hits);
+void hit_buffer_free (hit_buffer *hits);
+void search_range_init (search_range *range, const double A[4], const double B[4], int Nmax, double tolerance, double max_norm);
+
+int loop_angles (const double A[4], const double B[4], const double *angles, int nAngles, int Nmax, double tolerance, double angle_tolerance, double max_norm, int kernel, int nThreads, hit_buffer *hits);
+int loop_lattices (const double A[4], const double B[4], double angle_start, double angle_end, double angle_step, int Nmax, double tolerance, double angle_tolerance, double max_norm, int kernel, int nThreads, hit_buffer *hits);
+int loop_pairs (const double A[4], const double B[4], const double *angles, int nAngles, const int *candidates, size_t nCandidates, int Nmax, double tolerance, double angle_tolerance, double max_norm, hit_buffer *hits);
+int loop_cores (void);
 void loop (double angle_start, double angle_end, double angle_step, int Nmax, double tolerance, double angle_tolerance);
 
 #endif
-
@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 
+import os
 from setuptools import setup, Extension
 
 clattices_loop = Extension("clattices_loop", 
 							sources = ["clattices_loop.c", "loop.c"],
 							depends = ["loop.h"],
+							libraries = [] if os.name == 'nt' else ["pthread"],
 							)
 
 setup (
@@ -1,10 +1,12 @@
 # -*- coding: utf-8 -*-
 
+import os
 from setuptools import setup, Extension
 
 clattices_loop = Extension("clattices.clattices_loop", 
 							sources = ["clattices_loop/clattices_loop.c", "clattices_loop/loop.c"],
 							depends = ["clattices_loop/loop.h"],
+							libraries = [] if os.name == 'nt' else ["pthread"],
 							)
 
 setup (